@@ -29,6 +29,7 @@
 
 
 import logging
+import numpy as np
 from . import epdconfig
 from PIL import Image
 import RPi.GPIO as GPIO
@@ -42,6 +43,26 @@ GRAY2  = 0xC0
 GRAY3  = 0x80 #gray
 GRAY4  = 0x00 #Blackest
 
+# Maps 8-bit gray values to the 2-bit levels (in the MSBs) used by getbuffer_4Gray
+_GRAY_LEVEL_LUT = np.arange(256, dtype=np.uint8)
+_GRAY_LEVEL_LUT[GRAY2] = GRAY3
+_GRAY_LEVEL_LUT[GRAY3] = 0x40
+_GRAY_LEVEL_LUT &= 0xC0
+
+
+def _gray_plane_lut(bit):
+    """Maps a 4-gray buffer byte (4 pixels, 2 bits each) to 4 bits (one per
+    pixel) holding the given bit (0: LSB, 1: MSB) of each pixel's 2-bit level."""
+    values = np.arange(256, dtype=np.uint8)
+    lut = np.zeros(256, dtype=np.uint8)
+    for pixel in range(4):
+        lut |= ((values >> (2 * (3 - pixel) + bit)) & 0x01) << (3 - pixel)
+    return lut
+
+# Plane bits per 4-gray buffer byte for data transmission 1 (0x10) and 2 (0x13)
+_GRAY_PLANE_LUT_OLD = _gray_plane_lut(1)
+_GRAY_PLANE_LUT_NEW = _gray_plane_lut(0)
+
 class EPD:
     def __init__(self):
         self.reset_pin = epdconfig.RST_PIN
@@ -173,7 +194,14 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
-        
+
+    def send_data2(self, data):
+        # Sends a whole buffer within a single chip select
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def ReadBusy(self):
         self.send_command(0x71)
         while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
@@ -310,65 +338,37 @@ class EPD:
         self.send_data(0x97)
 
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
+        # 1 bit per pixel (MSB first, row-major), black pixels are 0
         image_monocolor = image.convert('1')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
         if(imwidth == self.width and imheight == self.height):
             logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
+            pixels = np.asarray(image_monocolor, dtype=bool)
         elif(imwidth == self.height and imheight == self.width):
             logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
-        
+            # Pixel (x, y) is shown at (y, height - x - 1), i.e. rotated by 90 degrees counter-clockwise
+            pixels = np.rot90(np.asarray(image_monocolor, dtype=bool))
+        else:
+            return bytearray([0xFF]) * (int(self.width/8) * self.height)
+        return bytearray(np.packbits(pixels).tobytes())
+
     def getbuffer_4Gray(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
+        # 2 bits per pixel (4 pixels per byte, leftmost pixel in the MSBs)
         image_monocolor = image.convert('L')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
         if(imwidth == self.width and imheight == self.height):
             logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
+            pixels = np.asarray(image_monocolor)
         elif(imwidth == self.height and imheight == self.width):
             logging.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = x
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        
-        return buf
+            # Pixel (x, y) is shown at (y, x)
+            pixels = np.asarray(image_monocolor).T
+        else:
+            return bytearray([0xFF]) * (int(self.width / 4) * self.height)
+        # Remap the gray levels (0xC0 => 0x80, 0x80 => 0x40) and keep the 2 most significant bits
+        levels = _GRAY_LEVEL_LUT[pixels].reshape(-1, 4)
+        packed = levels[:, 0] | (levels[:, 1] >> 2) | (levels[:, 2] >> 4) | (levels[:, 3] >> 6)
+        return bytearray(packed.tobytes())
 
     def display(self, image):
         self.send_command(0x10)
@@ -383,71 +383,17 @@ class EPD:
         self.ReadBusy()
     
     def display_4Gray(self, image):
+        # Each byte of the 4-gray buffer (@see getbuffer_4Gray) holds 4 pixels, which
+        # yield 4 bits of each plane: The "old data" plane (0x10) is set for white
+        # and gray1 (0xC0, 0x80), the "new data" plane (0x13) for white and gray2
+        # (0xC0, 0x40). Two buffer bytes make up one byte of each plane.
+        pixels = np.frombuffer(bytes(image), dtype=np.uint8)[:EPD_WIDTH * EPD_HEIGHT // 4].reshape(-1, 2)
         self.send_command(0x10)
-        for i in range(0, EPD_WIDTH * EPD_HEIGHT // 8):  # EPD_WIDTH * EPD_HEIGHT / 4
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01#white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00  #black
-                    elif(temp2 == 0x80): 
-                        temp3 |= 0x01  #gray1
-                    else: #0x40
-                        temp3 |= 0x00 #gray2
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):  #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00): #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01 #gray1
-                    else :   #0x40
-                            temp3 |= 0x00	#gray2	
-                    if(j!=1 or k!=1):				
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-            
-        self.send_command(0x13)	    
-               
-        for i in range(0, EPD_WIDTH * EPD_HEIGHT // 8):  # 5808*4 46464
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01#white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00  #black
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00  #gray1
-                    else: #0x40
-                        temp3 |= 0x01 #gray2
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):  #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00): #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00 #gray1
-                    else:    #0x40
-                            temp3 |= 0x01	#gray2
-                    if(j!=1 or k!=1):					
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-        
+        self.send_data2((_GRAY_PLANE_LUT_OLD[pixels[:, 0]] << 4) | _GRAY_PLANE_LUT_OLD[pixels[:, 1]])
+
+        self.send_command(0x13)
+        self.send_data2((_GRAY_PLANE_LUT_NEW[pixels[:, 0]] << 4) | _GRAY_PLANE_LUT_NEW[pixels[:, 1]])
+
         self.Gray_SetLut()
         self.send_command(0x12)
         epdconfig.delay_ms(200)
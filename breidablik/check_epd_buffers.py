@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# coding=utf-8
+"""Verifies that the numpy-based frame buffer packing and 4-gray plane
+generation of the EPD driver are bit-identical to Waveshare's original
+(per-pixel) implementation and benchmarks both. Runs without the display,
+i.e. the hardware modules (RPi.GPIO, epdconfig) are replaced by dummies
+which record the transmitted bytes."""
+
+import logging
+import sys
+import timeit
+import types
+
+import numpy as np
+from PIL import Image
+
+
+def install_dummy_hardware():
+    """Registers dummy RPi.GPIO and epdconfig modules (epdconfig talks to the
+    SPI/GPIO hardware upon import)."""
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = types.ModuleType('RPi.GPIO')
+    sys.modules['RPi'] = rpi
+    sys.modules['RPi.GPIO'] = rpi.GPIO
+
+    epdconfig = types.ModuleType('balu.waveshare.epdconfig')
+    epdconfig.RST_PIN, epdconfig.DC_PIN, epdconfig.CS_PIN, epdconfig.BUSY_PIN = 17, 25, 8, 24
+    # Transmitted bytes as (data/command pin level, byte)
+    epdconfig.sent = list()
+    epdconfig.pin_levels = dict()
+
+    def _digital_write(pin, value):
+        epdconfig.pin_levels[pin] = value
+
+    def _spi_writebyte(data):
+        dc = epdconfig.pin_levels.get(epdconfig.DC_PIN)
+        epdconfig.sent.extend([(dc, int(b)) for b in data])
+
+    epdconfig.digital_write = _digital_write
+    epdconfig.digital_read = lambda pin: 1
+    epdconfig.delay_ms = lambda ms: None
+    epdconfig.spi_writebyte = _spi_writebyte
+    epdconfig.spi_writebyte2 = _spi_writebyte
+    epdconfig.module_init = lambda: 0
+    epdconfig.module_exit = lambda: None
+    sys.modules['balu.waveshare.epdconfig'] = epdconfig
+    return epdconfig
+
+
+def previous_getbuffer(epd, image):
+    """Waveshare's implementation (V4.0)."""
+    buf = [0xFF] * (int(epd.width/8) * epd.height)
+    image_monocolor = image.convert('1')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    if(imwidth == epd.width and imheight == epd.height):
+        for y in range(imheight):
+            for x in range(imwidth):
+                if pixels[x, y] == 0:
+                    buf[int((x + y * epd.width) / 8)] &= ~(0x80 >> (x % 8))
+    elif(imwidth == epd.height and imheight == epd.width):
+        for y in range(imheight):
+            for x in range(imwidth):
+                newx = y
+                newy = epd.height - x - 1
+                if pixels[x, y] == 0:
+                    buf[int((newx + newy*epd.width) / 8)] &= ~(0x80 >> (y % 8))
+    return buf
+
+
+def previous_getbuffer_4Gray(epd, image):
+    """Waveshare's implementation (V4.0)."""
+    buf = [0xFF] * (int(epd.width / 4) * epd.height)
+    image_monocolor = image.convert('L')
+    imwidth, imheight = image_monocolor.size
+    pixels = image_monocolor.load()
+    i=0
+    if(imwidth == epd.width and imheight == epd.height):
+        for y in range(imheight):
+            for x in range(imwidth):
+                if(pixels[x, y] == 0xC0):
+                    pixels[x, y] = 0x80
+                elif (pixels[x, y] == 0x80):
+                    pixels[x, y] = 0x40
+                i= i+1
+                if(i%4 == 0):
+                    buf[int((x + (y * epd.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
+    elif(imwidth == epd.height and imheight == epd.width):
+        for x in range(imwidth):
+            for y in range(imheight):
+                newx = y
+                newy = x
+                if(pixels[x, y] == 0xC0):
+                    pixels[x, y] = 0x80
+                elif (pixels[x, y] == 0x80):
+                    pixels[x, y] = 0x40
+                i= i+1
+                if(i%4 == 0):
+                    buf[int((newx + (newy * epd.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
+    return buf
+
+
+def previous_display_4Gray(epd, image):
+    """Waveshare's implementation (V4.0)."""
+    from balu.waveshare.epd4in2 import EPD_WIDTH, EPD_HEIGHT
+    epdconfig = sys.modules['balu.waveshare.epdconfig']
+    epd.send_command(0x10)
+    for i in range(0, EPD_WIDTH * EPD_HEIGHT // 8):
+        temp3=0
+        for j in range(0, 2):
+            temp1 = image[i*2+j]
+            for k in range(0, 2):
+                temp2 = temp1&0xC0
+                if(temp2 == 0xC0):
+                    temp3 |= 0x01#white
+                elif(temp2 == 0x00):
+                    temp3 |= 0x00  #black
+                elif(temp2 == 0x80):
+                    temp3 |= 0x01  #gray1
+                else: #0x40
+                    temp3 |= 0x00 #gray2
+                temp3 <<= 1
+
+                temp1 <<= 2
+                temp2 = temp1&0xC0
+                if(temp2 == 0xC0):  #white
+                    temp3 |= 0x01
+                elif(temp2 == 0x00): #black
+                    temp3 |= 0x00
+                elif(temp2 == 0x80):
+                    temp3 |= 0x01 #gray1
+                else :   #0x40
+                        temp3 |= 0x00	#gray2
+                if(j!=1 or k!=1):
+                    temp3 <<= 1
+                temp1 <<= 2
+        epd.send_data(temp3)
+
+    epd.send_command(0x13)
+    for i in range(0, EPD_WIDTH * EPD_HEIGHT // 8):
+        temp3=0
+        for j in range(0, 2):
+            temp1 = image[i*2+j]
+            for k in range(0, 2):
+                temp2 = temp1&0xC0
+                if(temp2 == 0xC0):
+                    temp3 |= 0x01#white
+                elif(temp2 == 0x00):
+                    temp3 |= 0x00  #black
+                elif(temp2 == 0x80):
+                    temp3 |= 0x00  #gray1
+                else: #0x40
+                    temp3 |= 0x01 #gray2
+                temp3 <<= 1
+
+                temp1 <<= 2
+                temp2 = temp1&0xC0
+                if(temp2 == 0xC0):  #white
+                    temp3 |= 0x01
+                elif(temp2 == 0x00): #black
+                    temp3 |= 0x00
+                elif(temp2 == 0x80):
+                    temp3 |= 0x00 #gray1
+                else:    #0x40
+                        temp3 |= 0x01	#gray2
+                if(j!=1 or k!=1):
+                    temp3 <<= 1
+                temp1 <<= 2
+        epd.send_data(temp3)
+
+    epd.Gray_SetLut()
+    epd.send_command(0x12)
+    epdconfig.delay_ms(200)
+    epd.ReadBusy()
+
+
+def transmitted(epdconfig, fx, *args):
+    """Returns the bytes sent to the display by fx(*args)."""
+    epdconfig.sent = list()
+    fx(*args)
+    return epdconfig.sent
+
+
+def test_images(width, height, rng):
+    """Random noise, the 4 exact gray levels (and their neighbors) and a gradient."""
+    levels = np.array([0x00, 0x3F, 0x40, 0x7F, 0x80, 0x81, 0xBF, 0xC0, 0xC1, 0xFF], dtype=np.uint8)
+    gradient = np.tile(np.linspace(0, 255, width).astype(np.uint8), (height, 1))
+    return [
+        Image.fromarray(rng.integers(0, 256, (height, width), dtype=np.uint8), 'L'),
+        Image.fromarray(levels[rng.integers(0, levels.shape[0], (height, width))], 'L'),
+        Image.fromarray(np.stack([gradient, gradient[:, ::-1], gradient], axis=2), 'RGB'),
+        Image.new('1', (width, height), 1),
+        Image.new('L', (width, height), 0xC0)
+    ]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    epdconfig = install_dummy_hardware()
+    from balu.waveshare import epd4in2
+
+    epd = epd4in2.EPD()
+    rng = np.random.default_rng(42)
+    for width, height in [(epd.width, epd.height), (epd.height, epd.width), (epd.width, epd.width)]:
+        for img in test_images(width, height, rng):
+            assert list(epd.getbuffer(img)) == previous_getbuffer(epd, img)
+            buf = epd.getbuffer_4Gray(img)
+            assert list(buf) == previous_getbuffer_4Gray(epd, img)
+            # Both, the new (bytearray) and previous (list) buffer types are supported
+            expected = transmitted(epdconfig, previous_display_4Gray, epd, list(buf))
+            assert transmitted(epdconfig, epd.display_4Gray, buf) == expected
+            assert transmitted(epdconfig, epd.display_4Gray, list(buf)) == expected
+    print('Frame buffers and transmitted 4-gray planes are bit-identical to the original implementation.')
+
+    repetitions = 3
+    print('{:>28s} | {:>13s} | {:>10s} | {:>8s}'.format('', 'previous [ms]', 'numpy [ms]', 'speedup'))
+    for orientation, (width, height) in [('landscape', (epd.width, epd.height)), ('portrait', (epd.height, epd.width))]:
+        img = test_images(width, height, rng)[0]
+        for label, fx_prev, fx_vec in [
+                ('getbuffer', previous_getbuffer, epd.getbuffer),
+                ('getbuffer_4Gray', previous_getbuffer_4Gray, epd.getbuffer_4Gray)]:
+            t_prev = timeit.timeit(lambda: fx_prev(epd, img), number=repetitions)
+            t_vec = timeit.timeit(lambda: fx_vec(img), number=repetitions)
+            print('{:>28s} | {:13.2f} | {:10.2f} | {:7.1f}x'.format(
+                '{:s} ({:s})'.format(label, orientation), 1000 * t_prev / repetitions,
+                1000 * t_vec / repetitions, t_prev / t_vec))
+
+    # Plane generation + transmission (to the recording dummy SPI)
+    buf = epd.getbuffer_4Gray(test_images(epd.width, epd.height, rng)[0])
+    t_prev = timeit.timeit(lambda: transmitted(epdconfig, previous_display_4Gray, epd, buf), number=repetitions)
+    t_vec = timeit.timeit(lambda: transmitted(epdconfig, epd.display_4Gray, buf), number=repetitions)
+    print('{:>28s} | {:13.2f} | {:10.2f} | {:7.1f}x'.format(
+        'display_4Gray', 1000 * t_prev / repetitions, 1000 * t_vec / repetitions, t_prev / t_vec))
@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helu import raspbee
+
+# Runs the DeconzSensorListener against a local fake deCONZ websocket server
+# and checks that the sensor table is seeded via the REST API upon connect,
+# kept up-to-date by 'changed', 'added' and 'deleted' events, and that the
+# listener falls back to REST queries (i.e. sensor_states() returns None)
+# after the socket dropped, until it reconnected and re-seeded. If seeding
+# fails, the listener must close the connection and retry later on.
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class FakeDeconzWebsocket:
+    """Minimal websocket server (handshake + unmasked text frames), pushes
+    events to all connected clients."""
+    def __init__(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(5)
+        self._clients = list()
+        self._lock = threading.Lock()
+        self.num_connections = 0
+        self._thread = threading.Thread(target=self.__accept_loop, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        return 'ws://127.0.0.1:{:d}'.format(self._server.getsockname()[1])
+
+    def __accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            request = b''
+            while b'\r\n\r\n' not in request:
+                chunk = conn.recv(1024)
+                if not chunk:
+                    break
+                request += chunk
+            key = [line.split(':', 1)[1].strip() for line in request.decode('ascii').split('\r\n')
+                   if line.lower().startswith('sec-websocket-key:')][0]
+            accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest())
+            conn.sendall(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n'
+                         b'Connection: Upgrade\r\nSec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+            with self._lock:
+                self._clients.append(conn)
+                self.num_connections += 1
+
+    def push(self, event):
+        payload = json.dumps(event).encode('utf-8')
+        if len(payload) < 126:
+            header = bytes([0x81, len(payload)])
+        else:
+            header = bytes([0x81, 126]) + len(payload).to_bytes(2, 'big')
+        with self._lock:
+            for conn in self._clients:
+                conn.sendall(header + payload)
+
+    def drop_connections(self):
+        with self._lock:
+            for conn in self._clients:
+                conn.shutdown(socket.SHUT_RDWR)
+                conn.close()
+            self._clients = list()
+
+    def close(self):
+        self.drop_connections()
+        self._server.close()
+
+
+def sensor(name, temperature):
+    return {'name': name, 'type': 'ZHATemperature', 'state': {'temperature': temperature, 'lastupdated': 'none'},
+            'config': {'reachable': True, 'battery': 100}}
+
+
+def wait_for(condition, timeout=5):
+    t_end = time.monotonic() + timeout
+    while time.monotonic() < t_end:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+if __name__ == '__main__':
+    server = FakeDeconzWebsocket()
+
+    # REST snapshot (GET /sensors) returned by the seed function
+    rest_sensors = {'1': sensor('Bad', 2150), '2': sensor('Büro', 2210), '7': sensor('Other', 1800)}
+    num_seeds = [0]
+    num_failing_seeds = [0]  # Number of upcoming seed requests which fail (e.g. deCONZ is busy)
+
+    def seed_fn():
+        num_seeds[0] += 1
+        if num_failing_seeds[0] > 0:
+            num_failing_seeds[0] -= 1
+            return None
+        return json.loads(json.dumps(rest_sensors))
+
+    listener = raspbee.DeconzSensorListener(server.url, ['1', '2', '3'], seed_fn, reconnect_time=0.2)
+    assert listener.sensor_states() is None
+    listener.start()
+
+    # Initial seeding: sensor 3 is not known to deCONZ yet, so the table is incomplete
+    assert wait_for(lambda: listener.is_synchronized)
+    assert num_seeds[0] == 1
+    assert listener.sensor_states() is None
+    print('Seeded from REST upon connect, waiting for the missing sensor.')
+
+    server.push({'t': 'event', 'e': 'added', 'r': 'sensors', 'id': '3', 'sensor': sensor('Kinderzimmer', 1990)})
+    assert wait_for(lambda: listener.sensor_states() is not None)
+    states = listener.sensor_states()
+    assert sorted(states.keys()) == ['1', '2', '3']
+    assert states['1']['state']['temperature'] == 2150 and states['3']['state']['temperature'] == 1990
+    print('"added" event completed the table.')
+
+    # Changed events only contain the modified attributes
+    num_events = listener.num_events
+    server.push({'t': 'event', 'e': 'changed', 'r': 'sensors', 'id': '1',
+                 'state': {'temperature': 2075, 'lastupdated': '2020-01-01T10:00:00'}})
+    server.push({'t': 'event', 'e': 'changed', 'r': 'sensors', 'id': '2', 'config': {'battery': 42}})
+    # Ignored: other resources and untracked sensors
+    server.push({'t': 'event', 'e': 'changed', 'r': 'lights', 'id': '1', 'state': {'on': True}})
+    server.push({'t': 'event', 'e': 'changed', 'r': 'sensors', 'id': '7', 'state': {'temperature': 1}})
+    assert wait_for(lambda: listener.num_events == num_events + 2)
+    states = listener.sensor_states()
+    assert states['1']['state'] == {'temperature': 2075, 'lastupdated': '2020-01-01T10:00:00'}
+    assert states['1']['config'] == {'reachable': True, 'battery': 100}
+    assert states['2']['state']['temperature'] == 2210 and states['2']['config']['battery'] == 42
+    # Returned states are copies
+    states['1']['state']['temperature'] = 0
+    assert listener.sensor_states()['1']['state']['temperature'] == 2075
+    print('"changed" events updated the table.')
+
+    server.push({'t': 'event', 'e': 'deleted', 'r': 'sensors', 'id': '2'})
+    assert wait_for(lambda: listener.sensor_states() is None)
+    assert listener.is_synchronized
+    print('"deleted" event invalidated the table, i.e. the wrapper queries the REST API.')
+
+    # Socket drops: no more push updates, so the wrapper must poll the REST API until we re-seeded
+    rest_sensors['2'] = sensor('Büro', 2300)
+    rest_sensors['3'] = sensor('Kinderzimmer', 2000)
+    server.drop_connections()
+    assert wait_for(lambda: not listener.is_synchronized)
+    assert listener.sensor_states() is None
+    print('Connection loss invalidated the table, falling back to REST queries.')
+
+    assert wait_for(lambda: listener.is_synchronized)
+    assert num_seeds[0] == 2 and server.num_connections == 2
+    states = listener.sensor_states()
+    assert states['2']['state']['temperature'] == 2300 and states['3']['state']['temperature'] == 2000
+    print('Reconnected and re-seeded from REST.')
+
+    # Seeding fails upon reconnect: the listener must not keep the unseeded connection
+    num_failing_seeds[0] = 1
+    server.drop_connections()
+    assert wait_for(lambda: server.num_connections == 3 and num_seeds[0] == 3)
+    assert listener.sensor_states() is None
+    assert wait_for(lambda: listener.is_synchronized)
+    assert num_seeds[0] == 4 and server.num_connections == 4
+    assert listener.sensor_states() is not None
+    print('Failed seeding closed the connection, reconnected and re-seeded from REST.')
+
+    listener.stop()
+    server.close()
+    print('All checks passed.')
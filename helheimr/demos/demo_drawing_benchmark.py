@@ -0,0 +1,114 @@
+import datetime
+import os
+import random
+import sys
+import timeit
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from dateutil import tz
+from helu import drawing
+
+# Benchmark of the plot data preparation (extracting the curves from the
+# readings and smoothing them) on a synthetic 30-day log (one reading every
+# 5 minutes). Compares the numpy implementation against the previous
+# pure-Python one (copied below) and verifies that both yield the same curves.
+
+SENSOR_NAMES = ['Bad', 'Büro', 'Kinderzimmer', 'Schlafzimmer', 'Wohnzimmer']
+
+
+def synthetic_log(num_days=30, interval_minutes=5, unreachable_prob=0.01):
+    dt_end = datetime.datetime.now(tz=tz.tzlocal()).replace(second=0, microsecond=0)
+    num_readings = num_days * 24 * 60 // interval_minutes
+    readings = list()
+    for i in range(num_readings):
+        dt = dt_end - datetime.timedelta(minutes=(num_readings - 1 - i) * interval_minutes)
+        if random.random() < unreachable_prob:
+            # Sensors couldn't be queried at all
+            readings.append((dt, None, False))
+            continue
+        sensors = {sn: (None if random.random() < unreachable_prob else round(random.gauss(21, 1.5), 2))
+                   for sn in SENSOR_NAMES}
+        readings.append((dt, sensors, random.random() < 0.3))
+    return readings
+
+
+def previous_smooth(values, win_size):
+    if win_size < 3:
+        return values
+    smoothed = list()
+    neighbors = int((win_size - 1)//2)
+    for idx in range(len(values)):
+        ifrom = max(0, idx - neighbors)
+        ito = min(len(values)-1, idx + neighbors)
+        actual_neighbors = min(idx - ifrom, ito - idx)
+        ifrom = idx - actual_neighbors
+        ito = idx + actual_neighbors
+        to_average = 0.0
+        for win_idx in range(ifrom, ito+1):
+            to_average += values[win_idx]
+        avg = to_average / (2*actual_neighbors + 1)
+        smoothed.append(avg)
+    return smoothed
+
+
+def previous_naive_time_diff(dt_a, dt_b):
+    a = dt_a.replace(tzinfo=tz.tzutc())
+    b = dt_b.replace(tzinfo=tz.tzutc())
+    if a > b:
+        return a - b
+    return b - a
+
+
+def previous_prepare(sensor_names, temperature_log, dt_tick_start, smoothing_window):
+    temperature_curves = {sn: list() for sn in sensor_names}
+    was_heating = list()
+    for reading in temperature_log:
+        dt_local, sensors, heating = reading
+        dt_tick_offset = previous_naive_time_diff(dt_local, dt_tick_start).total_seconds()
+        was_heating.append((dt_tick_offset, heating))
+        if sensors is None:
+            continue
+        for sn in sensors.keys():
+            if sensors[sn] is None:
+                continue
+            temperature_curves[sn].append((dt_tick_offset, sensors[sn]))
+    # As in plot_temperature_curves()
+    curves = dict()
+    for sn in sensor_names:
+        unzipped = tuple(zip(*temperature_curves[sn]))
+        curves[sn] = (unzipped[0], previous_smooth(unzipped[1], smoothing_window))
+    unzipped = tuple(zip(*was_heating))
+    return curves, unzipped
+
+
+def vectorized_prepare(sensor_names, temperature_log, dt_tick_start, smoothing_window):
+    curves, was_heating = getattr(drawing, '__prepare_curves')(sensor_names, temperature_log, dt_tick_start, False)
+    return {sn: (x, drawing.smooth(y, smoothing_window)) for sn, (x, y) in curves.items()}, was_heating
+
+
+if __name__ == '__main__':
+    random.seed(42)
+    readings = synthetic_log()
+    dt_tick_start = readings[0][0] - datetime.timedelta(minutes=7)
+    smoothing_window = 7
+    repetitions = 10
+
+    prev_curves, prev_heating = previous_prepare(SENSOR_NAMES, readings, dt_tick_start, smoothing_window)
+    curves, heating = vectorized_prepare(SENSOR_NAMES, readings, dt_tick_start, smoothing_window)
+    for sn in SENSOR_NAMES:
+        assert np.allclose(prev_curves[sn][0], curves[sn][0])
+        assert np.allclose(prev_curves[sn][1], curves[sn][1])
+    assert np.allclose(prev_heating[0], heating[0])
+    assert np.array_equal(np.array(prev_heating[1]), heating[1])
+
+    t_prev = timeit.timeit(lambda: previous_prepare(SENSOR_NAMES, readings, dt_tick_start, smoothing_window), number=repetitions)
+    t_vec = timeit.timeit(lambda: vectorized_prepare(SENSOR_NAMES, readings, dt_tick_start, smoothing_window), number=repetitions)
+    values = [r[1]['Bad'] for r in readings if r[1] is not None and r[1]['Bad'] is not None]
+    t_smooth_prev = timeit.timeit(lambda: previous_smooth(values, smoothing_window), number=repetitions)
+    t_smooth_vec = timeit.timeit(lambda: drawing.smooth(values, smoothing_window), number=repetitions)
+
+    print('{:d} readings, {:d} sensors, smoothing window {:d}'.format(len(readings), len(SENSOR_NAMES), smoothing_window))
+    print('{:>22s} | {:>13s} | {:>12s} | {:>8s}'.format('', 'previous [ms]', 'numpy [ms]', 'speedup'))
+    for label, tp, tv in [('Curve preparation', t_prev, t_vec), ('smooth() (1 sensor)', t_smooth_prev, t_smooth_vec)]:
+        print('{:>22s} | {:13.2f} | {:12.2f} | {:7.1f}x'.format(
+            label, 1000 * tp / repetitions, 1000 * tv / repetitions, tp / tv))
@@ -0,0 +1,78 @@
+import os
+import random
+import sys
+import timeit
+import datetime
+import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helu import drawing
+from demo_drawing_benchmark import SENSOR_NAMES, synthetic_log
+
+# Benchmark of the curve simplification on multi-week logs (one reading every
+# 5 minutes): Ramer-Douglas-Peucker (rdp package) vs. Largest-Triangle-Three-
+# Buckets (drawing.lttb), targeting a 1024 px wide plot. Also verifies the
+# LTTB selection against the textbook definition and that the heating curve
+# keeps all its state changes.
+
+
+def check_lttb(x, y, num_out, selected_x):
+    """Verifies that each selected point spans the largest triangle within its
+    bucket, as in the textbook LTTB (one bucket at a time). Triangle areas
+    are compared with a tolerance, as exact ties may be resolved differently
+    due to rounding."""
+    num = len(x)
+    every = (num - 2) / (num_out - 2)
+    selected = np.searchsorted(x, selected_x)
+    assert selected.shape[0] == num_out and selected[0] == 0 and selected[-1] == num - 1
+    for i in range(num_out - 2):
+        a = selected[i]
+        next_start = int(np.floor((i + 1) * every)) + 1
+        next_end = min(int(np.floor((i + 2) * every)) + 1, num)
+        avg_x = np.mean(x[next_start:next_end])
+        avg_y = np.mean(y[next_start:next_end])
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        assert start <= selected[i + 1] < end
+        assert areas[selected[i + 1] - start] >= areas.max() * (1 - 1e-9)
+
+
+def prepare(readings, dt_tick_start, simplify, width_px):
+    return getattr(drawing, '__prepare_curves')(
+        SENSOR_NAMES, readings, dt_tick_start, simplify, smoothing_window=7, max_points=width_px)
+
+
+def num_state_changes(states):
+    return int(np.count_nonzero(states[1:] != states[:-1]))
+
+
+if __name__ == '__main__':
+    random.seed(23)
+    width_px = 1024
+    repetitions = 3
+
+    # Timings include the curve preparation (and smoothing) of all sensors
+    print('{:>8s} | {:>8s} | {:>9s} | {:>9s} | {:>10s} | {:>10s} | {:>8s}'.format(
+        'Weeks', 'Readings', 'RDP [ms]', 'LTTB [ms]', 'RDP points', 'LTTB pts.', 'speedup'))
+    for weeks in [1, 2, 4, 8]:
+        readings = synthetic_log(num_days=7*weeks)
+        dt_tick_start = readings[0][0] - datetime.timedelta(minutes=7)
+
+        curves, heating = prepare(readings, dt_tick_start, 'lttb', width_px)
+        raw_curves, raw_heating = prepare(readings, dt_tick_start, False, width_px)
+        for sn in SENSOR_NAMES:
+            assert curves[sn][0].shape[0] <= width_px
+            check_lttb(*raw_curves[sn], width_px, curves[sn][0])
+        assert num_state_changes(heating[1]) == num_state_changes(raw_heating[1])
+        assert np.array_equal(np.interp(raw_heating[0], heating[0], heating[1].astype(np.float64)),
+                              raw_heating[1].astype(np.float64))
+
+        t_lttb = timeit.timeit(lambda: prepare(readings, dt_tick_start, 'lttb', width_px), number=repetitions)
+        t_start = timeit.default_timer()
+        rdp_curves, _ = prepare(readings, dt_tick_start, 'rdp', width_px)
+        t_rdp = timeit.default_timer() - t_start
+        print('{:8d} | {:8d} | {:9.1f} | {:9.1f} | {:10d} | {:10d} | {:7.1f}x'.format(
+            weeks, len(readings), 1000 * t_rdp, 1000 * t_lttb / repetitions,
+            max([c[0].shape[0] for c in rdp_curves.values()]),
+            max([c[0].shape[0] for c in curves.values()]),
+            t_rdp / (t_lttb / repetitions)))
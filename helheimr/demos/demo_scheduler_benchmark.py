@@ -0,0 +1,61 @@
+import os
+import random
+import sys
+import timeit
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from helu import scheduling, time_utils
+
+# Micro-benchmark of the scheduler's bookkeeping (i.e. what the scheduling loop
+# does upon each wake-up): look up the due jobs and the time of the next run.
+# Compares the heap-based queue against scanning/sorting a flat job list.
+
+def dummy_job():
+    pass
+
+
+def create_jobs(num_jobs):
+    jobs = list()
+    for _ in range(num_jobs):
+        job = scheduling.Job(random.randint(1, 3600))
+        job.unit = 'seconds'
+        job.do(dummy_job)
+        jobs.append(job)
+    return jobs
+
+
+def flat_list_wakeup(jobs):
+    # Previous approach: scan & sort all jobs, then min() for the idle time
+    runnable_jobs = sorted(job for job in jobs if job.should_run)
+    next_run = min(jobs).next_run
+    return runnable_jobs, next_run
+
+
+def heap_wakeup(scheduler):
+    runnable_jobs = scheduler._pop_due_jobs(time_utils.dt_now())
+    next_run = scheduler.next_run
+    return runnable_jobs, next_run
+
+
+def heap_cancel_and_add(scheduler, jobs):
+    # Replace a single job (e.g. /rm followed by a newly configured program)
+    job = random.choice(jobs)
+    scheduler.cancel_job(job)
+    scheduler.add_job(job)
+
+
+if __name__ == '__main__':
+    repetitions = 200
+    print('{:>8s} | {:>17s} | {:>17s} | {:>17s}'.format(
+        '#Jobs', 'flat list [ms]', 'heap [ms]', 'heap cancel [ms]'))
+    for num_jobs in [10, 100, 1000, 5000, 10000]:
+        jobs = create_jobs(num_jobs)
+        scheduler = scheduling.Scheduler()
+        for job in jobs:
+            scheduler.add_job(job)
+
+        t_flat = timeit.timeit(lambda: flat_list_wakeup(jobs), number=repetitions)
+        t_heap = timeit.timeit(lambda: heap_wakeup(scheduler), number=repetitions)
+        t_cancel = timeit.timeit(lambda: heap_cancel_and_add(scheduler, jobs), number=repetitions)
+        print('{:8d} | {:17.4f} | {:17.4f} | {:17.4f}'.format(
+            num_jobs, 1000 * t_flat / repetitions, 1000 * t_heap / repetitions,
+            1000 * t_cancel / repetitions))
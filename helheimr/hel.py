@@ -2,28 +2,67 @@
 # coding=utf-8
 """The main controlling script."""
 
+import argparse
+import contextlib
+import importlib
 import logging
+import logging.handlers
 import signal
+import timeit
 
-from helu import broadcasting
-from helu import common
-from helu import district_heating
-from helu import heating
-from helu import network_utils
-from helu import scheduling
-from helu import telegram_bot
-from helu import temperature_log
-from helu import weather
+from helu import startup
+
+# The other helu modules are imported on demand by Hel.control_heating(), so
+# we can start the heating loop before the slow ones (python-telegram-bot, etc.)
+# have been loaded.
+
+
+class StartupProfiler(object):
+    """Measures how long each startup phase (module import, init_instance, etc.) takes."""
+    def __init__(self, enabled):
+        self._enabled = enabled
+        self._phases = list()
+        self._start_time = timeit.default_timer()
+
+    @contextlib.contextmanager
+    def phase(self, label):
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            if self._enabled:
+                self._phases.append((label, timeit.default_timer() - start))
+
+    def import_module(self, name):
+        """Imports helu.<name>. Note that the first import of a module also
+        includes all of its (not yet loaded) dependencies."""
+        with self.phase('import {:s}'.format(name)):
+            return importlib.import_module('helu.' + name)
+
+    def report(self):
+        """Prints the timings (if profiling is enabled)."""
+        if not self._enabled:
+            return
+        lines = ['Startup profile:']
+        for label, duration in self._phases:
+            lines.append('  {:<45s} {:9.1f} ms'.format(label, 1000 * duration))
+        lines.append('  {:<45s} {:9.1f} ms'.format('Total', 1000 * (timeit.default_timer() - self._start_time)))
+        print('\n'.join(lines), flush=True)
 
 
 class Hel(object):
-    def __init__(self):
+    def __init__(self, profile_startup=False):
         self._is_terminating = False
         self._logger = None
         self._heating = None
         self._scheduler = None
         self._telegram_bot = None
         self._weather_service = None
+        self._temperature_log = None
+        self._http_session_pool = None
+        self._render_service = None
+        self._orchestrator = None
+        self._profiler = StartupProfiler(profile_startup)
 
     def control_heating(self):
         # Set up logging, see examples at:
@@ -53,7 +92,8 @@ class Hel(object):
         self._logger = logging.getLogger()
 
         # Register signal handler to be notified upon system shutdown:
-        catchable_sigs = set(signal.Signals) - {signal.SIGKILL, signal.SIGSTOP}
+        # SIGCHLD is excluded, as it's sent whenever a child process (e.g. ping, plot renderer) exits
+        catchable_sigs = set(signal.Signals) - {signal.SIGKILL, signal.SIGSTOP, signal.SIGCHLD}
         for sig in catchable_sigs:
             try:
                 signal.signal(sig, self.__shutdown_signal)
@@ -61,55 +101,105 @@ class Hel(object):
             except OSError:
                 logging.getLogger().error('[Hel] Cannot register handler for signal {} #{}'.format(sig.name, sig.value))
 
-        # Load configuration files
-        ctrl_cfg = common.load_configuration('configs/ctrl.cfg')
-        telegram_cfg = common.load_configuration('configs/bot.cfg')
-        owm_cfg = common.load_configuration('configs/owm.cfg')
-        schedule_job_list_path = 'configs/scheduled-jobs.cfg'
+        profiler = self._profiler
 
-        # Start the heater/heating controller
-        try:
+        # Load configuration files
+        common = profiler.import_module('common')
+        with profiler.phase('load configurations'):
+            ctrl_cfg = common.load_configuration(common.config_path('ctrl.cfg'))
+            telegram_cfg = common.load_configuration(common.config_path('bot.cfg'))
+            owm_cfg = common.load_configuration(common.config_path('owm.cfg'))
+        schedule_job_list_path = common.config_path('scheduled-jobs.cfg')
+
+        # Import the (lightweight) modules upfront, only python-telegram-bot will be
+        # loaded concurrently to the other sub-systems' initialization.
+        broadcasting = profiler.import_module('broadcasting')
+        network_utils = profiler.import_module('network_utils')
+        heating = profiler.import_module('heating')
+        district_heating = profiler.import_module('district_heating')
+        scheduling = profiler.import_module('scheduling')
+        temperature_log = profiler.import_module('temperature_log')
+        rendering = profiler.import_module('rendering')
+        weather = profiler.import_module('weather')
+
+        def _init_http_session_pool():
+            # Persistent HTTP sessions (deCONZ, district heating, etc.)
+            self._http_session_pool = network_utils.HttpSessionPool.init_instance(ctrl_cfg)
+
+        def _init_heating():
+            # Starts the heater/heating controller (deCONZ sensors are discovered in the background)
             self._heating = heating.Heating.init_instance(ctrl_cfg)
-        except Exception as e:
-            self._logger.error('[Hel] Error while setting up heating system:\n{}'.format(e))
-            raise e
 
-        # Set up the district heating wrapper
-        try:
-            district_heating.DistrictHeating.init_instance(ctrl_cfg)
-        except Exception as e:
-            self._logger.error('[Hel] Error while setting up district heating system:\n{}'.format(e))
-            raise e
+        def _init_telegram_bot():
+            telegram_bot = profiler.import_module('telegram_bot')
+            self._telegram_bot = telegram_bot.HelheimrBot(telegram_cfg)
+            # Register telegram bot for message broadcasting
+            broadcasting.MessageBroadcaster.instance().set_telegram_bot(self._telegram_bot)
+
+        def _init_scheduler():
+            self._scheduler = scheduling.HelheimrScheduler.init_instance(
+                ctrl_cfg, schedule_job_list_path)
+
+        def _init_temperature_log():
+            self._temperature_log = temperature_log.TemperatureLog.init_instance(ctrl_cfg)
+
+        def _init_render_service():
+            # Spawns the plot rendering worker(s)
+            self._render_service = rendering.RenderService.init_instance(ctrl_cfg)
+
+        def _init_weather():
+            # pyowm is loaded upon the first query
+            self._weather_service = weather.WeatherForecastOwm.init_instance(owm_cfg)
+
+        # Independent sub-systems are initialized concurrently. If a non-critical one
+        # fails, we run with degraded capabilities (e.g. no weather reports). We're ready
+        # as soon as the critical ones are up, the others follow in the background.
+        orchestrator = startup.StartupOrchestrator(max_workers=4, profiler=profiler)
+        self._orchestrator = orchestrator
+        orchestrator.add('HttpSessionPool', _init_http_session_pool)
+        orchestrator.add('Heating', _init_heating, depends_on=['HttpSessionPool'])
+        orchestrator.add('DistrictHeating', lambda: district_heating.DistrictHeating.init_instance(ctrl_cfg),
+                         depends_on=['HttpSessionPool'], critical=False)
+        orchestrator.add('HelheimrBot', _init_telegram_bot, depends_on=['Heating'])
+        orchestrator.add('ConnectionTester', lambda: network_utils.ConnectionTester.init_instance(
+                             {'telegram': telegram_cfg, 'control': ctrl_cfg}),
+                         depends_on=['HttpSessionPool'], critical=False)
+        orchestrator.add('HelheimrScheduler', _init_scheduler, depends_on=['Heating', 'ConnectionTester'])
+        # The temperature log registers its polling job, so it needs the scheduler
+        orchestrator.add('TemperatureLog', _init_temperature_log,
+                         depends_on=['Heating', 'HelheimrScheduler'], critical=False)
+        orchestrator.add('WeatherForecastOwm', _init_weather, critical=False)
+        orchestrator.add('RenderService', _init_render_service, critical=False)
+        def _background_finished(subsystem):
+            if subsystem.error is None:
+                self._logger.info('[Hel] Sub-system {:s} is up and running.'.format(subsystem.name))
+            else:
+                self._logger.warning('[Hel] Running without: {:s}'.format(subsystem.name))
+                broadcasting.MessageBroadcaster.instance().warning(
+                    'Eingeschränkter Betrieb, folgende Komponente fehlt: {:s}'.format(subsystem.name))
 
-        # Create telegram bot
         try:
-            self._telegram_bot = telegram_bot.HelheimrBot(telegram_cfg)
+            orchestrator.run(on_background_finished=_background_finished)
         except Exception as e:
-            self._logger.error('[Hel] Error while setting up telegram bot:\n{}'.format(e))
+            self._logger.error('[Hel] Error while setting up the sub-systems:\n{}'.format(e))
+            self.__shutdown_gracefully()
             raise e
 
-        # Register telegram bot for message broadcasting
-        broadcasting.MessageBroadcaster.instance().set_telegram_bot(self._telegram_bot)
-
-        # Set up network connectivity tester
-        network_utils.ConnectionTester.init_instance(
-            {'telegram': telegram_cfg, 'control': ctrl_cfg})
-
-        # Then, start the job scheduler
-        self._scheduler = scheduling.HelheimrScheduler.init_instance(
-            ctrl_cfg, schedule_job_list_path)
-
-        # Set up the temperature log (after the scheduler!)
-        temperature_log.TemperatureLog.init_instance(ctrl_cfg)
-
         # Start the webserver for our e-ink display
         #TODO flask + flask-json
 
-        # Initialize weather service
-        self._weather_service = weather.WeatherForecastOwm.init_instance(owm_cfg)
-
         # Now we can start the telegram bot
-        self._telegram_bot.start()
+        with profiler.phase('HelheimrBot.start'):
+            self._telegram_bot.start()
+        if len(orchestrator.failed) > 0:
+            self._logger.warning('[Hel] Ready, but running without: {:s}'.format(', '.join(orchestrator.failed)))
+            broadcasting.MessageBroadcaster.instance().warning(
+                'Eingeschränkter Betrieb, folgende Komponenten fehlen: {:s}'.format(', '.join(orchestrator.failed)))
+        elif len(orchestrator.pending) > 0:
+            self._logger.info('[Hel] Ready, still starting: {:s}'.format(', '.join(orchestrator.pending)))
+        else:
+            self._logger.info('[Hel] Ready, all sub-systems are up and running.')
+        profiler.report()
 
         # Run the event loops forever:
         try:
@@ -130,12 +220,22 @@ class Hel(object):
         self._is_terminating = True
         # Gracefully shut down
         self._logger.info("[Hel] Shutting down...")
-        self._telegram_bot.shutdown()
-        self._scheduler.shutdown()
-        self._heating.shutdown()
+        # Let the background initialization finish, so we shut down these sub-systems, too
+        if self._orchestrator is not None and not self._orchestrator.wait(timeout=30):
+            self._logger.warning('[Hel] Sub-systems are still starting up: {:s}'.format(', '.join(self._orchestrator.pending)))
+        # Some sub-systems may not be available (failed or aborted startup)
+        for subsystem in [self._telegram_bot, self._scheduler, self._temperature_log, self._heating, self._render_service]:
+            if subsystem is not None:
+                subsystem.shutdown()
+        if self._http_session_pool is not None:
+            self._http_session_pool.close()
         self._logger.info("[Hel] All sub-systems are on hold, good bye!")
 
 
 if __name__ == '__main__':
-    hel = Hel()
+    parser = argparse.ArgumentParser(description='Heating control service')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Print the import and initialization time of each startup phase')
+    args = parser.parse_args()
+    hel = Hel(profile_startup=args.profile_startup)
     hel.control_heating()
@@ -78,6 +78,16 @@ def cfg_val_or_default(cfg, key, default):
     return default if v is None else v
 
 
+# Configuration files are located at <helheimr>/configs
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'configs')
+
+
+def config_path(filename):
+    """Returns the path of the given file within the configuration directory
+    (absolute paths are returned as-is)."""
+    return os.path.join(CONFIG_DIR, filename)
+
+
 def load_configuration(filename):
     """Loads a libconfig configuration file."""
     try:
@@ -2,22 +2,32 @@
 # coding=utf-8
 """Basic drawing/plotting capabilities for temperature graphs, e-ink display, etc."""
 
-import matplotlib
-# Set up headless on pi
 import os
-if os.uname().machine.startswith('arm'):
-    matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import numpy as np
 
 import datetime
 import logging
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFont
 import io
 
 from . import time_utils
 from dateutil import tz
-from rdp import rdp
+
+# matplotlib takes seconds to import on the pi, so we load it upon the first plot
+__pyplot = None
+
+
+def _pyplot():
+    """Returns matplotlib.pyplot (imported on first use)."""
+    global __pyplot
+    if __pyplot is None:
+        import matplotlib
+        # Set up headless on pi
+        if os.uname().machine.startswith('arm'):
+            matplotlib.use('Agg')
+        import matplotlib.pyplot
+        __pyplot = matplotlib.pyplot
+    return __pyplot
 
 
 def curve_color(idx):
@@ -45,25 +55,28 @@ def curve_color(idx):
 
 
 def smooth(values, win_size):
+    """Centered moving average. Towards the beginning/end, the window shrinks
+    (so it stays centered), i.e. the first/last values are not smoothed."""
     if win_size < 3:
         return values
-    smoothed = list()
+    values = np.asarray(values, dtype=np.float64)
+    num = values.shape[0]
     neighbors = int((win_size - 1)//2)
-    for idx in range(len(values)):
-        ifrom = max(0, idx - neighbors)
-        ito = min(len(values)-1, idx + neighbors)
-
-        # Reduce span at the beginning/end (where there are less neighbors).
-        actual_neighbors = min(idx - ifrom, ito - idx)
-        ifrom = idx - actual_neighbors
-        ito = idx + actual_neighbors
-
-        # Average all values within the span.
-        to_average = 0.0
-        for win_idx in range(ifrom, ito+1):
-            to_average += values[win_idx]
-        avg = to_average / (2*actual_neighbors + 1)
-        smoothed.append(avg)
+    if num <= 2:
+        return values.copy()
+    # Readings with a full window
+    smoothed = np.empty(num, dtype=np.float64)
+    win_len = 2*neighbors + 1
+    if num >= win_len:
+        smoothed[neighbors:num-neighbors] = np.convolve(values, np.full(win_len, 1.0 / win_len), mode='valid')
+    # Shrinking windows at the beginning/end: reading i (< neighbors) averages
+    # the first 2i+1 values (and analogously for the last readings).
+    num_border = min(neighbors, (num + 1) // 2)
+    span = np.arange(num_border)
+    head = np.cumsum(values[:2*num_border])
+    smoothed[:num_border] = head[2*span] / (2*span + 1)
+    tail = np.cumsum(values[::-1][:2*num_border])
+    smoothed[num-num_border:] = (tail[2*span] / (2*span + 1))[::-1]
     return smoothed
 
 
@@ -145,42 +158,268 @@ def __prepare_ticks(temperature_log, desired_num_ticks=10):
     return tick_values, tick_labels, dt_tick_start
 
 
-def __prepare_curves(sensor_names, temperature_log, dt_tick_start, simplify):
-    """Prepares the temperature curves (x ticks are offsets from the given datetime dt_tick_start)."""
-    temperature_curves = {sn: list() for sn in sensor_names}
-    was_heating = list()
-    for reading in temperature_log:
-        dt_local, sensors, heating = reading
-
-        td = __naive_time_diff(dt_local, dt_tick_start)
-        dt_tick_offset = td.total_seconds()
-
-        was_heating.append((dt_tick_offset, heating))
-
-        if sensors is None:
-            continue
+def lttb(x, y, num_out):
+    """Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013), i.e.
+    splits the curve into num_out - 2 buckets and selects the point per bucket
+    which spans the largest triangle with the previously selected point and
+    the next bucket's average. First and last point are always kept.
+    The triangle areas are linear in the previously selected point, so their
+    coefficients are precomputed for all points at once; only the argmax per
+    bucket remains sequential.
 
-        for sn in sensors.keys():
-            if sensors[sn] is None:
-                continue
-            temperature_curves[sn].append((dt_tick_offset, sensors[sn]))
-    if simplify:
+    :return: (x, y) arrays with at most num_out points
+    """
+    x_in = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    num = x_in.shape[0]
+    if num_out >= num or num_out < 3:
+        return x_in, y
+    # Shift x to reduce the cancellation errors of the area computation below
+    x = x_in - x_in[0]
+    # Bucket b holds the (inner) points [edges[b], edges[b+1])
+    edges = np.floor(np.linspace(1, num - 1, num_out - 1)).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    num_buckets = starts.shape[0]
+    # Each bucket's "third" point is the average of the next bucket (the last point for the last bucket)
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y)))
+    count = ends - starts
+    next_x = np.append(((sum_x[ends] - sum_x[starts]) / count)[1:], x[-1])
+    next_y = np.append(((sum_y[ends] - sum_y[starts]) / count)[1:], y[-1])
+    # Doubled area of the triangle (a, p, c) is |ax*u + ay*v + w| for each candidate p
+    cx = np.repeat(next_x, count)
+    cy = np.repeat(next_y, count)
+    px, py = x[1:num-1], y[1:num-1]
+    u = py - cy
+    v = cx - px
+    w = px * cy - cx * py
+
+    selected = np.empty(num_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = num - 1
+    ax, ay = x[0], y[0]
+    for b in range(num_buckets):
+        s, e = starts[b] - 1, ends[b] - 1  # Indices into the inner points
+        idx = s + int(np.argmax(np.abs(ax * u[s:e] + ay * v[s:e] + w[s:e]))) + 1
+        selected[b + 1] = idx
+        ax, ay = x[idx], y[idx]
+    return x_in[selected], y[selected]
+
+
+def __step_transitions(x, states):
+    """Reduces a step curve to its first/last point and the points around
+    each state change (so the drawn polyline stays exactly the same)."""
+    keep = np.zeros(states.shape[0], dtype=bool)
+    if states.shape[0] > 0:
+        keep[[0, -1]] = True
+        changes = np.flatnonzero(states[1:] != states[:-1])
+        keep[changes] = True
+        keep[changes + 1] = True
+    return x[keep], states[keep]
+
+
+def __prepare_curves(sensor_names, temperature_log, dt_tick_start, simplify, smoothing_window=0, max_points=None):
+    """Prepares the temperature curves (x ticks are offsets in seconds from the
+    given datetime dt_tick_start).
+
+    simplify: False/None, True or 'rdp' (Ramer-Douglas-Peucker, applied before
+              smoothing), or 'lttb' (Largest-Triangle-Three-Buckets, applied
+              after smoothing, yielding at most max_points per curve)
+
+    :return: dict(sensor_name: (x, temperature) arrays), holding only the
+             valid (smoothed) readings of the sensor, and (x, is_heating) arrays
+    """
+    # Wall-clock offsets (as __naive_time_diff(), i.e. both are assumed to be within the same timezone)
+    dt_start = dt_tick_start.replace(tzinfo=None)
+    x = np.abs(np.fromiter([(reading[0].replace(tzinfo=None) - dt_start).total_seconds() for reading in temperature_log],
+                           dtype=np.float64, count=len(temperature_log)))
+
+    # num_readings x num_sensors, None (i.e. unreachable sensor) becomes NaN
+    temperatures = np.array([
+            [None] * len(sensor_names) if reading[1] is None else [reading[1].get(sn) for sn in sensor_names]
+            for reading in temperature_log
+        ], dtype=np.float64).reshape(-1, len(sensor_names))
+    was_heating = (x, np.array([bool(reading[2]) for reading in temperature_log], dtype=bool))
+
+    temperature_curves = dict()
+    for sidx, sn in enumerate(sensor_names):
+        valid = ~np.isnan(temperatures[:, sidx])
+        temperature_curves[sn] = (x[valid], temperatures[valid, sidx])
+    if simplify is True or simplify == 'rdp':
+        from rdp import rdp
         for sn in temperature_curves:
-            t = temperature_curves[sn]
-            simplified = rdp(t, epsilon=0.01)
+            cx, cy = temperature_curves[sn]
+            if cx.shape[0] < 3:
+                continue
+            simplified = rdp(np.column_stack((cx, cy)), epsilon=0.01)
             # TODO remove log output
-            logging.getLogger().info('Drawing: Simplified {} from {} to {} readings.'.format(sn, len(t), len(simplified)))
-            temperature_curves[sn] = simplified
+            logging.getLogger().info('Drawing: Simplified {} from {} to {} readings.'.format(sn, cx.shape[0], simplified.shape[0]))
+            temperature_curves[sn] = (simplified[:, 0], simplified[:, 1])
+    if smoothing_window > 2:
+        temperature_curves = {sn: (cx, smooth(cy, smoothing_window)) for sn, (cx, cy) in temperature_curves.items()}
+    if simplify == 'lttb':
+        if max_points is None:
+            raise ValueError('LTTB simplification requires max_points')
+        temperature_curves = {sn: lttb(cx, cy, max_points) for sn, (cx, cy) in temperature_curves.items()}
+        was_heating = __step_transitions(*was_heating)
+    elif simplify not in [None, False, True, 'rdp']:
+        raise ValueError("Unsupported curve simplification '{}'".format(simplify))
     return temperature_curves, was_heating
 
 
+# Fonts for the PIL backend, cached per size
+__pil_fonts = dict()
+
+
+def _pil_font(size):
+    """Returns a TrueType font (DejaVu Sans if available, otherwise Pillow's default)."""
+    size = int(round(size))
+    if size not in __pil_fonts:
+        try:
+            __pil_fonts[size] = ImageFont.truetype('DejaVuSans.ttf', size)
+        except OSError:
+            try:
+                __pil_fonts[size] = ImageFont.load_default(size)
+            except TypeError:
+                # Older Pillow versions only provide a fixed-size bitmap font
+                __pil_fonts[size] = ImageFont.load_default()
+    return __pil_fonts[size]
+
+
+def _pil_color(color, alpha=1.0):
+    """Converts a curve_color() to 8-bit RGB, blended with white background."""
+    return tuple([int(round(255 * (alpha * c + 1 - alpha))) for c in color])
+
+
+def __to_polyline(px, py):
+    """Returns the flat list [x0, y0, x1, y1, ...] of integer pixel coordinates,
+    without consecutive duplicates (dense curves collapse to few pixels)."""
+    pts = np.column_stack((np.round(px), np.round(py))).astype(np.int32)
+    if pts.shape[0] > 1:
+        keep = np.ones(pts.shape[0], dtype=bool)
+        keep[1:] = np.any(pts[1:] != pts[:-1], axis=1)
+        pts = pts[keep]
+    return pts.ravel().tolist()
+
+
+def __render_pil(width_px, height_px, sensor_names, colors, plot_labels,
+        x_tick_values, x_tick_labels, temperature_curves, was_heating,
+        grid_alpha, linewidth, min_temperature_span, font_size, legend_columns,
+        draw_marker):
+    """Draws the (smoothed) curves via PIL.ImageDraw, @see plot_temperature_curves()."""
+    img = Image.new('RGB', (width_px, height_px), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    font = _pil_font(font_size)
+    text_height = font.getbbox('0123456789°')[3]
+    pad = max(2, int(font_size * 0.3))
+    linewidth = max(1, int(round(linewidth)))
+    heating_x, is_heating = was_heating
+    valid_curves = [sn for sn in sensor_names if temperature_curves[sn][0].shape[0] > 0]
+
+    # Title and plot area (y tick labels on the left, x tick labels below)
+    title = 'Temperaturverlauf [°C]'
+    draw.text(((width_px - draw.textlength(title, font=font)) / 2, pad), title, fill=(0, 0, 0), font=font)
+    y_label_width = draw.textlength('00°', font=font)
+    left = int(pad + y_label_width + pad)
+    right = width_px - pad - int(draw.textlength(x_tick_labels[-1], font=font) / 2)
+    top = 2*pad + text_height + pad
+    bottom = height_px - 2*pad - text_height
+    if right - left < 10 or bottom - top < 10:
+        logging.getLogger().warning('Plot area of {:d}x{:d} px is too small.'.format(width_px, height_px))
+        return img
+
+    # Axis ranges (as matplotlib's autoscale + the adjustments in plot_temperature_curves).
+    # The x offsets are naive wall-clock times, i.e. they jump back upon the DST change.
+    x_min = min(np.min(x_tick_values), np.min(heating_x))
+    x_max = max(np.max(x_tick_values), np.max(heating_x))
+    if len(valid_curves) > 0:
+        y_lo = min([np.min(temperature_curves[sn][1]) for sn in valid_curves])
+        y_hi = max([np.max(temperature_curves[sn][1]) for sn in valid_curves])
+    else:
+        y_lo, y_hi = 0.0, 0.0
+    margin = 0.05 * (y_hi - y_lo)
+    y_lo, y_hi = y_lo - margin, y_hi + margin
+    delta = np.ceil(min_temperature_span - (y_hi - y_lo))
+    if delta < 0:
+        delta = 2
+    y_min = y_lo - delta * 0.7
+    y_max = y_hi + delta * 0.3
+    sx = (right - left) / max(1.0, x_max - x_min)
+    sy = (bottom - top) / (y_max - y_min)
+
+    def _px(x):
+        return left + (np.asarray(x) - x_min) * sx
+
+    def _py(y):
+        return bottom - (np.asarray(y) - y_min) * sy
+
+    # Heating band: shade the intervals where the heater was on
+    band_color = _pil_color((1, .5, 0), 0.15)
+    if is_heating.shape[0] > 0:
+        changes = np.diff(is_heating.astype(np.int8))
+        starts = np.flatnonzero(changes == 1) + 1
+        ends = np.flatnonzero(changes == -1) + 1
+        if is_heating[0]:
+            starts = np.concatenate(([0], starts))
+        if is_heating[-1]:
+            ends = np.concatenate((ends, [is_heating.shape[0] - 1]))
+        for x0, x1 in zip(_px(heating_x[starts]), _px(heating_x[ends])):
+            draw.rectangle([int(min(x0, x1)), top, int(round(max(x0, x1))), bottom], fill=band_color)
+
+    # Grid and ticks
+    grid_color = _pil_color((0, 0, 0), grid_alpha)
+    y_ticks = range(int(np.ceil(y_min + 0.8)), int(y_max))
+    for t, py in zip(y_ticks, _py(y_ticks)):
+        draw.line([left, int(py), right, int(py)], fill=grid_color, width=1)
+        lbl = '{:d}°'.format(t)
+        draw.text((left - pad - draw.textlength(lbl, font=font), int(py) - text_height // 2), lbl, fill=(0, 0, 0), font=font)
+    # Skip x tick labels which would overlap their predecessor
+    label_right = -1
+    for lbl, px in zip(x_tick_labels, _px(x_tick_values)):
+        draw.line([int(px), top, int(px), bottom], fill=grid_color, width=1)
+        lbl_width = draw.textlength(lbl, font=font)
+        if px - lbl_width / 2 > label_right + pad:
+            draw.text((px - lbl_width / 2, bottom + pad), lbl, fill=(0, 0, 0), font=font)
+            label_right = px + lbl_width / 2
+    draw.rectangle([left, top, right, bottom], outline=(0, 0, 0), width=1)
+
+    # Curves
+    for sn in valid_curves:
+        cx, cy = temperature_curves[sn]
+        color = _pil_color(colors[sn])
+        polyline = __to_polyline(_px(cx), _py(cy))
+        if len(polyline) > 2:
+            draw.line(polyline, fill=color, width=linewidth, joint='curve')
+        if draw_marker:
+            r = linewidth
+            for x, y in zip(polyline[0::2], polyline[1::2]):
+                draw.ellipse([x - r, y - r, x + r, y + r], fill=color)
+
+    # Legend at the bottom of the plot area (which is kept free by the y-axis range)
+    legend = [(plot_labels[sn], _pil_color(colors[sn])) for sn in valid_curves] + [('Heizung', None)]
+    legend_rows = int(np.ceil(len(legend) / legend_columns))
+    legend_top = bottom - pad - legend_rows * (text_height + pad)
+    column_width = (right - left - 2*pad) / legend_columns
+    swatch = 2 * text_height
+    for idx, (label, color) in enumerate(legend):
+        lx = left + pad + (idx % legend_columns) * column_width
+        ly = legend_top + (idx // legend_columns) * (text_height + pad)
+        if color is None:
+            draw.rectangle([lx, ly, lx + swatch, ly + text_height], fill=band_color)
+        else:
+            draw.line([lx, ly + text_height // 2, lx + swatch, ly + text_height // 2], fill=color, width=linewidth)
+        draw.text((lx + swatch + pad, ly), label, fill=(0, 0, 0), font=font)
+    return img
+
+
 def plot_temperature_curves(width_px, height_px, temperature_log,
         return_mem=True, xkcd=True, reverse=True, name_mapping=None,
         line_alpha=0.9, grid_alpha=0.3, linewidth=3.5,
         min_temperature_span=9, smoothing_window=7,
         font_size=20, legend_columns=3,
         draw_marker=False, alternate_line_styles=False,
-        simplify_curves=False):
+        simplify_curves=False, img_format='jpeg', img_quality=None,
+        backend='matplotlib'):
     """
     Plots the temperature readings (@see temperature_log.py).
 
@@ -214,8 +453,21 @@ def plot_temperature_curves(width_px, height_px, temperature_log,
 
     alternate_line_styles: if True, line styles will be alternated
 
-    simplify_curves: Use Ramer-Douglas-Peucker to simplify the temperature plots
+    simplify_curves: Simplify the temperature curves, either via Ramer-Douglas-Peucker
+                     (True or 'rdp') or via Largest-Triangle-Three-Buckets ('lttb',
+                     at most width_px points per curve)
+
+    img_format: 'jpeg', 'png' or 'webp' (if return_mem)
+
+    img_quality: JPEG/WebP quality (None for Pillow's default)
+
+    backend: 'matplotlib' or 'pil'. The latter is a lightweight renderer for
+             small targets (e-ink display, previews), which ignores xkcd and
+             alternate_line_styles and uses font_size in pixels. Instead of
+             showing the plot, it returns the Pillow.Image if not return_mem.
     """
+    if backend not in ['matplotlib', 'pil']:
+        raise ValueError("Unsupported plot backend '{}'".format(backend))
     # ## Prepare the data
     if reverse:
         temperature_log = temperature_log[::-1]
@@ -252,12 +504,24 @@ def plot_temperature_curves(width_px, height_px, temperature_log,
     x_tick_values, x_tick_labels, dt_tick_start = __prepare_ticks(temperature_log, desired_num_ticks=10)
 
     # Then extract the data points
-    temperature_curves, was_heating = __prepare_curves(sensor_names, temperature_log, dt_tick_start, simplify_curves)
+    temperature_curves, was_heating = __prepare_curves(
+        sensor_names, temperature_log, dt_tick_start, simplify_curves,
+        smoothing_window=smoothing_window, max_points=width_px)
+
+    if backend == 'pil':
+        img_pil = __render_pil(width_px, height_px, sensor_names, colors, plot_labels,
+                               x_tick_values, x_tick_labels, temperature_curves, was_heating,
+                               grid_alpha=grid_alpha, linewidth=linewidth, min_temperature_span=min_temperature_span,
+                               font_size=font_size, legend_columns=legend_columns, draw_marker=draw_marker)
+        if return_mem:
+            return pil2memfile(img_pil, img_format=img_format, quality=img_quality)
+        return img_pil
 
     # ## Now we're ready to plot
     # Prepare figure of proper size
     dpi = 100  # Dummy DPI value to compute figure size in inches
-    fig = plt.figure(figsize=(width_px/dpi, height_px/dpi))
+    plt = _pyplot()
+    fig = plt.figure(figsize=(width_px/dpi, height_px/dpi), dpi=dpi)
     if xkcd:
         plt.xkcd(scale=1, length=100, randomness=2)
     # Always change rcParams AFTER xkcd(), as it messes with the rcParams
@@ -275,22 +539,19 @@ def plot_temperature_curves(width_px, height_px, temperature_log,
             return '-'
     line_style_idx = 0
     for sn in sensor_names:
-        unzipped = tuple(zip(*temperature_curves[sn]))
-        if len(unzipped) < 2:
+        curve_x, curve_y = temperature_curves[sn]
+        if curve_x.shape[0] == 0:
             logging.getLogger().warning("Empty temperature curve for sensor '{:s}'.".format(sn))
             num_skipped += 1
             continue
-        if smoothing_window > 2:
-            values = smooth(unzipped[1], smoothing_window)
-        else:
-            values = unzipped[1]
+        values = curve_y
         if draw_marker:
-            ax.plot(unzipped[0], values,
+            ax.plot(curve_x, values,
                 color=colors[sn], alpha=line_alpha, linestyle=_line_style(line_style_idx), linewidth=linewidth,
                 label=plot_labels[sn],
                 marker='.', markersize=5*linewidth, markeredgewidth=linewidth, zorder=10)
         else:
-            ax.plot(unzipped[0], values,
+            ax.plot(curve_x, values,
                 color=colors[sn], alpha=line_alpha, linestyle=_line_style(line_style_idx), linewidth=linewidth,
                 label=plot_labels[sn], zorder=10)
         line_style_idx += 1
@@ -330,9 +591,9 @@ def plot_temperature_curves(width_px, height_px, temperature_log,
 
         # Plot a curve (z-order behind temperature plots but above of grid)
         # indicating if heating was active
-        unzipped = tuple(zip(*was_heating))
-        heating_values = [ymax-1 if wh else ymin_initial-1 for wh in unzipped[1]]
-        ax.plot(unzipped[0], heating_values,
+        heating_x, is_heating = was_heating
+        heating_values = np.where(is_heating, ymax-1, ymin_initial-1)
+        ax.plot(heating_x, heating_values,
                 color=(.2, .2, .2), alpha=line_alpha, linestyle='--', linewidth=linewidth,
                 label='Heizung', zorder=2)
 
@@ -356,14 +617,12 @@ def plot_temperature_curves(width_px, height_px, temperature_log,
     fig.canvas.draw()
 
     # Export figure (and return it - unless we're debugging, then save and show)
-    img_np = plt2img(fig, dpi=dpi)
-    img_pil = np2pil(img_np)
-
     if return_mem:
+        memfile = fig2memfile(fig, img_format=img_format, quality=img_quality)
         plt.close(fig)
-        return pil2memfile(img_pil)
+        return memfile
     else:
-        img_pil.save('dummy-temperature.jpg')
+        fig2pil(fig).convert('RGB').save('dummy-temperature.jpg')
         plt.show()
 
 
@@ -377,11 +636,30 @@ def pil2np(img_pil, flip_channels=False):
         return img_np
 
 
-def pil2memfile(img_pil, name='image.jpg'):
-    """Write the image into a buffer kept in RAM."""
+# Supported export formats and the corresponding file names
+__memfile_names = {'jpeg': 'image.jpg', 'png': 'image.png', 'webp': 'image.webp'}
+
+
+def pil2memfile(img_pil, name=None, img_format='jpeg', quality=None):
+    """Write the image into a buffer kept in RAM.
+
+    img_format: 'jpeg', 'png' or 'webp'
+    quality: JPEG/WebP quality (None for Pillow's default), ignored for PNG
+    """
+    img_format = img_format.lower()
+    if img_format == 'jpg':
+        img_format = 'jpeg'
+    if img_format not in __memfile_names:
+        raise ValueError("Unsupported image format '{}'".format(img_format))
+    if img_format == 'jpeg' and img_pil.mode != 'RGB':
+        # JPEG doesn't support alpha
+        img_pil = img_pil.convert('RGB')
+    params = dict()
+    if quality is not None and img_format != 'png':
+        params['quality'] = quality
     memfile = io.BytesIO()
-    memfile.name = name
-    img_pil.save(memfile, 'jpeg') #'png')
+    memfile.name = __memfile_names[img_format] if name is None else name
+    img_pil.save(memfile, img_format, **params)
     memfile.seek(0)
     return memfile
 
@@ -396,8 +674,27 @@ def np2memfile(img_np):
     return pil2memfile(np2pil(img_np))
 
 
+def fig2pil(fig):
+    """Returns the drawn figure as RGBA Pillow.Image, which shares the memory of
+    the Agg canvas (call fig.canvas.draw() before). Don't use the image after
+    the figure has been redrawn/closed."""
+    canvas = fig.canvas
+    if not hasattr(canvas, 'buffer_rgba'):
+        # Not an Agg-based canvas, go the long way
+        return np2pil(plt2img(fig, dpi=fig.dpi))
+    rgba = np.asarray(canvas.buffer_rgba())
+    return Image.frombuffer('RGBA', (rgba.shape[1], rgba.shape[0]), rgba, 'raw', 'RGBA', 0, 1)
+
+
+def fig2memfile(fig, img_format='jpeg', quality=None):
+    """Encodes the drawn figure directly from the canvas buffer (i.e. a single
+    encoding pass, unlike plt2img() + pil2memfile())."""
+    return pil2memfile(fig2pil(fig), img_format=img_format, quality=quality)
+
+
 def plt2img(fig, dpi=180):
-    """Render the matplotlib figure 'fig' as an image (numpy array)."""
+    """Render the matplotlib figure 'fig' as an image (numpy array).
+    Use fig2memfile() if you only need the encoded image."""
     # Save plot to buffer...
     buf = io.BytesIO()
     fig.savefig(buf, format="png", dpi=dpi)
@@ -2,6 +2,7 @@
 # coding=utf-8
 """Controls the heater (or a dummy heater for debug purposes)."""
 #TODO e-ink hostnames: thrudvang, bilskirnir, fensal, gjallarbru (bruecke ueber gjoell), breidablik
+import collections
 import datetime
 import logging
 import threading
@@ -64,6 +65,13 @@ class HeatingRequest(Enum):
     SCHEDULED = 2
 
 
+class HeatingCommand(Enum):
+    """State changes requested by other threads, applied by the heating loop."""
+    START = 1
+    STOP = 2
+    SHUTDOWN = 3
+
+
 class Heating:
     __instance = None
 
@@ -158,6 +166,15 @@ class Heating:
         # self._heating_logger.addHandler(file_handler)
         # self._heating_logger.setLevel(logging.INFO)
 
+        # Members related to temperature sensor check
+        self._temperature_trend_waiting_time = config['heating']['temperature_trend_waiting_time']  # Time to wait before checking the temperature trend while heating
+        self._temperature_trend_threshold = config['heating']['temperature_trend_threshold']        # Temperature inc/dec will be recognised if |delta_temp| >= threshold
+        self._temperature_trend_mute_time = config['heating']['temperature_trend_mute_time']        # Time to wait before broadcasting subsequent trend warnings
+        self._last_trend_warning_issue_time = None  # Time of the last broadcasted temperature trend warning
+        # The trend is fitted incrementally to the (deduplicated) readings of the current should-be-heating
+        # period, optionally limited to the most recent X readings:
+        self._temperature_trend_window = common.cfg_val_or_default(config['heating'], 'temperature_trend_window', None)
+
         # Members related to the heating loop thread
         self._latest_request_by = None            # Name of user who requested the most recent heating job
         self._num_consecutive_errors_before_broadcast = \
@@ -165,7 +182,8 @@ class Heating:
         self._max_idle_time = \
             config['heating']['idle_time']         # Max. time to wait between __heating_loop() iterations
         self._is_terminating = False               # During shutdown, we want to prevent start_heating() calls
-        self._start_heating = False                # Used to notify the __heating_loop() that there was a start_heating() request
+        self._commands = collections.deque()       # Pending (HeatingCommand, parameters) requests for the __heating_loop()
+        self._use_controller = False               # If temperature +/- hysteresis is set, we use the on/off controller
         self._run_heating_loop = True              # Flag to keep the heating thread alive
         self._reach_temperature_only_once = False  # In case you want to reach a specific temperature only once (stop heating after reaching it)
         self._lock = threading.Lock()                          # Thread will wait on the condition variable (so we can notify
@@ -173,12 +191,6 @@ class Heating:
         self._heating_loop_thread = threading.Thread(target=self.__heating_loop)
         self._heating_loop_thread.start()
 
-        # Members related to temperature sensor check
-        self._temperature_trend_waiting_time = config['heating']['temperature_trend_waiting_time']  # Time to wait before checking the temperature trend while heating
-        self._temperature_trend_threshold = config['heating']['temperature_trend_threshold']        # Temperature inc/dec will be recognised if |delta_temp| >= threshold
-        self._temperature_trend_mute_time = config['heating']['temperature_trend_mute_time']        # Time to wait before broadcasting subsequent trend warnings
-        self._last_trend_warning_issue_time = None  # Time of the last broadcasted temperature trend warning
-
         logging.getLogger().info('[Heating] Initialized heating singleton.')
 
     def start_heating(
@@ -210,31 +222,30 @@ class Heating:
                         requested_by))
                 self._is_paused = False
 
-        # Acquire the lock, store this heat request.
+        # Acquire the lock, enqueue this heat request (the heating loop applies it
+        # as soon as possible, even if it is currently waiting for the sensors).
         self._condition_var.acquire()
-        if self._is_heating and self._is_manual_request and request_type == HeatingRequest.SCHEDULED:
+        is_heating, is_manual_request, latest_request_by = self.__pending_request_state()
+        if is_heating and is_manual_request and request_type == HeatingRequest.SCHEDULED:
             logging.getLogger().info("[Heating] Ignoring the periodic heating request by '{:s}', because there is a manual request by '{:s}' currently active.".format(
-                requested_by, self._latest_request_by))
+                requested_by, latest_request_by))
         else:
-            self._latest_request_by = requested_by
-            self._target_temperature = target_temperature
-            self._temperature_hysteresis = temperature_hysteresis
-            self._heating_duration = duration
-            self._start_heating = True
-            self._is_manual_request = request_type == HeatingRequest.MANUAL
-            self._reach_temperature_only_once = (target_temperature is not None) and reach_temperature_only_once
-
-        self._condition_var.notify()
+            self._commands.append((HeatingCommand.START, {
+                'requested_by': requested_by,
+                'target_temperature': target_temperature,
+                'temperature_hysteresis': temperature_hysteresis,
+                'duration': duration,
+                'is_manual_request': request_type == HeatingRequest.MANUAL,
+                'reach_temperature_only_once': (target_temperature is not None) and reach_temperature_only_once
+            }))
+            self._condition_var.notify()
         self._condition_var.release()
         return True, ''
 
     def stop_heating(self, requested_by):
         """Stops the heater (if currently active). Will be invoked by the user manually."""
-        self._reach_temperature_only_once = False
         self._condition_var.acquire()
-        if self._is_heating:
-            logging.getLogger().info("[Heating] Stop heating as requested by '{:s}'".format(requested_by))
-        self.__stop_heating()
+        self._commands.append((HeatingCommand.STOP, {'requested_by': requested_by}))
         self._condition_var.notify()
         self._condition_var.release()
 
@@ -260,6 +271,10 @@ class Heating:
         """:return: Verbose multi-line string."""
         return self._zigbee_gateway.query_deconz_details()
 
+    def query_lpd433_status(self):
+        """:return: Status line of the LPD433 transmitter."""
+        return self._lpd433_gateway.query_transmitter_details()
+
     def query_heating_state(self):
         """:return: is_heating(bool), list(lpd433.LpdDeviceState)"""
         return self._lpd433_gateway.query_heating()
@@ -278,11 +293,84 @@ class Heating:
         """
         return self._zigbee_gateway.query_temperature_for_heating()
 
-    def __stop_heating(self):
+    def __pending_request_state(self):
+        """Returns the heating state (is_heating, is_manual_request, latest_request_by)
+        after all pending commands would have been applied.
+        You must hold the lock before calling this method!"""
+        is_heating = self._is_heating
+        is_manual_request = self._is_manual_request
+        latest_request_by = self._latest_request_by
+        for cmd, params in self._commands:
+            if cmd == HeatingCommand.START:
+                is_heating = True
+                is_manual_request = params['is_manual_request']
+                latest_request_by = params['requested_by']
+            else:
+                is_heating = False
+                is_manual_request = False
+        return is_heating, is_manual_request, latest_request_by
+
+    def __apply_commands(self):
+        """Applies all pending start/stop/shutdown requests.
+        You must hold the lock before calling this method!"""
+        while len(self._commands) > 0:
+            cmd, params = self._commands.popleft()
+            if cmd == HeatingCommand.START:
+                self.__apply_start_heating(params)
+            elif cmd == HeatingCommand.STOP:
+                if self._is_heating:
+                    logging.getLogger().info("[Heating] Stop heating as requested by '{:s}'".format(params['requested_by']))
+                self.__stop_heating()
+            else:
+                self.__stop_heating()
+                self._run_heating_loop = False
+
+    def __apply_start_heating(self, params):
         """You must hold the lock before calling this method!"""
+        self._latest_request_by = params['requested_by']
+        self._target_temperature = params['target_temperature']
+        self._temperature_hysteresis = params['temperature_hysteresis']
+        self._heating_duration = params['duration']
+        self._is_manual_request = params['is_manual_request']
+        self._reach_temperature_only_once = params['reach_temperature_only_once']
+        self._is_heating = True
+        # Reset temperature trend warning time
+        self._last_trend_warning_issue_time = None
+
+        if self._target_temperature is not None:
+            self._controller.set_desired_value(self._target_temperature)
+            self._controller.set_hysteresis(self._temperature_hysteresis)
+            self._use_controller = True
+            msg = "Starting BangBang to reach {:.1f} +/- {:.1f}° {}as requested by '{:s}'".format(
+                self._target_temperature, self._temperature_hysteresis,
+                ' once (stop afterwards) ' if self._reach_temperature_only_once else '',
+                self._latest_request_by)
+            logging.getLogger().info('[Heating] ' + msg)
+            # self._heating_logger.info(msg)
+        else:
+            self._use_controller = False
+            msg = "Starting manually (i.e. always on) as requested by '{:s}'".format(self._latest_request_by)
+            logging.getLogger().info("[Heating] " + msg)
+            # self._heating_logger.info(msg)
+
+        if self._heating_duration is None:
+            self._heating_end_time = None
+            if not self._reach_temperature_only_once:
+                msg = "This heating request can only be stopped manually!"
+                logging.getLogger().info("[Heating] " + msg)
+                # self._heating_logger.info(msg)
+        else:
+            self._heating_end_time = time_utils.dt_offset(self._heating_duration)
+            msg = "This heating request will end at {}".format(time_utils.format(self._heating_end_time))
+            logging.getLogger().info("[Heating] " + msg)
+
+    def __stop_heating(self):
+        """You must hold the lock before calling this method! The heating
+        loop will turn off the plugs."""
         self._is_manual_request = False
         self._is_heating = False
-        self._lpd433_gateway.turn_off()
+        self._reach_temperature_only_once = False
+        self._heating_end_time = None
 
     def run_blocking(self):
         self._heating_loop_thread.join()
@@ -293,70 +381,61 @@ class Heating:
             return
         self._is_terminating = True
         logging.getLogger().info('[Heating] Stopping heating system...')
+        # Stop heating & terminate thread
         self._condition_var.acquire()
-        # Stop heating
-        self.__stop_heating()
-        # Terminate thread
-        self._run_heating_loop = False
+        self._commands.append((HeatingCommand.SHUTDOWN, None))
         self._condition_var.notify()
         self._condition_var.release()
-        # Wait for thread
+        # Wait for thread (it will turn off the plugs)
         self._heating_loop_thread.join()
+        # Release the RF transmitter and stop the deCONZ event listener (if any)
+        self._lpd433_gateway.shutdown()
+        self._zigbee_gateway.shutdown()
 
     def __heating_loop(self):
         self._heating_end_time = None
-        use_controller = False  # If temperature +/- hysteresis is set, we use the on/off controller
         should_heat = False
         current_temperature = None
         consecutive_errors = 0
-        reference_temperature_log = list()
+        num_trend_readings = 0  # Number of heating loop iterations since we started heating
+        trend_estimator = temperature_log.TemperatureTrendEstimator(window_size=self._temperature_trend_window, decimals=1)
+        prev_should_heat = False
+        # Recent readings (temperature, should_heat) to be included in the trend warning
+        reference_temperature_log = collections.deque(maxlen=100)
         last_log_state = False  # We want to log "turning heating power on/off" only once
 
+        # We only hold the lock to apply requests and to update the heating state. Sensor
+        # queries and RF transmissions are done without holding the lock, so that
+        # start/stop/shutdown requests never have to wait for (slow) network I/O.
         self._condition_var.acquire()
-        while self._run_heating_loop:
-            # Check if there was an incoming manual/periodic heating request while we slept:
-            if self._start_heating:
-                # Something's changed, let's check how we should heat
-                self._is_heating = True
-                self._start_heating = False
-                # Reset temperature trend warning time
-                self._last_trend_warning_issue_time = None
-
-                if self._target_temperature is not None:
-                    self._controller.set_desired_value(self._target_temperature)
-                    self._controller.set_hysteresis(self._temperature_hysteresis)
-                    use_controller = True
-                    msg = "Starting BangBang to reach {:.1f} +/- {:.1f}° {}as requested by '{:s}'".format(
-                        self._target_temperature, self._temperature_hysteresis,
-                        ' once (stop afterwards) ' if self._reach_temperature_only_once else '',
-                        self._latest_request_by)
-                    logging.getLogger().info('[Heating] ' + msg)
-                    # self._heating_logger.info(msg)
-                else:
-                    use_controller = False
-                    msg = "Starting manually (i.e. always on) as requested by '{:s}'".format(self._latest_request_by)
-                    logging.getLogger().info("[Heating] " + msg)
-                    # self._heating_logger.info(msg)
-
-                if self._heating_duration is None:
-                    self._heating_end_time = None
-                    if not self._reach_temperature_only_once:
-                        msg = "This heating request can only be stopped manually!"
-                        logging.getLogger().info("[Heating] " + msg)
-                        # self._heating_logger.info(msg)
-                else:
-                    self._heating_end_time = time_utils.dt_offset(self._heating_duration)
-                    msg = "This heating request will end at {}".format(time_utils.format(self._heating_end_time))
-                    logging.getLogger().info("[Heating] " + msg)
+        while True:
+            # Apply incoming manual/periodic heating requests which arrived while we slept:
+            self.__apply_commands()
+            if not self._run_heating_loop:
+                break
+            queried_temperature = self._is_heating
+            self._condition_var.release()
 
-            if self._is_heating:
+            if queried_temperature:
                 # Log temperature to see if room temperature actually increases
                 current_temperature = self._zigbee_gateway.query_temperature_for_heating()
 
+            self._condition_var.acquire()
+            # Re-check for requests which arrived while we queried the sensors
+            self.__apply_commands()
+            if not self._run_heating_loop:
+                break
+            is_heating = self._is_heating
+            if is_heating and not queried_temperature:
+                # Heating has just been requested, start over to query the sensors
+                continue
+
+            temperature_error = False
+            if is_heating:
                 # Should we turn the heater on or off?
-                if use_controller:
+                if self._use_controller:
                     if current_temperature is None:
-                        self._broadcaster.error('Ich konnte kein Thermometer abfragen - versuche jetzt, die Heizung einzuschalten.')
+                        temperature_error = True
                         should_heat = True
                         msg = 'Cannot query temperature for bangbang, falling back to turning heating on!'
                         logging.getLogger().error('[Heating] ' + msg)
@@ -389,7 +468,15 @@ class Heating:
                     msg = "Heating request by '{:s}' has timed out, turning off the heater.".format(self._latest_request_by)
                     logging.getLogger().info("[Heating] " + msg)
                     # self._heating_logger.info(msg)
+            else:
+                # We're not heating, so clear the end time
+                self._heating_end_time = None
+            self._condition_var.release()
+
+            if temperature_error:
+                self._broadcaster.error('Ich konnte kein Thermometer abfragen - versuche jetzt, die Heizung einzuschalten.')
 
+            if is_heating:
                 # Tell the zigbee gateway to turn the heater on/off:
                 if should_heat:
                     # Ensure that we only log the heating switch once per heating cycle:
@@ -422,14 +509,21 @@ class Heating:
                         # self._heating_logger.error(msg)
 
                 # Check whether temperature actually increases
+                num_trend_readings += 1
                 reference_temperature_log.append((current_temperature, should_heat))
                 if should_heat:
-                    self.__check_temperature_trend(reference_temperature_log)
+                    if not prev_should_heat:
+                        # Only consider the most recent "should-be-heating" period
+                        trend_estimator.reset()
+                    trend_estimator.add(current_temperature)
+                    self.__check_temperature_trend(num_trend_readings, trend_estimator, reference_temperature_log)
+                prev_should_heat = should_heat
             else:
                 # We're not heating, so clear the temperature log
-                reference_temperature_log = list()
-                # ... similarly, clear the end time
-                self._heating_end_time = None
+                num_trend_readings = 0
+                trend_estimator.reset()
+                prev_should_heat = False
+                reference_temperature_log.clear()
                 # Additionally, we have to ensure that the plug is actually off
                 logging.getLogger().debug('[Heating] Ensuring that LPD433 is turned off.')
                 ret = self._lpd433_gateway.turn_off()
@@ -450,6 +544,11 @@ class Heating:
                 # Mute error broadcast for the next few retrys
                 consecutive_errors = 0
 
+            self._condition_var.acquire()
+            if len(self._commands) > 0:
+                # Requests arrived while we were switching the plugs
+                continue
+
             # Compute idle time (in case this is a timed heating request)
             now = time_utils.dt_now()
             idle_time = self._max_idle_time
@@ -462,46 +561,21 @@ class Heating:
             self._condition_var.wait(idle_time)
 
         self._condition_var.release()
+        # Ensure that the plugs are turned off before we shut down
+        self._lpd433_gateway.turn_off(force=True)
         logging.getLogger().info('[Heating] Heating system has been shut down.')
         # self._heating_logger.info('Shutting down')
 
-    def __compact_temperature_trend_log(self, reference_temperature_log):
-        """Removes duplicate subsequent readings and returns only those
-        from the most recent 'should-be-heating' period.
-        """
-        # Extract only the last "should-be-heating period"
-        last_heating = list()
-        for i in range(len(reference_temperature_log)-1, -1, -1):
-            t, sh = reference_temperature_log[i]
-            if not sh:
-                break
-            last_heating.append(t)
-        num_readings = len(last_heating)
-
-        # Cut off unreliable 1/100th-degree readings and remove duplicate
-        def _round_temp(t):
-            return int(t*10)
-        temperatures = list()
-        prev_rt = None
-        for t in last_heating[::-1]:
-            rt = _round_temp(t)
-            if prev_rt != rt:
-                prev_rt = rt
-                temperatures.append(t)
-        return temperatures, num_readings
-
-    def __check_temperature_trend(self, reference_temperature_log):
+    def __check_temperature_trend(self, num_trend_readings, trend_estimator, reference_temperature_log):
         # For how long have we collected the log?
-        trend_period = len(reference_temperature_log) * self._max_idle_time
+        trend_period = num_trend_readings * self._max_idle_time
         if trend_period >= self._temperature_trend_waiting_time:
-            temperatures, num_readings = self.__compact_temperature_trend_log(reference_temperature_log)
-
             # For how long should we be heating?:
-            trend_period = num_readings * self._max_idle_time
+            trend_period = trend_estimator.num_added * self._max_idle_time
 
-            # Linear regression to determine the slope
-            temperature_slope, determination_coefficient = \
-                temperature_log.compute_temperature_trend(temperatures)
+            # Linear regression (the estimator keeps the running sums) to determine the slope
+            temperature_slope, determination_coefficient = trend_estimator.trend()
+            num_points = trend_estimator.num_points
 
             # Check if there is an actual temperature increase
             if temperature_slope is not None:
@@ -509,11 +583,11 @@ class Heating:
                 # loop iterations. Thus, accumulate it over the most recent
                 # "should-be-heating" period, so we actually see if there is an
                 # increase.
-                temperature_inc = temperature_slope * len(temperatures)
+                temperature_inc = temperature_slope * num_points
                 if temperature_inc < self._temperature_trend_threshold:
                     # If temperature didn't increase (sufficiently), log the error...
                     logging.getLogger().error("[Heating] Temperature change ({:.2f} * {:d} = {:.2f}° with R-squared {:.2f}) too small despite heating for {} seconds".format(
-                        temperature_slope, len(temperatures), temperature_inc, determination_coefficient, trend_period))
+                        temperature_slope, num_points, temperature_inc, determination_coefficient, trend_period))
                     # ... and warn the users (but avoid spamming them)
                     if self._last_trend_warning_issue_time is None or \
                             (time_utils.dt_now() - self._last_trend_warning_issue_time).seconds >= self._temperature_trend_mute_time:
@@ -521,7 +595,7 @@ class Heating:
                         msg = 'Temperatur steigt zu wenig an, {:s}{:s}\u200a° ({:d} x {:s}\u200a°) innerhalb von {}'.format(
                                 '' if temperature_inc < 0 else '+',
                                 common.format_num('.2f', temperature_inc),
-                                len(temperatures),
+                                num_points,
                                 common.format_num('.2f', temperature_slope),
                                 time_utils.format_timedelta(datetime.timedelta(seconds=trend_period))
                             )
@@ -529,7 +603,7 @@ class Heating:
                         # Also send the list of temperatures:
                         # TODO remove once we found suitable threshold/regression parameters?
                         broadcasting.MessageBroadcaster.instance().info(
-                            '```\n' + '\n'.join(['{:.2f}° {:s}'.format(t[0],
+                            '```\n' + '\n'.join(['{:s}° {:s}'.format('n/a' if t[0] is None else '{:.2f}'.format(t[0]),
                             'Heizung an' if t[1] else '') for t in reference_temperature_log]) + '\n```')
 
 
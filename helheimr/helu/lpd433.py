@@ -24,15 +24,19 @@ latest raspbian to get a glimpse of the (currently) necessary
 workarounds needed ;-)
 """
 
+import collections
 import logging
+import threading
+import time
 import traceback
 
 from . import broadcasting
+from . import common
 
 try:
     # Can only be run on Raspberry Pi ;-)
     from rpi_rf import RFDevice
-except RuntimeError:
+except (ImportError, RuntimeError):
     logging.getLogger().error('[LPD433] Can only be run on Raspberry Pi - declaring a dummy RFDevice for debugging now.')
 
     class RFDevice(object):
@@ -62,12 +66,175 @@ class LpdDeviceState(object):
         return '{:s} ist {:s}'.format(self._display_name, 'ein' if self._powered_on else 'aus')
 
 
+class TransmitRequest(object):
+    """A queued transmission. Callers wait() for its result."""
+    def __init__(self, device, code):
+        self.device = device
+        self.code = code
+        self.enqueue_time = time.monotonic()
+        self._success = None
+        self._done = threading.Event()
+
+    def set_result(self, success):
+        self._success = success
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Blocks until the code has been sent, returns True on success,
+        False if it failed or has been superseded by another code for the
+        same device before it was sent (or None upon timeout)."""
+        self._done.wait(timeout)
+        return self._success
+
+
+class Lpd433Transmitter(object):
+    """Worker thread which keeps the RF transmitter open and sends all codes
+    (one after the other) from a single queue.
+
+    The queue holds at most one pending code per device. If a device is
+    switched again before its previous code has been sent (e.g. on, then off),
+    only the latest code will be sent (the superseded request fails). Callers
+    requesting the same code share its result.
+    """
+    def __init__(self, gpio_pin):
+        self._gpio_pin = gpio_pin
+        self._pending = collections.OrderedDict()  # Device => TransmitRequest
+        self._condition_var = threading.Condition()
+        self._run_worker = True
+        self._num_transmitted = 0
+        self._num_coalesced = 0
+        self._num_failed = 0
+        self._max_queue_depth = 0
+        self._last_latency = None   # Seconds from enqueueing until the code has been sent
+        self._total_latency = 0.0
+        self._worker_thread = threading.Thread(target=self.__transmit_loop, daemon=True)
+        self._worker_thread.start()
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    @property
+    def max_queue_depth(self):
+        return self._max_queue_depth
+
+    @property
+    def num_transmitted(self):
+        return self._num_transmitted
+
+    @property
+    def num_coalesced(self):
+        """Number of codes which have been superseded before we sent them."""
+        return self._num_coalesced
+
+    @property
+    def num_failed(self):
+        return self._num_failed
+
+    @property
+    def last_latency(self):
+        return self._last_latency
+
+    @property
+    def mean_latency(self):
+        if self._num_transmitted == 0:
+            return None
+        return self._total_latency / self._num_transmitted
+
+    def send(self, device, code):
+        """Enqueues the code, returns the TransmitRequest to wait() for."""
+        self._condition_var.acquire()
+        try:
+            if not self._run_worker:
+                raise RuntimeError('[LPD433] Transmitter has already been stopped')
+            previous = self._pending.get(device)
+            if previous is not None and previous.code == code:
+                # Already queued
+                self._num_coalesced += 1
+                return previous
+            request = TransmitRequest(device, code)
+            # Replacing a pending request keeps its position in the queue
+            self._pending[device] = request
+            if previous is None:
+                self._max_queue_depth = max(self._max_queue_depth, len(self._pending))
+                self._condition_var.notify()
+            else:
+                # Not sent yet, so the latest command wins
+                self._num_coalesced += 1
+                previous.set_result(False)
+            return request
+        finally:
+            self._condition_var.release()
+
+    def stop(self):
+        """Sends the pending codes, then releases the transmitter."""
+        self._condition_var.acquire()
+        self._run_worker = False
+        self._condition_var.notify()
+        self._condition_var.release()
+        self._worker_thread.join()
+
+    def __open_device(self):
+        try:
+            rfdevice = RFDevice(self._gpio_pin)
+            rfdevice.enable_tx()
+            return rfdevice
+        except:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error("[LPD433] Cannot set up the transmitter: " + err_msg)
+            broadcasting.MessageBroadcaster.instance().error('Fehler beim Initialisieren des LPD433 Senders:\n' + err_msg)
+            return None
+
+    def __transmit_loop(self):
+        rfdevice = None
+        while True:
+            self._condition_var.acquire()
+            while self._run_worker and len(self._pending) == 0:
+                self._condition_var.wait()
+            if len(self._pending) == 0:
+                # Stopped and everything has been sent
+                self._condition_var.release()
+                break
+            device, request = self._pending.popitem(last=False)
+            code = request.code
+            self._condition_var.release()
+
+            if rfdevice is None:
+                rfdevice = self.__open_device()
+            success = rfdevice is not None and device.transmit(rfdevice, code)
+            if not success and rfdevice is not None:
+                # Set up the transmitter from scratch for the next code
+                self.__close_device(rfdevice)
+                rfdevice = None
+            device.update_state(code, success)
+
+            latency = time.monotonic() - request.enqueue_time
+            self._condition_var.acquire()
+            self._num_transmitted += 1
+            if not success:
+                self._num_failed += 1
+            self._last_latency = latency
+            self._total_latency += latency
+            self._condition_var.release()
+            request.set_result(success)
+
+        if rfdevice is not None:
+            self.__close_device(rfdevice)
+
+    def __close_device(self, rfdevice):
+        try:
+            rfdevice.cleanup()
+        except:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error("[LPD433] Error while releasing the transmitter: " + err_msg)
+
+
 class LpdDevice(object):
     """Abstraction of an LPD433 device (i.e. a power plug).
     Use this to turn the device on/off.
     """
-    def __init__(self, gpio_pin, cfg_entry):
-        self._gpio_pin = gpio_pin
+    def __init__(self, transmitter, cfg_entry):
+        self._transmitter = transmitter
         self._display_name = cfg_entry['display_name']
         self._protocol = cfg_entry['protocol']
         self._send_repeat = cfg_entry['send_repeat']
@@ -76,6 +243,12 @@ class LpdDevice(object):
         self._code_on = cfg_entry['code_on']
         self._code_off = cfg_entry['code_off']
         self._powered_on = False
+        # Bookkeeping for the refresh policy
+        self._requested_code = None    # Most recently enqueued code
+        self._last_sent_time = None    # time.monotonic() when the requested code has been sent successfully
+        self._last_send_failed = False
+        self._num_sent = 0
+        self._num_skipped = 0          # Requests we didn't transmit (state has been asserted recently)
 
     def __str__(self):
         return '{:s} is {:s}'.format(self._display_name, 'on' if self._powered_on else 'off')
@@ -91,26 +264,76 @@ class LpdDevice(object):
     def powered_on(self):
         return self._powered_on
 
+    @property
+    def num_sent(self):
+        return self._num_sent
+
+    @property
+    def num_skipped(self):
+        return self._num_skipped
+
+    @property
+    def seconds_since_last_sent(self):
+        """Seconds since the current state has been sent (None if it hasn't been sent yet)."""
+        if self._last_sent_time is None:
+            return None
+        return time.monotonic() - self._last_sent_time
+
+    def __needs_transmission(self, code, refresh_interval):
+        if refresh_interval is None or refresh_interval <= 0:
+            return True
+        if code != self._requested_code or self._last_send_failed:
+            return True
+        if self._last_sent_time is None:
+            # The code is still queued
+            return False
+        return time.monotonic() - self._last_sent_time >= refresh_interval
+
+    def __request(self, code, refresh_interval, force):
+        if not force and not self.__needs_transmission(code, refresh_interval):
+            self._num_skipped += 1
+            return None
+        if code != self._requested_code:
+            self._last_sent_time = None
+        self._requested_code = code
+        return self._transmitter.send(self, code)
+
+    def request_on(self, refresh_interval=None, force=False):
+        """Enqueues the 'on' code, returns the lpd433.TransmitRequest. If the
+        plug has already been turned on successfully within the past
+        refresh_interval seconds, nothing is sent and we return None."""
+        return self.__request(self._code_on, refresh_interval, force)
+
+    def request_off(self, refresh_interval=None, force=False):
+        """Enqueues the 'off' code, see request_on()."""
+        return self.__request(self._code_off, refresh_interval, force)
+
     def turn_on(self):
-        self._powered_on = self.__send_code(self._code_on)
-        return self._powered_on
+        """Returns True if the 'on' code has been sent, False if it failed or
+        has been superseded by a subsequent turn_off()."""
+        return self.request_on().wait()
 
     def turn_off(self):
-        success = self.__send_code(self._code_off)
-        if success:
+        return self.request_off().wait()
+
+    def update_state(self, code, success):
+        """Called by the transmitter once the code has been sent."""
+        if code == self._code_on:
+            self._powered_on = success
+        elif success:
             self._powered_on = False
-        return success
+        self._num_sent += 1
+        self._last_send_failed = not success
+        self._last_sent_time = time.monotonic() if success else None
 
-    def __send_code(self, code):
+    def transmit(self, rfdevice, code):
+        """Sends the code via the given (already enabled) RFDevice."""
         try:
             logging.getLogger().debug("[LPD433] Sending '{} ({:s})' to '{}'".format(code,
                 'on' if code == self._code_on else 'off',
                 self._display_name))
-            rfdevice = RFDevice(self._gpio_pin)
-            rfdevice.enable_tx()
             rfdevice.tx_repeat = self._send_repeat
             rfdevice.tx_code(code, self._protocol, self._pulse_length, self._code_length)
-            rfdevice.cleanup()
             return True
         except:
             err_msg = traceback.format_exc(limit=3)
@@ -125,28 +348,57 @@ class Lpd433Wrapper(object):
         # GPIO pin number to send the radio data.
         self._tx_gpio_pin = cfg['lpd433']['gpio_pin_tx']
 
+        # All codes are sent by a single worker (which keeps the transmitter open)
+        self._transmitter = Lpd433Transmitter(self._tx_gpio_pin)
+
+        # Codes are sent upon state changes. Afterwards, the state is only re-asserted
+        # every X minutes (or after a transmission error). 0 sends each request.
+        self._refresh_interval = 60 * common.cfg_val_or_default(cfg['lpd433'], 'refresh_interval_minutes', 10)
+
         # Configuration of the plugs used to turn the heating on/off.
         self._heating_plugs = [
-            LpdDevice(self._tx_gpio_pin, cfg['lpd433']['heating']['plugs'][k])
+            LpdDevice(self._transmitter, cfg['lpd433']['heating']['plugs'][k])
             for k in cfg['lpd433']['heating']['plugs']]
 
         # Establish a "known" state (we'll never know for sure, but
         # from our experiments, FS1000A + antenna and 10 repeats will
         # switch any LPD433 in our flat, no matter what's in between tx/rx ;-)
-        self.turn_off()
+        self.turn_off(force=True)
         for h in self._heating_plugs:
             logging.getLogger().info('[LPD433] Initialized plug: {}'.format(h))
 
-    def turn_on(self):
-        """Send 'on' command to all plugs configured as 'heating'."""
-        success = [d.turn_on() for d in self._heating_plugs]
+    def turn_on(self, force=False):
+        """Send 'on' command to all plugs configured as 'heating' (unless they have
+        been turned on recently, see refresh_interval_minutes)."""
+        requests = [d.request_on(self._refresh_interval, force) for d in self._heating_plugs]
+        # Skipped requests (None) succeeded the last time
+        success = [r.wait() for r in requests if r is not None]
         return all(success)
 
-    def turn_off(self):
-        """Send 'off' command to all plugs configured as 'heating'."""
-        success = [d.turn_off() for d in self._heating_plugs]
+    def turn_off(self, force=False):
+        """Send 'off' command to all plugs configured as 'heating' (unless they have
+        been turned off recently, see refresh_interval_minutes)."""
+        requests = [d.request_off(self._refresh_interval, force) for d in self._heating_plugs]
+        success = [r.wait() for r in requests if r is not None]
         return all(success)
 
+    def shutdown(self):
+        """Sends the pending codes and releases the transmitter."""
+        self._transmitter.stop()
+
+    def query_transmitter_details(self):
+        """:return: Status line (queue depth, latency, etc.) of the transmitter."""
+        t = self._transmitter
+        mean_latency = t.mean_latency
+        return '\u2022 LPD433 Sender: {} gesendet ({} fehlgeschlagen), {} übersprungen, {} zusammengefasst, Warteschlange {} (max. {}), Latenz {}'.format(
+            common.format_num('d', t.num_transmitted),
+            common.format_num('d', t.num_failed),
+            common.format_num('d', sum([d.num_skipped for d in self._heating_plugs])),
+            common.format_num('d', t.num_coalesced),
+            common.format_num('d', t.queue_depth),
+            common.format_num('d', t.max_queue_depth),
+            '-' if mean_latency is None else common.format_num('.2f', mean_latency) + '\u200as')
+
     def query_heating(self):
         """Query state of the devices - since LPD433 doesn't transmit anything,
         we have to rely on software state monitoring (i.e. upon start up, all
@@ -5,61 +5,148 @@
 import os
 import logging
 import requests
+import requests.adapters
 import subprocess
+import threading
 import traceback
+import urllib.parse
 
+from . import common
 from . import heating
 from . import raspbee
-from . import telegram_bot
 
 # TODO 
 # * Replace network check (ping) by more efficient socket approach https://stackoverflow.com/a/33117579
 # * exception handling in hel (e.g. all initializations upon (re)start)
 # * reconnect telegram: journalctl --since "2 hours ago" -u helheimr-heating.service | grep telegram.error.NetworkError
 
-def safe_http_get(url, headers=None, params=None, timeout=2.0, verify=True):
+
+# The session pool is created lazily by the first thread issuing a request (unless
+# hel initialized it), so its creation must be synchronized
+_session_pool_lock = threading.Lock()
+
+
+class HttpSessionPool:
+    """Keeps a persistent requests.Session (i.e. keep-alive connections) per host,
+    so we don't pay the TCP (and TLS) connection setup for every single request."""
+    __instance = None
+
+    DEFAULT_TIMEOUT = 2.0         # Request timeout (in sec) unless configured otherwise
+    DEFAULT_POOL_CONNECTIONS = 1  # Number of connection pools (per session, i.e. per host)
+    DEFAULT_POOL_MAXSIZE = 4      # Max. number of connections to keep alive per host
+
+    @staticmethod
+    def instance():
+        """Returns the singleton (falls back to the default configuration if it hasn't been initialized)."""
+        if HttpSessionPool.__instance is None:
+            with _session_pool_lock:
+                if HttpSessionPool.__instance is None:
+                    HttpSessionPool(None)
+        return HttpSessionPool.__instance
+
+    @staticmethod
+    def init_instance(ctrl_cfg):
+        """Initialize the singleton using the 'network' section of the given configuration."""
+        with _session_pool_lock:
+            if HttpSessionPool.__instance is None:
+                HttpSessionPool(ctrl_cfg)
+        return HttpSessionPool.__instance
+
+    def __init__(self, ctrl_cfg):
+        """Virtually private constructor, use HttpSessionPool.init_instance() instead."""
+        if HttpSessionPool.__instance is not None:
+            raise RuntimeError("HttpSessionPool is a singleton!")
+
+        http_cfg = None
+        if ctrl_cfg is not None and 'network' in ctrl_cfg:
+            http_cfg = common.cfg_val_or_none(ctrl_cfg['network'], 'http')
+        if http_cfg is None:
+            http_cfg = dict()
+        self._default_timeout = common.cfg_val_or_default(http_cfg, 'default_timeout', type(self).DEFAULT_TIMEOUT)
+        self._pool_connections = common.cfg_val_or_default(http_cfg, 'pool_connections', type(self).DEFAULT_POOL_CONNECTIONS)
+        self._pool_maxsize = common.cfg_val_or_default(http_cfg, 'pool_maxsize', type(self).DEFAULT_POOL_MAXSIZE)
+        # Per-host default timeouts, configured as list of {host = "..."; timeout = X;}
+        self._host_timeouts = {
+            ht['host']: ht['timeout'] for ht in common.cfg_val_or_default(http_cfg, 'timeouts', list())}
+
+        self._sessions = dict()  # Maps 'scheme://host:port' to its requests.Session
+        self._lock = threading.Lock()
+        # Publish the singleton once it's fully set up (instance() doesn't lock if it exists)
+        HttpSessionPool.__instance = self
+
+    @staticmethod
+    def __session_key(url):
+        parsed = urllib.parse.urlsplit(url)
+        return '{:s}://{:s}'.format(parsed.scheme, parsed.netloc), parsed.hostname
+
+    def default_timeout(self, url):
+        """Returns the configured timeout (in sec) for the host of the given url."""
+        _, host = type(self).__session_key(url)
+        return self._host_timeouts.get(host, self._default_timeout)
+
+    def session(self, url):
+        """Returns the (persistent) session to be used for the given url."""
+        key, _ = type(self).__session_key(url)
+        self._lock.acquire()
+        try:
+            if key not in self._sessions:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize)
+                session.mount(key, adapter)
+                self._sessions[key] = session
+                logging.getLogger().info('[HttpSessionPool] Opened persistent session for {:s}.'.format(key))
+            return self._sessions[key]
+        finally:
+            self._lock.release()
+
+    def get(self, url, timeout=None, **kwargs):
+        """requests.get() via the host's persistent session."""
+        if timeout is None:
+            timeout = self.default_timeout(url)
+        return self.session(url).get(url, timeout=timeout, **kwargs)
+
+    def put(self, url, data=None, timeout=None, **kwargs):
+        """requests.put() via the host's persistent session."""
+        if timeout is None:
+            timeout = self.default_timeout(url)
+        return self.session(url).put(url, data=data, timeout=timeout, **kwargs)
+
+    def close(self):
+        """Closes all sessions (and thus, their kept-alive connections)."""
+        self._lock.acquire()
+        sessions = list(self._sessions.values())
+        self._sessions = dict()
+        self._lock.release()
+        for session in sessions:
+            session.close()
+
+
+def safe_http_get(url, headers=None, params=None, timeout=None, verify=True):
     """
     Performs a GET request at the given url (string) with the given headers and parameters
     and returns the response if one was received within timeout (float) seconds. Otherwise,
-    returns None.
+    returns None. If timeout is None, the host's default timeout will be used.
     """
     try:
-        if headers is None:
-            if params is None:
-                r = requests.get(url, timeout=timeout, verify=verify)
-            else:
-                r = requests.get(url, params=params, timeout=timeout, verify=verify)
-        else:
-            if params is None:
-                r = requests.get(url, headers=headers, timeout=timeout, verify=verify)
-            else:
-                r = requests.get(url, headers=headers, params=params, timeout=timeout, verify=verify)
-        return r
+        return HttpSessionPool.instance().get(url, headers=headers, params=params, timeout=timeout, verify=verify)
     except:
         err_msg = traceback.format_exc(limit=3)
         logging.getLogger().error("Error HTTP GETting from '{}':\n{}".format(url, err_msg))
         return None
 
 
-def http_get_request(url, timeout=2.0):
+def http_get_request(url, timeout=None):
     """
     Performs a GET request at the given url (string) and returns the response if one
     was received within timeout (float) seconds. Otherwise, returns None.
     """
     return safe_http_get(url, None, None, timeout)
-    # try:
-    #     r = requests.get(url, timeout=timeout)
-    #     return r
-    # except:
-    #     err_msg = traceback.format_exc(limit=3)
-    #     logging.getLogger().error("Error HTTP GETting from '{}':\n{}".format(url, err_msg))
-    #     return None
 
 
-def http_put_request(url, data, timeout=2.0):
+def http_put_request(url, data, timeout=None):
     try:
-        r = requests.put(url, data=data, timeout=timeout)
-        return r
+        return HttpSessionPool.instance().put(url, data=data, timeout=timeout)
     except:
         err_msg = traceback.format_exc(limit=3)
         logging.getLogger().error("Error HTTP PUTting to '{}':\n{}".format(url, err_msg))
@@ -117,6 +204,7 @@ class ConnectionTester:
         self._known_hosts_internet = self.__load_known_hosts(cfg['control']['network']['internet'])
 
         # TODO Add service URLs if needed
+        from . import telegram_bot  # Imported on demand (python-telegram-bot is slow to load)
         self._known_service_urls = {
             'Telegram API': telegram_bot.get_bot_url(cfg['telegram']),
             'deCONZ API': raspbee.get_api_url(cfg['control'])
@@ -158,4 +246,5 @@ class ConnectionTester:
             msg.append(heating.Heating.instance().query_deconz_status())
         else:
             msg.append('*Heizung:*\n\u2022 deCONZ API ist offline :bangbang:')
+        msg.append(heating.Heating.instance().query_lpd433_status())
         return all_online, '\n'.join(msg)
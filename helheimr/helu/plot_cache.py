@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# coding=utf-8
+"""LRU cache for rendered (encoded) plots."""
+
+import collections
+import io
+import threading
+
+
+class PlotCache:
+    """Keeps the most recently used encoded images (bytes) up to a total size
+    of max_bytes. Keys must be hashable and should include everything the
+    image depends on (i.e. the plot parameters and the data version).
+    """
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._entries = collections.OrderedDict()  # Key => (bytes, memfile name), least recently used first
+        self._num_bytes = 0
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def num_bytes(self):
+        return self._num_bytes
+
+    @property
+    def num_hits(self):
+        return self._num_hits
+
+    @property
+    def num_misses(self):
+        return self._num_misses
+
+    @property
+    def num_evictions(self):
+        return self._num_evictions
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns a new BytesIO holding the cached image or None."""
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._num_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._num_hits += 1
+        finally:
+            self._lock.release()
+        return _to_memfile(*entry)
+
+    def put(self, key, memfile):
+        """Caches the content of the given BytesIO (which is left untouched).
+        Images larger than the whole budget are not cached."""
+        data = memfile.getvalue()
+        if len(data) > self._max_bytes:
+            return
+        self._lock.acquire()
+        try:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._num_bytes -= len(previous[0])
+            self._entries[key] = (data, getattr(memfile, 'name', None))
+            self._num_bytes += len(data)
+            while self._num_bytes > self._max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._num_bytes -= len(evicted)
+                self._num_evictions += 1
+        finally:
+            self._lock.release()
+
+    def get_or_render(self, key, render_fn):
+        """Returns the cached image or calls render_fn (which must return a
+        BytesIO or None upon errors) and caches its result."""
+        memfile = self.get(key)
+        if memfile is not None:
+            return memfile
+        memfile = render_fn()
+        if memfile is not None:
+            self.put(key, memfile)
+        return memfile
+
+    def clear(self):
+        self._lock.acquire()
+        self._entries.clear()
+        self._num_bytes = 0
+        self._lock.release()
+
+
+def _to_memfile(data, name):
+    memfile = io.BytesIO(data)
+    if name is not None:
+        memfile.name = name
+    return memfile
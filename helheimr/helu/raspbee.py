@@ -15,12 +15,19 @@ plugs. The only downside is, that we don't know the current
 state of the plug.
 """
 
+import copy
 import json
 import logging
+import os
+import threading
 import time
+import traceback
+
+import websocket
 
 from . import common
 from . import network_utils
+from . import time_utils
 
 
 class PlugState:
@@ -145,6 +152,315 @@ class TemperatureState:
         return merged
 
 
+class DeconzIdMapping:
+    """Maps the deCONZ names of our plugs/sensors to their deCONZ IDs, plus
+    reverse indexes (ID => name). Instances are never modified, so the wrapper
+    swaps the whole mapping at once and readers always see a consistent one.
+    """
+    def __init__(self, plugs=None, sensors=None):
+        self._plugs = dict() if plugs is None else plugs        # Plug name => ID
+        self._sensors = dict() if sensors is None else sensors  # Sensor name => list of IDs (temperature, humidity, pressure)
+        self._plug_names_by_id = {rid: name for name, rid in self._plugs.items()}
+        self._sensor_names_by_id = {rid: name for name, rids in self._sensors.items() for rid in rids}
+        self._sensor_ids = [rid for rids in self._sensors.values() for rid in rids]
+
+    @property
+    def plugs(self):
+        return self._plugs
+
+    @property
+    def sensors(self):
+        return self._sensors
+
+    @property
+    def plug_ids(self):
+        return list(self._plugs.values())
+
+    @property
+    def sensor_ids(self):
+        return list(self._sensor_ids)
+
+    def plug_name(self, raspbee_id):
+        """Returns the plug's deCONZ name or None."""
+        return self._plug_names_by_id.get(raspbee_id)
+
+    def sensor_name(self, raspbee_id):
+        """Returns the sensor's deCONZ name or None."""
+        return self._sensor_names_by_id.get(raspbee_id)
+
+    def __eq__(self, other):
+        return isinstance(other, DeconzIdMapping) and \
+            self._plugs == other._plugs and self._sensors == other._sensors
+
+    def __ne__(self, other):
+        return not self == other
+
+    def save(self, filename):
+        """Stores the mapping as JSON (written to a temporary file first)."""
+        tmp_filename = filename + '.tmp'
+        try:
+            with open(tmp_filename, 'w') as f:
+                json.dump({'plugs': self._plugs, 'sensors': self._sensors}, f, indent=2)
+            os.replace(tmp_filename, filename)
+        except:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error('[DeconzIdMapping] Cannot save deCONZ IDs to {:s}:\n{:s}'.format(filename, err_msg))
+
+    @staticmethod
+    def load(filename, plug_names, sensor_names):
+        """Loads a stored mapping (restricted to the currently configured
+        plug/sensor names) or returns None."""
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+            plugs = {name: rid for name, rid in data['plugs'].items() if name in plug_names}
+            sensors = {name: list(rids) for name, rids in data['sensors'].items() if name in sensor_names}
+            return DeconzIdMapping(plugs, sensors)
+        except:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error('[DeconzIdMapping] Cannot load deCONZ IDs from {:s}:\n{:s}'.format(filename, err_msg))
+            return None
+
+
+class DeconzSensorListener:
+    """Subscribes to deCONZ's websocket event stream and keeps the
+    latest state of the given sensor IDs in memory.
+
+    The table is (re-)initialized from the REST API upon each
+    (re-)connect (via the given seed function which must return the
+    /sensors dict or None) and afterwards only updated by push events.
+    """
+    def __init__(self, ws_url, sensor_ids, seed_fn, reconnect_time=30):
+        self._ws_url = ws_url
+        self._sensor_ids = set(sensor_ids)
+        self._seed_fn = seed_fn
+        self._reconnect_time = reconnect_time
+        self._sensors = dict()         # Maps deCONZ sensor ID to its latest (REST-like) state dict
+        self._is_synchronized = False  # Only use the table if it has been seeded while connected
+        self._num_events = 0
+        self._ws_app = None
+        self._lock = threading.Lock()
+        self._run_listener = True
+        self._stop_event = threading.Event()
+        self._listener_thread = threading.Thread(target=self.__listener_loop)
+        self._listener_thread.daemon = True
+
+    @property
+    def is_synchronized(self):
+        return self._is_synchronized
+
+    @property
+    def num_events(self):
+        """Number of processed sensor events."""
+        return self._num_events
+
+    def start(self):
+        self._listener_thread.start()
+
+    def stop(self):
+        self._run_listener = False
+        self._stop_event.set()
+        ws_app = self._ws_app
+        if ws_app is not None:
+            ws_app.close()
+        self._listener_thread.join(timeout=5)
+
+    def sensor_states(self):
+        """Returns a copy of the latest sensor dicts (deCONZ ID => dict) or
+        None if the table is not synchronized (i.e. use the REST API instead)."""
+        self._lock.acquire()
+        try:
+            if not self._is_synchronized or any([sid not in self._sensors for sid in self._sensor_ids]):
+                return None
+            return {sid: copy.deepcopy(self._sensors[sid]) for sid in self._sensor_ids}
+        finally:
+            self._lock.release()
+
+    def __listener_loop(self):
+        while self._run_listener:
+            self._ws_app = websocket.WebSocketApp(
+                self._ws_url,
+                on_open=self.__on_open,
+                on_message=self.__on_message,
+                on_error=self.__on_error,
+                on_close=self.__on_close)
+            try:
+                self._ws_app.run_forever()
+            except:
+                err_msg = traceback.format_exc(limit=3)
+                logging.getLogger().error('[DeconzSensorListener] Websocket terminated unexpectedly:\n' + err_msg)
+            self.__invalidate()
+            if self._run_listener:
+                logging.getLogger().warning(
+                    '[DeconzSensorListener] Lost connection to {:s}, reconnecting in {} seconds.'.format(
+                        self._ws_url, self._reconnect_time))
+                self._stop_event.wait(self._reconnect_time)
+        logging.getLogger().info('[DeconzSensorListener] Listener has been shut down.')
+
+    def __invalidate(self):
+        self._lock.acquire()
+        self._is_synchronized = False
+        self._lock.release()
+
+    def __on_open(self, ws):
+        # We may have missed events while we were disconnected, so start
+        # from a full REST snapshot:
+        sensors = self._seed_fn()
+        if sensors is None:
+            # Events alone would never complete the table, so reconnect (and re-seed) later on
+            logging.getLogger().error('[DeconzSensorListener] Cannot seed sensor states, falling back to REST queries until we reconnected.')
+            ws.close()
+            return
+        self._lock.acquire()
+        self._sensors = {sid: copy.deepcopy(sensors[sid]) for sid in self._sensor_ids if sid in sensors}
+        self._is_synchronized = True
+        self._lock.release()
+        logging.getLogger().info('[DeconzSensorListener] Connected to {:s}, tracking {:d} sensor IDs.'.format(
+            self._ws_url, len(self._sensors)))
+
+    def __on_message(self, ws, message):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            logging.getLogger().error('[DeconzSensorListener] Cannot decode event: {}'.format(message))
+            return
+        if event.get('t') != 'event' or event.get('r') != 'sensors':
+            return
+        sid = str(event.get('id'))
+        if sid not in self._sensor_ids:
+            return
+
+        self._lock.acquire()
+        if event.get('e') == 'added' and 'sensor' in event:
+            self._sensors[sid] = event['sensor']
+        elif event.get('e') == 'changed' and sid in self._sensors:
+            # Changed events only contain the modified state and/or config attributes
+            for group in ['state', 'config']:
+                if group in event:
+                    self._sensors[sid].setdefault(group, dict()).update(event[group])
+        elif event.get('e') == 'deleted':
+            self._sensors.pop(sid, None)
+        self._num_events += 1
+        self._lock.release()
+
+    def __on_error(self, ws, error):
+        if not ws.keep_running:
+            # We closed the connection on purpose (shutdown or failed seeding)
+            return
+        logging.getLogger().error('[DeconzSensorListener] Websocket error: {}'.format(error))
+
+    def __on_close(self, ws, *args):
+        self.__invalidate()
+
+
+class SensorStateCache:
+    """Thread-safe cache for the latest sensor readings.
+
+    Readings younger than max_age seconds are served from memory. If the
+    cache is outdated, only the first caller fetches new readings (via
+    fetch_fn, which must return None upon failure); concurrent callers
+    wait for and share this in-flight result.
+    """
+    def __init__(self, fetch_fn, max_age):
+        self._fetch_fn = fetch_fn
+        self._max_age = max_age
+        self._value = None            # Last successful fetch result
+        self._value_time = None       # time.monotonic() of the last successful fetch
+        self._last_update = None      # Wall-clock timestamp of the last successful fetch (for reports)
+        self._last_result = None      # Result of the last fetch (may be None), shared with waiting callers
+        self._is_fetching = False
+        self._generation = 0          # Incremented after each fetch, so waiting callers know when to wake up
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_shared = 0          # Callers which waited for an in-flight fetch
+        self._num_failed = 0
+        self._condition_var = threading.Condition()
+
+    @property
+    def max_age(self):
+        return self._max_age
+
+    @property
+    def num_hits(self):
+        return self._num_hits
+
+    @property
+    def num_misses(self):
+        return self._num_misses
+
+    @property
+    def num_shared(self):
+        return self._num_shared
+
+    @property
+    def num_failed(self):
+        return self._num_failed
+
+    @property
+    def last_update(self):
+        """Timestamp (time_utils.dt_now()) of the last successful fetch or None."""
+        return self._last_update
+
+    @property
+    def age(self):
+        """Age of the cached readings in seconds or None if there are none."""
+        if self._value_time is None:
+            return None
+        return time.monotonic() - self._value_time
+
+    @property
+    def is_stale(self):
+        age = self.age
+        return age is None or age > self._max_age
+
+    def invalidate(self):
+        self._condition_var.acquire()
+        self._value_time = None
+        self._condition_var.release()
+
+    def get(self, max_age=None):
+        """Returns the cached readings if they are younger than max_age
+        (defaults to the configured maximum age), fetches new ones otherwise."""
+        if max_age is None:
+            max_age = self._max_age
+        self._condition_var.acquire()
+        try:
+            if self._value_time is not None and time.monotonic() - self._value_time <= max_age:
+                self._num_hits += 1
+                return list(self._value)
+            if self._is_fetching:
+                # Someone else is already querying the sensors, wait for the result
+                self._num_shared += 1
+                generation = self._generation
+                while self._generation == generation:
+                    self._condition_var.wait()
+                return None if self._last_result is None else list(self._last_result)
+            self._is_fetching = True
+            self._num_misses += 1
+        finally:
+            self._condition_var.release()
+
+        result = None
+        try:
+            result = self._fetch_fn()
+        finally:
+            self._condition_var.acquire()
+            self._is_fetching = False
+            self._generation += 1
+            self._last_result = result
+            if result is None:
+                self._num_failed += 1
+            else:
+                self._value = result
+                self._value_time = time.monotonic()
+                self._last_update = time_utils.dt_now()
+            self._condition_var.notify_all()
+            self._condition_var.release()
+        return None if result is None else list(result)
+
+
 def get_api_url(cfg):
     gateway = cfg['raspbee']['deconz']['gateway']
     tcp_port = cfg['raspbee']['deconz']['port']
@@ -163,11 +479,10 @@ class RaspBeeWrapper:
                 cfg['raspbee']['heating']['plug_names'][k]: cfg['raspbee']['heating']['display_names'][k]
                     for k in cfg['raspbee']['heating']['plug_names']
             }
-            # Map deconz plug name to deconz ID
-            self._heating_plug_raspbee_name_mapping = self.__map_deconz_heating_plugs(cfg)
             self._heating_disabled = False
         else:
             logging.getLogger().warning('[RaspbeeWrapper] No ZigBee heating plugs configured!')
+            self._heating_plug_display_name_mapping = dict()
             self._heating_disabled = True
 
         # ####### Temperature sensors
@@ -177,35 +492,71 @@ class RaspBeeWrapper:
                 for k in cfg['raspbee']['temperature']['display_names']
         }
 
-        # Map deconz sensor name to deconz ID
-        self._temperature_sensor_raspbee_name_mapping = self.__map_deconz_temperature_sensors(cfg)
+        # Map deconz plug/sensor names to deconz IDs. Upon system reboot, deCONZ may take a while to
+        # come up. Thus, we start with the IDs we stored last time and (re-)discover them in the
+        # background (and keep retrying), so the heating can be controlled right away. Without
+        # stored IDs, temperature queries fail until the discovery succeeds.
+        self._sensors_discovered = threading.Event()
+        self._shutdown_event = threading.Event()
+        self._discovery_retry_interval = common.cfg_val_or_default(cfg['raspbee']['temperature'], 'discovery_retry_interval', 30)
+        self._id_cache_file = common.cfg_val_or_default(cfg['raspbee']['deconz'], 'id_cache_file', 'deconz-ids.json')
+        self._id_mapping = None
+        if self._id_cache_file:
+            self._id_cache_file = common.config_path(self._id_cache_file)
+            self._id_mapping = DeconzIdMapping.load(self._id_cache_file,
+                self._heating_plug_display_name_mapping, self._temperature_sensor_display_name_mapping)
+        if self._id_mapping is None:
+            self._id_mapping = DeconzIdMapping()
+        else:
+            logging.getLogger().info('[RaspBeeWrapper] Using {:d} stored plug and {:d} sensor ID mapping(s) until deCONZ confirms them.'.format(
+                len(self._id_mapping.plugs), len(self._id_mapping.sensors)))
+            self._sensors_discovered.set()
 
         # Load ordering of temperature sensors to query for heating-reference-temperature (heating
         # will be stopped, once this sensor reports the configured temperature)
         self._heating_preferred_reference_temperature_sensor_order = \
             cfg['raspbee']['temperature']['preferred_heating_reference']
 
+        # Query all sensors via a single GET /sensors instead of one request per sensor ID
+        self._use_bulk_query = common.cfg_val_or_default(cfg['raspbee']['temperature'], 'bulk_query', True)
+        self._num_saved_requests = 0  # Number of HTTP requests saved by bulk/websocket queries (for status reports)
+
+        # Share recent sensor readings between the heating loop, temperature log, bot, etc.
+        self._temperature_cache = SensorStateCache(
+            self.__fetch_temperature,
+            common.cfg_val_or_default(cfg['raspbee']['temperature'], 'cache_max_age', 10))
+
+        # Optionally, keep the sensor states up-to-date via deCONZ's websocket (push) events
+        # (we subscribe from the discovery thread once the sensors are known, as this may
+        # require querying the gateway)
+        self._sensor_listener = None
+        self._use_websocket = common.cfg_val_or_default(cfg['raspbee']['deconz'], 'use_websocket', False)
+
+        self._discovery_thread = threading.Thread(target=self.__discover_id_mapping, args=(cfg,), daemon=True)
+        self._discovery_thread.start()
+
     @property
     def api_url(self):
         return self._api_url
 
     def __lookup_heating_display_name(self, raspbee_id):
-        for lbl, rid in self._heating_plug_raspbee_name_mapping.items():
-            if rid == raspbee_id:
-                return self._heating_plug_display_name_mapping[lbl]
-        return 'ID {}'.format(raspbee_id)
+        lbl = self._id_mapping.plug_name(raspbee_id)
+        if lbl is None:
+            return 'ID {}'.format(raspbee_id)
+        return self._heating_plug_display_name_mapping[lbl]
 
     def __lookup_temperature_display_name(self, raspbee_id):
-        for lbl, rids in self._temperature_sensor_raspbee_name_mapping.items():
-            if raspbee_id in rids:
-                return self._temperature_sensor_display_name_mapping[lbl]
-        return 'ID {}'.format(raspbee_id)
+        lbl = self._id_mapping.sensor_name(raspbee_id)
+        if lbl is None:
+            return 'ID {}'.format(raspbee_id)
+        return self._temperature_sensor_display_name_mapping[lbl]
 
     def __map_deconz_heating_plugs(self, cfg):
+        """Returns the mapping (deCONZ plug name => ID) or None if the gateway is unavailable."""
         # Our 'smart' plugs are linked to the zigbee gateway as "lights"
         r = network_utils.http_get_request(self.api_url + '/lights')
         if r is None:
-            return dict()
+            return None
 
         lights = json.loads(r.content)
         logger = logging.getLogger()
@@ -221,25 +572,55 @@ class RaspBeeWrapper:
                 mapping[light['name']] = raspbee_id
         return mapping
 
-    def __map_deconz_temperature_sensors(self, cfg):
-        # Upon system reboot, deCONZ may take a while to come up. Thus,
-        # we retry the sensor query for up to 3 minutes.
+    def __discover_id_mapping(self, cfg):
+        """Retries the plug/sensor mapping until deCONZ responds (or we shut down)."""
         logger = logging.getLogger()
+        if self._use_websocket and self._sensors_discovered.is_set():
+            # Subscribe right away if we can use the stored IDs
+            self.__start_sensor_listener(cfg)
         num_retries = 0
-        max_num_retries = 6
-        r = None
-        while r is None:
-            r = network_utils.http_get_request(self.api_url + '/sensors')
-            if r is None:
-                if num_retries >= max_num_retries:
-                    logger.error('[RaspBeeWrapper] Could not query ZigBee sensors, stop retrying.')
-                    return dict()
-                else:
-                    logger.warning('[RaspBeeWrapper] Could not query ZigBee gateway, retrying.')
-                    time.sleep(30)
-            else:
+        max_num_retries = 6  # Warn loudly if deCONZ is still unavailable after this many retries
+        while not self._shutdown_event.is_set():
+            plugs = dict() if self._heating_disabled else self.__map_deconz_heating_plugs(cfg)
+            sensors = self.__map_deconz_temperature_sensors(cfg)
+            if plugs is not None and sensors is not None:
                 break
             num_retries += 1
+            if num_retries == max_num_retries:
+                logger.error('[RaspBeeWrapper] Could not query ZigBee sensors after {:d} retries, will keep on trying.'.format(num_retries))
+            else:
+                logger.warning('[RaspBeeWrapper] Could not query ZigBee gateway, retrying in {} seconds.'.format(self._discovery_retry_interval))
+            self._shutdown_event.wait(self._discovery_retry_interval)
+        if self._shutdown_event.is_set():
+            return
+
+        mapping = DeconzIdMapping(plugs, sensors)
+        if mapping == self._id_mapping:
+            logger.info('[RaspBeeWrapper] deCONZ confirmed the stored plug/sensor IDs.')
+        else:
+            # Replace the whole mapping at once
+            self._id_mapping = mapping
+            # Previous readings may belong to the wrong sensors (or failed due to the missing mapping)
+            self._temperature_cache.invalidate()
+            logger.info('[RaspBeeWrapper] Discovered {:d} plug(s) and {:d} temperature sensor(s).'.format(
+                len(plugs), len(sensors)))
+            if self._id_cache_file:
+                mapping.save(self._id_cache_file)
+            # The event listener must watch the new IDs
+            if self._sensor_listener is not None:
+                self._sensor_listener.stop()
+                self._sensor_listener = None
+        self._sensors_discovered.set()
+
+        if self._use_websocket and self._sensor_listener is None:
+            self.__start_sensor_listener(cfg)
+
+    def __map_deconz_temperature_sensors(self, cfg):
+        """Returns the mapping (deCONZ sensor name => list of IDs) or None if the gateway is unavailable."""
+        logger = logging.getLogger()
+        r = network_utils.http_get_request(self.api_url + '/sensors')
+        if r is None:
+            return None
 
         sensors = json.loads(r.content)
 
@@ -261,16 +642,53 @@ class RaspBeeWrapper:
                     mapping[s] = [raspbee_id]
         return mapping
 
+    def __start_sensor_listener(self, cfg):
+        if len(self.known_temperature_sensor_ids) == 0:
+            logging.getLogger().error('[RaspBeeWrapper] No known sensors, cannot subscribe to deCONZ events.')
+            return
+
+        ws_port = common.cfg_val_or_none(cfg['raspbee']['deconz'], 'websocket_port')
+        if ws_port is None:
+            # Ask deCONZ for its websocket port
+            r = network_utils.http_get_request(self.api_url + '/config')
+            if r is None:
+                logging.getLogger().error('[RaspBeeWrapper] Cannot query the deCONZ websocket port, using REST queries only.')
+                return
+            ws_port = json.loads(r.content)['websocketport']
+        ws_url = 'ws://' + cfg['raspbee']['deconz']['gateway'] + ':' + str(ws_port)
+
+        listener = DeconzSensorListener(
+            ws_url, self.known_temperature_sensor_ids, self.__query_sensors,
+            reconnect_time=common.cfg_val_or_default(cfg['raspbee']['deconz'], 'websocket_reconnect_time', 30))
+        if self._shutdown_event.is_set():
+            return
+        self._sensor_listener = listener
+        self._sensor_listener.start()
+        logging.getLogger().info('[RaspBeeWrapper] Subscribed to deCONZ events at {:s}.'.format(ws_url))
+
+    def shutdown(self):
+        """Stops the sensor discovery and the deCONZ event listener (if any)."""
+        self._shutdown_event.set()
+        if self._sensor_listener is not None:
+            self._sensor_listener.stop()
+
+    @property
+    def temperature_sensors_discovered(self):
+        """False while we're still waiting for deCONZ to report our sensors."""
+        return self._sensors_discovered.is_set()
+
+    @property
+    def num_saved_requests(self):
+        """Number of HTTP requests we saved so far by querying the sensors in bulk."""
+        return self._num_saved_requests
+
     @property
     def known_power_plug_ids(self):
-        return list(self._heating_plug_raspbee_name_mapping.values())
+        return self._id_mapping.plug_ids
 
     @property
     def known_temperature_sensor_ids(self):
-        known_ids = list()
-        for _, ids in self._temperature_sensor_raspbee_name_mapping.items():
-            known_ids.extend(ids)
-        return known_ids
+        return self._id_mapping.sensor_ids
 
     def query_deconz_details(self):
         r = network_utils.http_get_request(self.api_url)
@@ -283,6 +701,21 @@ class RaspBeeWrapper:
         msg.append('\u2022 deCONZ API Version: {}'.format(common.format_num('s', state['config']['apiversion'])))
         msg.append('\u2022 deCONZ SW Version: {}'.format(common.format_num('s', state['config']['swversion'])))
         msg.append('\u2022 ZigBee Kanal: {}'.format(common.format_num('d', state['config']['zigbeechannel'])))
+        if not self.temperature_sensors_discovered:
+            msg.append('\u2022 :bangbang: Thermometer werden noch gesucht')
+        if self._sensor_listener is not None:
+            msg.append('\u2022 deCONZ Events: {} ({})'.format(
+                common.format_num('d', self._sensor_listener.num_events),
+                'verbunden' if self._sensor_listener.is_synchronized else 'getrennt :bangbang:'))
+        if self._use_bulk_query or self._sensor_listener is not None:
+            msg.append('\u2022 Eingesparte Sensorabfragen: {}'.format(common.format_num('d', self._num_saved_requests)))
+        cache_age = self._temperature_cache.age
+        msg.append('\u2022 Sensor-Cache: {} Treffer, {} geteilt, {} Abfragen ({} fehlgeschlagen), Alter {}'.format(
+            common.format_num('d', self._temperature_cache.num_hits),
+            common.format_num('d', self._temperature_cache.num_shared),
+            common.format_num('d', self._temperature_cache.num_misses),
+            common.format_num('d', self._temperature_cache.num_failed),
+            '-' if cache_age is None else common.format_num('.1f', cache_age) + '\u200as'))
         # # Note: LPD433 replaced the ZigBee plugs, so we don't need to query those:
         # # Iterate over reported lights (this group contains our power plugs)
         # is_heating = None
@@ -319,10 +752,11 @@ class RaspBeeWrapper:
         status = list()
         is_heating = False
         logger = logging.getLogger()
-        if len(self._heating_plug_raspbee_name_mapping) == 0:
+        plug_mapping = self._id_mapping.plugs
+        if len(plug_mapping) == 0:
             logger.error('[RaspBeeWrapper] Cannot query heating, as there are no known/reachable plugs!')
             return None, list()
-        for plug_lbl, plug_id in self._heating_plug_raspbee_name_mapping.items():
+        for plug_lbl, plug_id in plug_mapping.items():
             r = network_utils.http_get_request(self.api_url + '/lights/' + plug_id)
             if r is None:
                 return None, status  # Abort query
@@ -331,14 +765,83 @@ class RaspBeeWrapper:
             is_heating = is_heating or state.on
         return is_heating, status
 
-    def query_temperature(self):
-        status = list()
-        logger = logging.getLogger()
-        if len(self._temperature_sensor_raspbee_name_mapping) == 0:
-            logger.error('[RaspBeeWrapper] Cannot query temperature, as there are no known/reachable sensors!')
+    @property
+    def temperature_cache(self):
+        return self._temperature_cache
+
+    def query_temperature(self, max_age=None):
+        """Returns the cached sensor readings, unless they are older than
+        max_age seconds (defaults to raspbee.temperature.cache_max_age).
+
+        :return: list(TemperatureState) or None if the query failed"""
+        return self._temperature_cache.get(max_age)
+
+    def __fetch_temperature(self):
+        """:return: list(TemperatureState) or None if the query failed"""
+        if not self.temperature_sensors_discovered:
+            logging.getLogger().warning('[RaspBeeWrapper] Cannot query temperature, sensor discovery is still in progress.')
+            return None
+        if len(self._id_mapping.sensors) == 0:
+            logging.getLogger().error('[RaspBeeWrapper] Cannot query temperature, as there are no known/reachable sensors!')
             return None
 
-        for sensor_lbl, sensor_ids in self._temperature_sensor_raspbee_name_mapping.items():
+        # Use the pushed sensor states if available (no network traffic at all)
+        if self._sensor_listener is not None:
+            sensors = self._sensor_listener.sensor_states()
+            if sensors is not None:
+                states = self.__temperature_states_from_sensors(sensors)
+                if states is not None:
+                    self._num_saved_requests += len(self.known_temperature_sensor_ids)
+                return states
+            logging.getLogger().debug('[RaspBeeWrapper] deCONZ event listener is not synchronized, falling back to REST.')
+
+        if self._use_bulk_query:
+            return self.__query_temperature_bulk()
+        return self.__query_temperature_single()
+
+    def __query_sensors(self):
+        """Returns the full /sensors dict (deCONZ ID => sensor) or None."""
+        r = network_utils.http_get_request(self.api_url + '/sensors')
+        if r is None:
+            return None
+        return json.loads(r.content)
+
+    def __query_temperature_bulk(self):
+        """Fetches all sensors via a single request and filters them locally."""
+        sensors = self.__query_sensors()
+        if sensors is None:
+            return None  # Abort query
+        states = self.__temperature_states_from_sensors(sensors)
+        if states is not None:
+            num_saved = len(self.known_temperature_sensor_ids) - 1
+            self._num_saved_requests += num_saved
+            logging.getLogger().debug('[RaspBeeWrapper] Bulk temperature query saved {:d} requests ({:d} in total).'.format(
+                num_saved, self._num_saved_requests))
+        return states
+
+    def __temperature_states_from_sensors(self, sensors):
+        """Filters and merges our known sensors from the given dict (deCONZ ID => sensor)."""
+        sensor_mapping = self._id_mapping.sensors
+        states = list()
+        for sensor_lbl, sensor_ids in sensor_mapping.items():
+            display_name = self._temperature_sensor_display_name_mapping[sensor_lbl]
+            for sensor_id in sensor_ids:
+                if sensor_id not in sensors:
+                    logging.getLogger().error(
+                        '[RaspBeeWrapper] Sensor {:s} ({:s}) with RaspBee ID {} is missing from the /sensors response!'.format(
+                            sensor_lbl, display_name, sensor_id))
+                    return None  # Abort query
+                states.append(TemperatureState(display_name, sensors[sensor_id]))
+
+        # Merge the separate temperature/humidity/pressure readings, but keep the
+        # order of our mapping (merge_sensors() sorts by name)
+        merged = {s.name: s for s in TemperatureState.merge_sensors(states)}
+        return [merged[sensor_lbl] for sensor_lbl in sensor_mapping]
+
+    def __query_temperature_single(self):
+        """Queries each sensor ID separately (i.e. three requests per physical device)."""
+        status = list()
+        for sensor_lbl, sensor_ids in self._id_mapping.sensors.items():
             merged_state = None
             for sensor_id in sensor_ids:
                 r = network_utils.http_get_request(self.api_url + '/sensors/' + sensor_id)
@@ -398,7 +901,7 @@ class RaspBeeWrapper:
         # self.__switch_light(plug_id, True)
         success = True
         msg = list()
-        for _, plug_id in self._heating_plug_raspbee_name_mapping.items():
+        for plug_id in self._id_mapping.plug_ids:
             s, m = self.__switch_light(plug_id, True)
             success = success and s
             msg.append(m)
@@ -414,7 +917,7 @@ class RaspBeeWrapper:
         # Since this is an or-relais, we need to turn off all heating plugs
         success = True
         msg = list()
-        for _, plug_id in self._heating_plug_raspbee_name_mapping.items():
+        for plug_id in self._id_mapping.plug_ids:
             s, m = self.__switch_light(plug_id, False)
             success = success and s
             msg.append(m)
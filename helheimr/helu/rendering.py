@@ -0,0 +1,248 @@
+#!/usr/bin/python
+# coding=utf-8
+"""Renders plots in separate worker processes, so matplotlib neither blocks
+the heating/bot threads (GIL) nor fragments the service's heap."""
+
+import concurrent.futures
+import concurrent.futures.process
+import io
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import traceback
+import weakref
+
+from . import common
+from . import drawing
+from . import ringbuffer
+
+
+def _render_temperature_plot(payload):
+    """Executed within the worker process, returns the encoded image as
+    (bytes, file name) or None."""
+    readings = ringbuffer.columns_to_readings(
+        payload['sensor_names'], payload['timestamps'], payload['temperatures'], payload['flags'])
+    memfile = drawing.plot_temperature_curves(
+        payload['width_px'], payload['height_px'], readings,
+        return_mem=True, reverse=False, **payload['plot_kwargs'])
+    if memfile is None:
+        return None
+    return memfile.getvalue(), memfile.name
+
+
+def _register_worker(pid_queue):
+    """Executed within each new worker process, so we can terminate it if it hangs."""
+    pid_queue.put(os.getpid())
+
+
+def _warm_up():
+    """Loads matplotlib, so the first plot doesn't pay for it."""
+    drawing._pyplot()
+
+
+def temperature_plot_payload(width_px, height_px, sensor_names, timestamps, temperatures, flags, **plot_kwargs):
+    """Packs the readings (as columns in chronological order, @see
+    ringbuffer.TemperatureRingBuffer) and the parameters of
+    drawing.plot_temperature_curves() into a (cheaply picklable) payload."""
+    return {
+        'width_px': width_px,
+        'height_px': height_px,
+        'sensor_names': list(sensor_names),
+        'timestamps': timestamps,
+        'temperatures': temperatures,
+        'flags': flags,
+        'plot_kwargs': plot_kwargs
+    }
+
+
+# The service is created lazily by the first render request (unless hel initialized
+# it), so its creation must be synchronized
+_render_service_lock = threading.Lock()
+
+
+class RenderService:
+    """Small process pool to render plots. Requests are rejected if too many
+    are pending, workers are replaced after a number of renders (or if a
+    render timed out, i.e. the worker may hang)."""
+    __instance = None
+
+    DEFAULT_NUM_WORKERS = 1
+    DEFAULT_TIMEOUT = 60          # Max. time (in sec) to wait for a plot
+    DEFAULT_MAX_PENDING = 2       # Max. number of queued/running renders
+    DEFAULT_RENDERS_PER_WORKER = 20
+
+    @staticmethod
+    def instance():
+        """Returns the singleton (falls back to the default configuration if it hasn't been initialized)."""
+        if RenderService.__instance is None:
+            with _render_service_lock:
+                if RenderService.__instance is None:
+                    RenderService(None)
+        return RenderService.__instance
+
+    @staticmethod
+    def init_instance(ctrl_cfg):
+        """Initialize the singleton using the 'rendering' section of the given configuration."""
+        with _render_service_lock:
+            if RenderService.__instance is None:
+                RenderService(ctrl_cfg)
+        return RenderService.__instance
+
+    def __init__(self, ctrl_cfg):
+        """Virtually private constructor, use RenderService.init_instance() instead."""
+        if RenderService.__instance is not None:
+            raise RuntimeError("RenderService is a singleton!")
+
+        render_cfg = None
+        if ctrl_cfg is not None:
+            render_cfg = common.cfg_val_or_none(ctrl_cfg, 'rendering')
+        if render_cfg is None:
+            render_cfg = dict()
+        self._num_workers = common.cfg_val_or_default(render_cfg, 'workers', type(self).DEFAULT_NUM_WORKERS)
+        self._timeout = common.cfg_val_or_default(render_cfg, 'timeout_seconds', type(self).DEFAULT_TIMEOUT)
+        self._max_pending = common.cfg_val_or_default(render_cfg, 'max_pending', type(self).DEFAULT_MAX_PENDING)
+        self._renders_per_worker = common.cfg_val_or_default(
+            render_cfg, 'renders_per_worker', type(self).DEFAULT_RENDERS_PER_WORKER)
+
+        # Spawn fresh interpreters instead of forking our multi-threaded process
+        self._mp_context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._pid_queues = weakref.WeakKeyDictionary()  # Executor => queue holding the PIDs of its workers
+        self._executor = None
+        self._num_submitted = 0  # Renders submitted to the current executor
+        self._num_pending = 0
+        self._num_rendered = 0
+        self._num_rejected = 0
+        self._num_failed = 0
+        self._is_shut_down = False
+        self.__start_executor()
+        logging.getLogger().info(
+            '[RenderService] Started {:d} worker(s), recycled after {:d} renders.'.format(
+                self._num_workers, self._renders_per_worker))
+        # Publish the singleton once it's fully set up (instance() doesn't lock if it exists)
+        RenderService.__instance = self
+
+    def __start_executor(self):
+        """Replaces the current executor, must be called while holding the lock."""
+        previous = self._executor
+        pid_queue = self._mp_context.SimpleQueue()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._num_workers, mp_context=self._mp_context,
+            initializer=_register_worker, initargs=(pid_queue,))
+        self._pid_queues[self._executor] = pid_queue
+        self._num_submitted = 0
+        self._executor.submit(_warm_up)
+        if previous is not None:
+            # Its workers exit once they finished their current tasks
+            previous.shutdown(wait=False)
+
+    def __terminate_executor(self, executor):
+        """Kills the worker processes of a (potentially hanging) executor."""
+        # There's no public API to terminate busy workers, thus each worker
+        # reports its PID upon startup
+        pid_queue = self._pid_queues.pop(executor, None)
+        pids = list()
+        while pid_queue is not None and not pid_queue.empty():
+            pids.append(pid_queue.get())
+        executor.shutdown(wait=False)
+        if len(pids) == 0:
+            logging.getLogger().warning('[RenderService] No worker processes known, cannot terminate them.')
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                # Already exited
+                pass
+            except OSError:
+                err_msg = traceback.format_exc(limit=3)
+                logging.getLogger().error('[RenderService] Cannot terminate worker {:d}:\n{:s}'.format(pid, err_msg))
+
+    def __finished(self, future):
+        self._lock.acquire()
+        self._num_pending -= 1
+        self._lock.release()
+
+    @property
+    def num_pending(self):
+        return self._num_pending
+
+    @property
+    def num_rendered(self):
+        return self._num_rendered
+
+    @property
+    def num_rejected(self):
+        return self._num_rejected
+
+    @property
+    def num_failed(self):
+        return self._num_failed
+
+    def render_temperature_plot(self, payload, timeout=None):
+        """Renders the payload (@see temperature_plot_payload()) and returns the
+        encoded image as BytesIO or None (if the request was rejected, timed
+        out or failed). Blocks the calling thread, but it doesn't hold the GIL
+        while waiting."""
+        if timeout is None:
+            timeout = self._timeout
+        self._lock.acquire()
+        try:
+            if self._is_shut_down:
+                return None
+            if self._num_pending >= self._max_pending:
+                self._num_rejected += 1
+                logging.getLogger().warning(
+                    '[RenderService] Rejecting render request, {:d} are already pending.'.format(self._num_pending))
+                return None
+            if self._num_submitted >= self._renders_per_worker * self._num_workers:
+                self.__start_executor()
+            executor = self._executor
+            future = executor.submit(_render_temperature_plot, payload)
+            self._num_submitted += 1
+            self._num_pending += 1
+        finally:
+            self._lock.release()
+        future.add_done_callback(self.__finished)
+
+        try:
+            result = future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            logging.getLogger().error(
+                '[RenderService] Rendering timed out after {} sec, replacing the worker pool.'.format(timeout))
+            self._lock.acquire()
+            self._num_failed += 1
+            if executor is self._executor and not self._is_shut_down:
+                self.__start_executor()
+            self._lock.release()
+            self.__terminate_executor(executor)
+            return None
+        except Exception as e:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error('[RenderService] Rendering failed:\n' + err_msg)
+            self._lock.acquire()
+            self._num_failed += 1
+            # A crashed worker breaks the whole pool
+            if isinstance(e, concurrent.futures.process.BrokenProcessPool) \
+                    and executor is self._executor and not self._is_shut_down:
+                self.__start_executor()
+            self._lock.release()
+            return None
+
+        if result is None:
+            return None
+        self._num_rendered += 1
+        memfile = io.BytesIO(result[0])
+        memfile.name = result[1]
+        return memfile
+
+    def shutdown(self):
+        """Stops the worker processes, pending renders will fail."""
+        self._lock.acquire()
+        self._is_shut_down = True
+        executor = self._executor
+        self._lock.release()
+        self.__terminate_executor(executor)
+        logging.getLogger().info('[RenderService] Shut down after {:d} renders ({:d} rejected, {:d} failed).'.format(
+            self._num_rendered, self._num_rejected, self._num_failed))
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# coding=utf-8
+"""Columnar ring buffer to store the temperature readings."""
+
+import datetime
+import numpy as np
+from dateutil import tz
+
+
+def dt2epoch(dt):
+    """Converts the datetime to seconds since the epoch (naive datetimes are
+    assumed to be in local time, as parsed from the temperature log)."""
+    if dt.tzinfo is None or dt.tzinfo.utcoffset(dt) is None:
+        dt = dt.replace(tzinfo=tz.tzlocal())
+    return int(dt.timestamp())
+
+
+def epoch2dt_local(ts):
+    """Converts seconds since the epoch to a datetime in local timezone."""
+    return datetime.datetime.fromtimestamp(int(ts), tz=tz.tzlocal())
+
+
+class TemperatureRingBuffer:
+    """Stores the most recent temperature readings column-wise:
+    * timestamps:   int64 array, seconds since the epoch
+    * temperatures: float32 matrix (num_sensors x N), NaN if a sensor was unreachable
+    * flags:        uint8 bitmask, see FLAG_HEATING and FLAG_NO_READING
+
+    Each reading is stored twice (at idx and idx + capacity), so the most recent
+    readings are always a contiguous slice. Thus, queries return read-only views
+    (in chronological order) instead of copies.
+    Time range queries assume that readings are appended in chronological order.
+    """
+    FLAG_HEATING = 1     # The heater was on
+    FLAG_NO_READING = 2  # The sensors couldn't be queried at all
+
+    def __init__(self, capacity, sensor_names):
+        self._capacity = capacity
+        self._sensor_names = list(sensor_names)
+        self._sensor_indices = {sn: idx for idx, sn in enumerate(self._sensor_names)}
+        self._timestamps = np.zeros(2*capacity, dtype=np.int64)
+        self._temperatures = np.full((len(self._sensor_names), 2*capacity), np.nan, dtype=np.float32)
+        self._flags = np.zeros(2*capacity, dtype=np.uint8)
+        self._write_idx = 0  # Where to store the next reading (within [0, capacity))
+        self._size = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def sensor_names(self):
+        """Sensor names in the order of the temperature matrix rows."""
+        return self._sensor_names
+
+    def sensor_index(self, sensor_name):
+        return self._sensor_indices[sensor_name]
+
+    def __len__(self):
+        return self._size
+
+    def append(self, dt, temperatures, is_heating):
+        """Stores a reading.
+
+        :param dt: datetime.datetime or seconds since the epoch
+        :param temperatures: None (if the sensors couldn't be queried) or
+                    dict(sensor_name: temperature or None)
+        :param is_heating: bool
+        """
+        ts = dt if isinstance(dt, (int, np.integer)) else dt2epoch(dt)
+        column = np.full(len(self._sensor_names), np.nan, dtype=np.float32)
+        flags = self.FLAG_HEATING if is_heating else 0
+        if temperatures is None:
+            flags |= self.FLAG_NO_READING
+        else:
+            for sn, t in temperatures.items():
+                if t is not None:
+                    column[self._sensor_indices[sn]] = t
+
+        for idx in [self._write_idx, self._write_idx + self._capacity]:
+            self._timestamps[idx] = ts
+            self._temperatures[:, idx] = column
+            self._flags[idx] = flags
+        self._write_idx = (self._write_idx + 1) % self._capacity
+        self._size = min(self._size + 1, self._capacity)
+
+    def extend(self, timestamps, temperatures, flags):
+        """Stores multiple readings at once, given as columns (timestamps in seconds
+        since the epoch, num_sensors x N temperature matrix, flags)."""
+        num = timestamps.shape[0]
+        if num > self._capacity:
+            timestamps, temperatures, flags = timestamps[-self._capacity:], temperatures[:, -self._capacity:], flags[-self._capacity:]
+            num = self._capacity
+        indices = (self._write_idx + np.arange(num)) % self._capacity
+        for offset in [0, self._capacity]:
+            self._timestamps[indices + offset] = timestamps
+            self._temperatures[:, indices + offset] = temperatures
+            self._flags[indices + offset] = flags
+        self._write_idx = (self._write_idx + num) % self._capacity
+        self._size = min(self._size + num, self._capacity)
+
+    def __slice(self, start, end):
+        """Returns read-only views for the given (contiguous) index range."""
+        views = (self._timestamps[start:end], self._temperatures[:, start:end], self._flags[start:end])
+        for v in views:
+            v.flags.writeable = False
+        return views
+
+    def latest(self, num_entries=None):
+        """Returns the most recent num_entries (or all if None) readings
+        as views (timestamps, temperatures, flags)."""
+        if num_entries is None or num_entries > self._size:
+            num_entries = self._size
+        end = self._write_idx + self._capacity
+        return self.__slice(end - num_entries, end)
+
+    def time_range(self, dt_from=None, dt_to=None):
+        """Returns the readings within [dt_from, dt_to] (datetime.datetime or
+        seconds since the epoch, None for an open interval) as views
+        (timestamps, temperatures, flags)."""
+        end = self._write_idx + self._capacity
+        start = end - self._size
+        timestamps = self._timestamps[start:end]
+        if dt_from is not None:
+            ts = dt_from if isinstance(dt_from, (int, np.integer)) else dt2epoch(dt_from)
+            start += int(np.searchsorted(timestamps, ts, side='left'))
+        if dt_to is not None:
+            ts = dt_to if isinstance(dt_to, (int, np.integer)) else dt2epoch(dt_to)
+            end = end - self._size + int(np.searchsorted(timestamps, ts, side='right'))
+        return self.__slice(start, max(start, end))
+
+    def to_readings(self, timestamps, temperatures, flags):
+        """Converts the given columns into the list of (dt_local, dict(sensor_name: temperature
+        or None) or None, is_heating) tuples as used by format_table/drawing."""
+        return columns_to_readings(self._sensor_names, timestamps, temperatures, flags)
+
+
+def columns_to_readings(sensor_names, timestamps, temperatures, flags):
+    """Converts columns (@see TemperatureRingBuffer) into the list of readings,
+    i.e. (dt_local, dict(sensor_name: temperature or None) or None, is_heating)."""
+    # Sensors report 1/100th degrees, so round to get rid of float32 artifacts
+    temperatures = np.round(temperatures.astype(np.float64), 2)
+    readings = list()
+    for i in range(timestamps.shape[0]):
+        if flags[i] & TemperatureRingBuffer.FLAG_NO_READING:
+            sensors = None
+        else:
+            sensors = {sn: (None if np.isnan(temperatures[sidx, i]) else float(temperatures[sidx, i]))
+                       for sidx, sn in enumerate(sensor_names)}
+        readings.append((epoch2dt_local(timestamps[i]), sensors, bool(flags[i] & TemperatureRingBuffer.FLAG_HEATING)))
+    return readings
+
+
+def readings_to_columns(readings, sensor_names):
+    """Inverse of columns_to_readings(), returns (timestamps, temperatures, flags)."""
+    sensor_indices = {sn: idx for idx, sn in enumerate(sensor_names)}
+    timestamps = np.zeros(len(readings), dtype=np.int64)
+    temperatures = np.full((len(sensor_names), len(readings)), np.nan, dtype=np.float32)
+    flags = np.zeros(len(readings), dtype=np.uint8)
+    for i, (dt, sensors, is_heating) in enumerate(readings):
+        timestamps[i] = dt2epoch(dt)
+        if sensors is None:
+            flags[i] = TemperatureRingBuffer.FLAG_NO_READING
+        else:
+            for sn, t in sensors.items():
+                if t is not None:
+                    temperatures[sensor_indices[sn], i] = t
+        if is_heating:
+            flags[i] |= TemperatureRingBuffer.FLAG_HEATING
+    return timestamps, temperatures, flags
@@ -0,0 +1,248 @@
+#!/usr/bin/python
+# coding=utf-8
+"""Incremental multi-resolution rollups (min/mean/max, heating duty cycle) of the temperature readings."""
+
+import datetime
+import logging
+import numpy as np
+import os
+import traceback
+
+from . import ringbuffer
+
+
+class RollupSeries:
+    """Aggregates the readings into time slots of fixed duration (aligned to
+    UTC), keeping the most recent 'capacity' slots. Per slot and sensor, we
+    store min/sum/max and the number of valid readings, plus the number of
+    readings while the heater was on.
+
+    If local_days is set, slots span a calendar day in local time instead (i.e.
+    they start at local midnight and last 23 or 25 hours upon DST changes),
+    matching the time stamps of the log files and plots.
+
+    Like TemperatureRingBuffer, each slot is stored twice, so queries return
+    views of the requested slots.
+    """
+    def __init__(self, resolution_sec, capacity, num_sensors, local_days=False):
+        self._resolution = resolution_sec
+        self._local_days = local_days
+        self._day_bounds = None  # [start, end) of the most recently looked up local day
+        self._capacity = capacity
+        self._slots = np.zeros(2*capacity, dtype=np.int64)  # Start of each slot, seconds since the epoch
+        self._min = np.full((num_sensors, 2*capacity), np.nan, dtype=np.float32)
+        self._max = np.full((num_sensors, 2*capacity), np.nan, dtype=np.float32)
+        self._sum = np.zeros((num_sensors, 2*capacity), dtype=np.float64)
+        self._count = np.zeros((num_sensors, 2*capacity), dtype=np.uint32)
+        self._num_readings = np.zeros(2*capacity, dtype=np.uint32)
+        self._num_heating = np.zeros(2*capacity, dtype=np.uint32)
+        self._write_idx = 0
+        self._size = 0
+
+    @property
+    def resolution(self):
+        """Slot duration in seconds."""
+        return self._resolution
+
+    def __len__(self):
+        return self._size
+
+    def __arrays(self):
+        return [self._slots, self._min, self._max, self._sum, self._count, self._num_readings, self._num_heating]
+
+    def __slot_start(self, ts):
+        """Returns the start of the slot containing ts (seconds since the epoch)."""
+        if not self._local_days:
+            return ts - (ts % self._resolution)
+        bounds = self._day_bounds
+        if bounds is None or not (bounds[0] <= ts < bounds[1]):
+            day = ringbuffer.epoch2dt_local(ts).date()
+            # Naive datetimes are interpreted as local time
+            bounds = (ringbuffer.dt2epoch(datetime.datetime.combine(day, datetime.time())),
+                      ringbuffer.dt2epoch(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time())))
+            self._day_bounds = bounds
+        return bounds[0]
+
+    def add(self, ts, column, is_heating):
+        """Adds a reading (column holds the temperature per sensor, NaN if
+        invalid). Returns True if this reading started a new slot (i.e. the
+        previous slot is complete). Readings older than the current slot are
+        ignored."""
+        slot = self.__slot_start(ts)
+        started_slot = False
+        if self._size > 0:
+            current = self._slots[(self._write_idx - 1) % self._capacity]
+            if slot < current:
+                return False
+            started_slot = slot > current
+        if self._size == 0 or started_slot:
+            for idx in [self._write_idx, self._write_idx + self._capacity]:
+                self._slots[idx] = slot
+                self._min[:, idx] = np.nan
+                self._max[:, idx] = np.nan
+                self._sum[:, idx] = 0.0
+                self._count[:, idx] = 0
+                self._num_readings[idx] = 0
+                self._num_heating[idx] = 0
+            self._write_idx = (self._write_idx + 1) % self._capacity
+            self._size = min(self._size + 1, self._capacity)
+
+        valid = ~np.isnan(column)
+        current_idx = (self._write_idx - 1) % self._capacity
+        for idx in [current_idx, current_idx + self._capacity]:
+            self._min[:, idx] = np.fmin(self._min[:, idx], column)
+            self._max[:, idx] = np.fmax(self._max[:, idx], column)
+            self._sum[valid, idx] += column[valid]
+            self._count[valid, idx] += 1
+            self._num_readings[idx] += 1
+            if is_heating:
+                self._num_heating[idx] += 1
+        return started_slot
+
+    def time_range(self, ts_from=None, ts_to=None):
+        """Returns the slots overlapping [ts_from, ts_to] (seconds since the epoch,
+        None for an open interval) as tuple (slot_starts, minimum, mean, maximum,
+        duty_cycle), where min/mean/max are num_sensors x N matrices (NaN if there
+        was no valid reading) and the duty cycle is the fraction of readings
+        while heating."""
+        end = self._write_idx + self._capacity
+        start = end - self._size
+        slots = self._slots[start:end]
+        if ts_from is not None:
+            start += int(np.searchsorted(slots, self.__slot_start(ts_from), side='left'))
+        if ts_to is not None:
+            end = end - self._size + int(np.searchsorted(slots, ts_to, side='right'))
+        end = max(start, end)
+        count = self._count[:, start:end]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, self._sum[:, start:end] / count, np.nan)
+            duty_cycle = self._num_heating[start:end] / self._num_readings[start:end]
+        return (self._slots[start:end], self._min[:, start:end], mean.astype(np.float32),
+                self._max[:, start:end], duty_cycle)
+
+    def to_arrays(self):
+        """Returns copies of the stored slots in chronological order (for persistence)."""
+        end = self._write_idx + self._capacity
+        start = end - self._size
+        return [a[..., start:end].copy() for a in self.__arrays()]
+
+    def from_arrays(self, arrays, sensor_indices):
+        """Restores the slots from to_arrays(). sensor_indices maps each stored
+        sensor row to our row (or -1 if the sensor has been removed)."""
+        slots = arrays[0]
+        num = min(slots.shape[0], self._capacity)
+        keep = np.asarray(sensor_indices) >= 0
+        rows = np.asarray(sensor_indices)[keep]
+        for dst, src in zip(self.__arrays(), arrays):
+            src = src[..., -num:] if num > 0 else src[..., :0]
+            for offset in [0, self._capacity]:
+                if dst.ndim == 1:
+                    dst[offset:offset + num] = src
+                else:
+                    dst[rows, offset:offset + num] = src[keep]
+        self._write_idx = num % self._capacity
+        self._size = num
+
+
+class RollupStore:
+    """Hourly and daily rollups of the temperature readings, persisted to a
+    compact (compressed numpy) file. Daily slots start at local midnight."""
+    HOUR = 3600
+    DAY = 24*3600
+    FILE_VERSION = 2  # Increment whenever the slot alignment/layout changes
+
+    def __init__(self, filename, sensor_names, hourly_capacity, daily_capacity):
+        self._filename = filename
+        self._sensor_names = list(sensor_names)
+        self._sensor_indices = {sn: idx for idx, sn in enumerate(self._sensor_names)}
+        self._hourly = RollupSeries(type(self).HOUR, hourly_capacity, len(self._sensor_names))
+        self._daily = RollupSeries(type(self).DAY, daily_capacity, len(self._sensor_names), local_days=True)
+        self._last_ts = None  # Time stamp of the most recently added reading
+
+    @property
+    def series(self):
+        """Available rollups, coarsest first."""
+        return [self._daily, self._hourly]
+
+    @property
+    def last_timestamp(self):
+        """Time stamp (seconds since the epoch) of the most recent reading or None."""
+        return self._last_ts
+
+    @property
+    def sensor_names(self):
+        return self._sensor_names
+
+    def add(self, dt, temperatures, is_heating):
+        """Adds a reading (same parameters as TemperatureRingBuffer.append()).
+        Returns True if an hourly slot has been completed."""
+        ts = dt if isinstance(dt, (int, np.integer)) else ringbuffer.dt2epoch(dt)
+        column = np.full(len(self._sensor_names), np.nan, dtype=np.float32)
+        if temperatures is not None:
+            for sn, t in temperatures.items():
+                if t is not None and sn in self._sensor_indices:
+                    column[self._sensor_indices[sn]] = t
+        self._last_ts = ts if self._last_ts is None else max(ts, self._last_ts)
+        self._daily.add(ts, column, is_heating)
+        return self._hourly.add(ts, column, is_heating)
+
+    def save(self):
+        """Persists the rollups (written to a temporary file first, so we never
+        leave a corrupt file behind)."""
+        data = {
+            'version': np.array([type(self).FILE_VERSION], dtype=np.int64),
+            'sensor_names': np.array(self._sensor_names),
+            'last_ts': np.array([-1 if self._last_ts is None else self._last_ts], dtype=np.int64)
+        }
+        for prefix, series in [('hourly', self._hourly), ('daily', self._daily)]:
+            for idx, arr in enumerate(series.to_arrays()):
+                data['{:s}_{:d}'.format(prefix, idx)] = arr
+        tmp_filename = self._filename + '.tmp'
+        try:
+            with open(tmp_filename, 'wb') as f:
+                np.savez_compressed(f, **data)
+            os.replace(tmp_filename, self._filename)
+        except:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error('[RollupStore] Cannot save rollups to {:s}:\n{:s}'.format(self._filename, err_msg))
+
+    def load(self):
+        """Restores the rollups from file, returns False if there is none (or it's corrupt)."""
+        if not os.path.exists(self._filename):
+            return False
+        try:
+            with np.load(self._filename, allow_pickle=False) as data:
+                if 'version' not in data or int(data['version'][0]) != type(self).FILE_VERSION:
+                    # E.g. daily slots were previously aligned to UTC, recompute them from the log files
+                    logging.getLogger().info('[RollupStore] Ignoring rollups of a previous version in {:s}.'.format(
+                        self._filename))
+                    return False
+                stored_names = [str(sn) for sn in data['sensor_names']]
+                # Sensors may have been added/removed since the rollups have been stored
+                sensor_indices = [self._sensor_indices.get(sn, -1) for sn in stored_names]
+                for prefix, series in [('hourly', self._hourly), ('daily', self._daily)]:
+                    arrays = [data['{:s}_{:d}'.format(prefix, idx)] for idx in range(7)]
+                    series.from_arrays(arrays, sensor_indices)
+                last_ts = int(data['last_ts'][0])
+                self._last_ts = None if last_ts < 0 else last_ts
+            return True
+        except:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error('[RollupStore] Cannot load rollups from {:s}:\n{:s}'.format(self._filename, err_msg))
+            return False
+
+    def to_readings(self, series, ts_from=None, ts_to=None):
+        """Returns the slots of the given series as list of readings
+        (dt_local, dict(sensor_name: mean temperature or None), is_heating)
+        in chronological order. We consider a slot as 'heating' if the
+        heater was on for at least half of its readings."""
+        slots, _, mean, _, duty_cycle = series.time_range(ts_from, ts_to)
+        mean = np.round(mean.astype(np.float64), 2)
+        readings = list()
+        for i in range(slots.shape[0]):
+            sensors = {sn: (None if np.isnan(mean[sidx, i]) else float(mean[sidx, i]))
+                       for sidx, sn in enumerate(self._sensor_names)}
+            if all([t is None for t in sensors.values()]):
+                sensors = None
+            readings.append((ringbuffer.epoch2dt_local(slots[i]), sensors, bool(duty_cycle[i] >= 0.5)))
+        return readings
@@ -6,8 +6,11 @@ try:
     from collections.abc import Hashable
 except ImportError:
     from collections import Hashable
+import concurrent.futures
 import datetime
 import functools
+import heapq
+import itertools
 import libconf
 import logging
 import random
@@ -23,8 +26,6 @@ from . import network_utils
 from . import time_utils
 from . import heating
 from . import temperature_log
-from . import telegram_bot
-from . import drawing
 
 logger = logging.getLogger('schedule')
 
@@ -56,9 +57,66 @@ class Scheduler(object):
     Objects instantiated by the :class:`Scheduler <Scheduler>` are
     factories to create jobs, keep record of scheduled jobs and
     handle their execution.
+
+    Scheduled jobs are kept in a binary heap (ordered by their next run),
+    removed jobs are only marked as such and dropped once they reach the
+    top of the heap (lazy deletion).
     """
     def __init__(self):
-        self.jobs = []
+        self._jobs = dict()                      # Maps unique ID to job (in insertion order)
+        self._queue = list()                     # Heap of [next_run, sequence number, job or None if removed]
+        self._queue_entries = dict()             # Maps unique ID to the job's current heap entry
+        self._queue_counter = itertools.count()  # Breaks ties between jobs with the same next_run
+        self._num_removed_entries = 0
+
+    @property
+    def jobs(self):
+        """List of all scheduled jobs (a copy, use add_job() and cancel_job() to modify it)."""
+        return list(self._jobs.values())
+
+    def add_job(self, job):
+        """Adds a (fully configured) job to the schedule."""
+        self._jobs[job.unique_id] = job
+        self._push_job(job)
+
+    def _push_job(self, job):
+        """(Re-)inserts the job into the queue, must be called whenever its next_run changed."""
+        self._remove_from_queue(job)
+        entry = [job.next_run, next(self._queue_counter), job]
+        self._queue_entries[job.unique_id] = entry
+        heapq.heappush(self._queue, entry)
+
+    def _remove_from_queue(self, job):
+        entry = self._queue_entries.pop(job.unique_id, None)
+        if entry is not None:
+            entry[-1] = None
+            self._num_removed_entries += 1
+            # Rebuild the heap if it consists mostly of removed entries
+            if self._num_removed_entries > 32 and self._num_removed_entries > len(self._queue) // 2:
+                self._queue = [e for e in self._queue if e[-1] is not None]
+                heapq.heapify(self._queue)
+                self._num_removed_entries = 0
+
+    def _peek_job(self):
+        """Returns the job which should run next (or None)."""
+        while self._queue and self._queue[0][-1] is None:
+            heapq.heappop(self._queue)
+            self._num_removed_entries -= 1
+        return self._queue[0][-1] if self._queue else None
+
+    def _pop_due_jobs(self, now):
+        """Removes all jobs which should run at the given time from the queue
+        and returns them in the order they should run. The caller must
+        re-insert them via _push_job() once they have been rescheduled."""
+        due = list()
+        while True:
+            job = self._peek_job()
+            if job is None or job.next_run > now:
+                break
+            heapq.heappop(self._queue)
+            del self._queue_entries[job.unique_id]
+            due.append(job)
+        return due
 
     def run_pending(self):
         """
@@ -70,8 +128,7 @@ class Scheduler(object):
         in one hour increments then your job won't be run 60 times in
         between but only once.
         """
-        runnable_jobs = (job for job in self.jobs if job.should_run)
-        for job in sorted(runnable_jobs):
+        for job in self._pop_due_jobs(time_utils.dt_now()):
             self._run_job(job)
 
     def run_all(self, delay_seconds=0):
@@ -85,8 +142,9 @@ class Scheduler(object):
         :param delay_seconds: A delay added between every executed job
         """
         logger.info('Running *all* %i jobs with %is delay inbetween',
-                    len(self.jobs), delay_seconds)
-        for job in self.jobs[:]:
+                    len(self._jobs), delay_seconds)
+        for job in self.jobs:
+            self._remove_from_queue(job)
             self._run_job(job)
             time.sleep(delay_seconds)
 
@@ -98,10 +156,9 @@ class Scheduler(object):
         :param tag: An identifier used to identify a subset of
                     jobs to delete
         """
-        if tag is None:
-            del self.jobs[:]
-        else:
-            self.jobs[:] = (job for job in self.jobs if tag not in job.tags)
+        for job in self.jobs:
+            if tag is None or tag in job.tags:
+                self.cancel_job(job)
 
     def cancel_job(self, job):
         """
@@ -109,10 +166,8 @@ class Scheduler(object):
 
         :param job: The job to be unscheduled
         """
-        try:
-            self.jobs.remove(job)
-        except ValueError:
-            pass
+        if self._jobs.pop(job.unique_id, None) is not None:
+            self._remove_from_queue(job)
 
     def every(self, interval=1):
         """
@@ -129,6 +184,8 @@ class Scheduler(object):
         ret = job.run()
         if isinstance(ret, CancelJob) or ret is CancelJob:
             self.cancel_job(job)
+        elif job.unique_id in self._jobs:
+            self._push_job(job)
 
     @property
     def next_run(self):
@@ -137,9 +194,10 @@ class Scheduler(object):
 
         :return: A :class:`~datetime.datetime` object
         """
-        if not self.jobs:
+        job = self._peek_job()
+        if job is None:
             return None
-        return min(self.jobs).next_run
+        return job.next_run
 
     # may cause an exception if next_run is None
     # @property
@@ -475,7 +533,7 @@ class Job(object):
         # Note, we always keep self.scheduler = None since HelheimrScheduler takes
         # care of which jobs should be added to the job list
         if self.scheduler is not None:
-            self.scheduler.jobs.append(self)
+            self.scheduler.add_job(self)
         return self
 
     @property
@@ -815,6 +873,7 @@ class NonSerializableNonHeatingJob(NonHeatingJob):
 
 
 def broadcast_dummy_message():#FIXME remove
+    from . import telegram_bot  # Imported on demand (python-telegram-bot is slow to load)
     is_heating, plug_states = heating.Heating.instance().query_heating_state()
     txt = telegram_bot.format_msg_heating(
         is_heating, plug_states,
@@ -885,11 +944,12 @@ def reconnect_wifi():
 
 
 def telegram_temperature_plot():
-    img_buf = drawing.plot_temperature_curves(
-        1024, 768, temperature_log.TemperatureLog.instance().recent_readings('72h'),
-        return_mem=True, xkcd=True, reverse=True, draw_marker=False,
-        name_mapping=temperature_log.TemperatureLog.instance().name_mapping,
-        simplify_curves=True)
+    if temperature_log.TemperatureLog.instance() is None:
+        broadcasting.MessageBroadcaster.instance().error(
+            'Die Temperaturaufzeichnung ist derzeit nicht verfügbar.')
+        return
+    img_buf = temperature_log.TemperatureLog.instance().plot_recent_readings(
+        '72h', 1024, 768, xkcd=True, draw_marker=False, simplify_curves=True)
     if img_buf is None:
         broadcasting.MessageBroadcaster.instance().error(
             'Fehler beim Erstellen der Temperaturverlaufsgrafik, bitte Log überprüfen.')
@@ -943,6 +1003,11 @@ class HelheimrScheduler(Scheduler):
 
         self._poll_interval = ctrl_cfg['scheduler']['idle_time']
 
+        # Due jobs are run by a bounded pool of worker threads, so slow jobs (e.g. plotting)
+        # don't block the job list. Each job runs at most once at a time.
+        self._num_workers = common.cfg_val_or_default(ctrl_cfg['scheduler'], 'num_workers', 4)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._num_workers)
+
         # Filename to load/store the scheduled jobs
         self._job_list_filename = job_list_filename
 
@@ -958,6 +1023,8 @@ class HelheimrScheduler(Scheduler):
     @property
     def idle_time(self):
         """:return: Idle time in seconds before the next (scheduled) job is to be run."""
+        # Jobs which are currently running are not queued (they will be
+        # rescheduled once they finish)
         next_time = self.next_run
         now = time_utils.dt_now()
         if next_time is not None and next_time >= now:
@@ -971,6 +1038,8 @@ class HelheimrScheduler(Scheduler):
         self._condition_var.notify()  # Wake up controller/scheduler
         self._condition_var.release()
         self._worker_thread.join()
+        # Wait for running jobs
+        self._executor.shutdown(wait=True)
         logging.getLogger().info('[HelheimrScheduler] Scheduler has been shut down.')
 
     def schedule_heating_job(
@@ -1006,7 +1075,7 @@ class HelheimrScheduler(Scheduler):
             logging.getLogger().error(
                 '[HelheimrScheduler] Error inserting new heating job: The requested periodic job "{}" overlaps with an existing one!'.format(periodic_heating_job))
         else:
-            self.jobs.append(periodic_heating_job)
+            self.add_job(periodic_heating_job)
             self._condition_var.notify()
             ret_val = True
         self._condition_var.release()
@@ -1020,18 +1089,18 @@ class HelheimrScheduler(Scheduler):
             # for job in self.jobs:
             #     logging.getLogger().info('  * {}'.format(job))
 
-            # Run all pending jobs:
+            # Dispatch all pending jobs to the worker pool (they leave the queue until
+            # they're finished, so a job never runs concurrently with itself):
             try:
-                self.run_pending()
+                for job in self._pop_due_jobs(time_utils.dt_now()):
+                    self._executor.submit(self.__run_job, job)
             except:
                 err_msg = traceback.format_exc(limit=5)
                 logging.getLogger().error(
-                    '[HelheimrScheduler] Exception occured inside run_pending():\n' + err_msg)
-                broadcasting.MessageBroadcaster.instance().error(
-                    '*Fehler* beim Ausführen einer programmierten Aufgabe:\n' + err_msg)
+                    '[HelheimrScheduler] Exception occured while dispatching pending jobs:\n' + err_msg)
 
             # Go to sleep until next job is due (unless this would take too long)
-            poll_interval = max(1, self._poll_interval if len(self.jobs) == 0 else min(self._poll_interval, self.idle_time))
+            poll_interval = max(1, self._poll_interval if len(self._jobs) == 0 else min(self._poll_interval, self.idle_time))
             logging.getLogger().debug(
                 '[HelheimrScheduler] Going to sleep for {:.1f} seconds\n'.format(poll_interval))
 
@@ -1039,6 +1108,34 @@ class HelheimrScheduler(Scheduler):
             self._condition_var.wait(timeout=poll_interval)
         self._condition_var.release()
 
+    def __run_job(self, job):
+        """Executes the job within a worker thread (without holding the lock)
+        and reschedules it afterwards."""
+        ret = None
+        try:
+            logger.info('Running job %s', job)  # TODO switch to debug
+            ret = job.job_func()
+        except:
+            err_msg = traceback.format_exc(limit=5)
+            logging.getLogger().error(
+                '[HelheimrScheduler] Exception occured while running job "{}":\n'.format(job) + err_msg)
+            broadcasting.MessageBroadcaster.instance().error(
+                '*Fehler* beim Ausführen einer programmierten Aufgabe:\n' + err_msg)
+        finally:
+            self._condition_var.acquire()
+            try:
+                job.last_run = time_utils.dt_now()
+                job._schedule_next_run()
+                if isinstance(ret, CancelJob) or ret is CancelJob:
+                    self.cancel_job(job)
+                elif job.unique_id in self._jobs:
+                    # Re-insert, unless the job has been removed meanwhile
+                    self._push_job(job)
+            finally:
+                # Next run time changed, so wake up the scheduler thread:
+                self._condition_var.notify()
+                self._condition_var.release()
+
     def deserialize_jobs(self, jobs_config):
         if jobs_config is None:
             return
@@ -1059,7 +1156,7 @@ class HelheimrScheduler(Scheduler):
                 self._condition_var.acquire()
                 try:
                     job = NonHeatingJob.from_libconf(j)
-                    self.jobs.append(job)
+                    self.add_job(job)
                 except:
                     err_msg = traceback.format_exc(limit=3)
                     logging.getLogger().error('[HelheimrScheduler] Error while loading non-heating jobs:\n' + err_msg)
@@ -1097,13 +1194,9 @@ class HelheimrScheduler(Scheduler):
     def remove_job(self, uid):
         uid = int(uid)
         self._condition_var.acquire()
-        removed_job = None
-        for j in self.jobs:
-            if j.unique_id == uid:
-                removed_job = j
-                break
+        removed_job = self._jobs.get(uid, None)
         if removed_job is not None:
-            self.jobs = [j for j in self.jobs if j.unique_id != uid]
+            self.cancel_job(removed_job)
             # Idle time might have changed, so wake up the scheduler thread:
             self._condition_var.notify()
         self._condition_var.release()
@@ -1113,7 +1206,7 @@ class HelheimrScheduler(Scheduler):
 
     def enqueue_job(self, job):
         self._condition_var.acquire()
-        self.jobs.append(job)
+        self.add_job(job)
         self._condition_var.notify()
         self._condition_var.release()
 
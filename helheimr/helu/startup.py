@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# coding=utf-8
+"""Concurrent startup of the sub-systems (heating, telegram bot, scheduler, etc.)."""
+
+import concurrent.futures
+import contextlib
+import logging
+import threading
+import traceback
+
+
+class Subsystem:
+    """A sub-system to be initialized by the StartupOrchestrator."""
+    def __init__(self, name, init_fn, depends_on, critical):
+        self.name = name
+        self.init_fn = init_fn
+        self.depends_on = list(depends_on)
+        self.critical = critical  # If a critical sub-system fails, the startup is aborted
+        self.result = None        # Return value of init_fn
+        self.error = None         # Exception raised by init_fn
+
+
+class StartupOrchestrator:
+    """Initializes the sub-systems concurrently, following their declared
+    dependencies (a sub-system starts once all sub-systems it depends on have
+    finished). If a non-critical sub-system fails, its dependents are
+    initialized nevertheless, i.e. we run with degraded capabilities. If a
+    critical one fails, we stop scheduling further sub-systems and re-raise
+    its error.
+
+    run() returns as soon as the critical sub-systems are up, the remaining
+    (non-critical) ones are initialized in the background.
+    """
+    def __init__(self, max_workers=4, profiler=None):
+        self._max_workers = max_workers
+        self._profiler = profiler  # Optional, must provide a phase(label) context manager
+        self._subsystems = dict()
+        self._finished = set()  # Names of the finished sub-systems (updated by the startup thread)
+        self._critical_error = None
+        self._critical_done = threading.Event()  # Set once all critical sub-systems finished (or one failed)
+        self._on_background_finished = None
+        self._thread = None
+
+    def add(self, name, init_fn, depends_on=None, critical=True):
+        """Registers a sub-system, init_fn will be called without parameters."""
+        if name in self._subsystems:
+            raise ValueError('Sub-system "{:s}" has already been registered'.format(name))
+        self._subsystems[name] = Subsystem(name, init_fn, [] if depends_on is None else depends_on, critical)
+
+    def result(self, name):
+        """Returns what the sub-system's init_fn returned (None if it failed)."""
+        return self._subsystems[name].result
+
+    @property
+    def failed(self):
+        """Names of the (finished) sub-systems which could not be initialized."""
+        return [s.name for s in self._subsystems.values() if s.name in self._finished and s.error is not None]
+
+    def __check_dependencies(self):
+        """Ensures that all dependencies are known and there is no cycle."""
+        for s in self._subsystems.values():
+            for dep in s.depends_on:
+                if dep not in self._subsystems:
+                    raise ValueError('Sub-system "{:s}" depends on unknown "{:s}"'.format(s.name, dep))
+        resolved = set()
+        pending = list(self._subsystems.values())
+        while pending:
+            ready = [s for s in pending if all([dep in resolved for dep in s.depends_on])]
+            if len(ready) == 0:
+                raise ValueError('Cyclic sub-system dependencies: {:s}'.format(
+                    ', '.join([s.name for s in pending])))
+            resolved.update([s.name for s in ready])
+            pending = [s for s in pending if s.name not in resolved]
+
+    def __init_subsystem(self, subsystem):
+        phase = contextlib.suppress() if self._profiler is None else self._profiler.phase(subsystem.name)
+        try:
+            with phase:
+                subsystem.result = subsystem.init_fn()
+            logging.getLogger().info('[StartupOrchestrator] Sub-system "{:s}" is ready.'.format(subsystem.name))
+        except Exception as e:
+            subsystem.error = e
+            err_msg = traceback.format_exc(limit=3)
+            if subsystem.critical:
+                logging.getLogger().error('[StartupOrchestrator] Critical sub-system "{:s}" failed:\n{:s}'.format(subsystem.name, err_msg))
+            else:
+                logging.getLogger().error('[StartupOrchestrator] Sub-system "{:s}" failed, continuing without it:\n{:s}'.format(subsystem.name, err_msg))
+        return subsystem
+
+    @property
+    def pending(self):
+        """Names of the sub-systems which are not yet initialized."""
+        return [name for name in self._subsystems if name not in self._finished]
+
+    def run(self, on_background_finished=None):
+        """Initializes the sub-systems, blocks until all critical ones (and
+        the sub-systems they depend on) are done. Afterwards, the remaining
+        ones are initialized in the background and on_background_finished
+        (optional) is called with each of them (i.e. the Subsystem, check its
+        error) once it finished."""
+        self.__check_dependencies()
+        self._on_background_finished = on_background_finished
+        self._thread = threading.Thread(target=self.__run_loop, daemon=True)
+        self._thread.start()
+        self._critical_done.wait()
+        if self._critical_error is not None:
+            self.wait()
+            raise self._critical_error
+
+    def wait(self, timeout=None):
+        """Blocks until all sub-systems have been initialized (or the timeout
+        in seconds passed), returns True if the startup is complete."""
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def __run_loop(self):
+        finished = self._finished
+        pending = list(self._subsystems.values())
+        critical = set([s.name for s in pending if s.critical])
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_workers)
+        try:
+            running = dict()
+            while pending or running:
+                if self._critical_error is None:
+                    ready = [s for s in pending if all([dep in finished for dep in s.depends_on])]
+                    for s in ready:
+                        running[executor.submit(self.__init_subsystem, s)] = s
+                        pending.remove(s)
+                elif not running:
+                    break
+
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    s = running.pop(future)
+                    finished.add(s.name)
+                    if s.error is not None and s.critical and self._critical_error is None:
+                        self._critical_error = s.error
+                    if self._critical_done.is_set() and self._on_background_finished is not None:
+                        try:
+                            self._on_background_finished(s)
+                        except:
+                            err_msg = traceback.format_exc(limit=3)
+                            logging.getLogger().error('[StartupOrchestrator] Error while reporting sub-system "{:s}":\n{:s}'.format(s.name, err_msg))
+                if self._critical_error is None and critical.issubset(finished):
+                    self._critical_done.set()
+        finally:
+            executor.shutdown(wait=False)
+            self._critical_done.set()
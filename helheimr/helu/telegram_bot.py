@@ -51,7 +51,6 @@ from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, Callb
 
 from . import common
 from . import district_heating
-from . import drawing
 from . import heating
 from . import network_utils
 from . import scheduling
@@ -1099,18 +1098,22 @@ class HelheimrBot:
                             update.message.chat_id,
                             ':bangbang: Parameterfehler: Anzahl der Messungen muss eine Ganzzahl sein!')
                         return
+        temp_log = temperature_log.TemperatureLog.instance()
+        if temp_log is None:
+            # Still starting up (or failed to start)
+            self.__safe_send(update.message.chat_id,
+                ':bangbang: Die Temperaturaufzeichnung ist derzeit nicht verfügbar.')
+            return
         if render_table:
-            msg = temperature_log.TemperatureLog.instance().format_table(num_entries)
             max_len = type(self).MESSAGE_MAX_LENGTH - 8
+            msg = temp_log.format_table(num_entries, max_length=max_len)
             if len(msg) > max_len:
                 msg = msg[:max_len]  # most recent rows are on top (!)
             self.__safe_send(update.message.chat_id, '```\n' + msg + '\n```')
 
         # Get temperature plot
-        img_buf = drawing.plot_temperature_curves(
-            1024, 768, temperature_log.TemperatureLog.instance().recent_readings(num_entries),
-            return_mem=True, xkcd=True, reverse=True, draw_marker=draw_marker,
-            name_mapping=temperature_log.TemperatureLog.instance().name_mapping)
+        img_buf = temp_log.plot_recent_readings(
+            num_entries, 1024, 768, xkcd=True, draw_marker=draw_marker)
         if img_buf is None:
             self.__safe_send(update.message.chat_id,
                 ':bangbang: Fehler beim Erstellen der Temperaturverlaufsgrafik, bitte Log überprüfen.')
@@ -2,12 +2,22 @@
 # coding=utf-8
 """Logs the temperature on a regular basis for visualization and statistics."""
 
+import datetime
+import functools
 import logging
 import math
-import scipy.stats
+import numpy as np
+import os
+import threading
+import traceback
+from collections import deque
 
 from . import common
 from . import heating
+from . import plot_cache
+from . import rendering
+from . import ringbuffer
+from . import rollups
 from . import time_utils
 from . import scheduling
 
@@ -36,9 +46,149 @@ def compute_temperature_trend(readings, time_steps=None):
         return None, None
     if time_steps is None:
         time_steps = range(len(readings))
-    # slope, intercept, r_value, p_value, std_err = scipy.stats.linregress(time_steps, readings)
-    slope, _, r_value, _, _ = scipy.stats.linregress(time_steps, readings)
-    return slope, r_value**2
+    estimator = TemperatureTrendEstimator()
+    for x, y in zip(time_steps, readings):
+        estimator.add(y, x)
+    return estimator.trend()
+
+
+class TemperatureTrendEstimator:
+    """Online least-squares line fit, i.e. slope and R^2 can be queried in O(1)
+    after each reading. We only keep the running sums n, sum(x), sum(y),
+    sum(xy), sum(x^2) and sum(y^2) - plus the readings within the window, if
+    window_size is set (i.e. fit only the most recent window_size readings).
+
+    If decimals is set, subsequent readings which are equal up to this
+    precision are skipped (sensors report unreliable 1/100th degrees).
+    """
+    def __init__(self, window_size=None, decimals=None):
+        self._window_size = window_size
+        self._decimals = decimals
+        self.reset()
+
+    def reset(self):
+        """Drops all readings (e.g. upon the start of a new heating period)."""
+        self._n = 0
+        self._sx = 0.0
+        self._sy = 0.0
+        self._sxy = 0.0
+        self._sxx = 0.0
+        self._syy = 0.0
+        self._x0 = None   # Sums are computed relative to the first reading for numerical stability
+        self._y0 = None
+        self._next_x = 0  # Default x value (index of the reading)
+        self._prev_rounded = None
+        self._num_added = 0
+        self._window = None if self._window_size is None else deque()
+
+    @property
+    def num_added(self):
+        """Number of add() calls since the last reset (including skipped readings)."""
+        return self._num_added
+
+    @property
+    def num_points(self):
+        """Number of readings the line is fitted to."""
+        return self._n
+
+    def add(self, y, x=None):
+        """Adds the reading y at x (defaults to the index of the (non-skipped) reading).
+        Invalid (None) readings and duplicates (@see decimals) are skipped.
+        Returns True if the reading has been used."""
+        self._num_added += 1
+        if y is None:
+            return False
+        if self._decimals is not None:
+            rounded = int(y * 10**self._decimals)
+            if rounded == self._prev_rounded:
+                return False
+            self._prev_rounded = rounded
+        if x is None:
+            x = self._next_x
+        self._next_x += 1
+        if self._x0 is None:
+            self._x0 = x
+            self._y0 = y
+        x -= self._x0
+        y -= self._y0
+        self.__update(x, y, 1)
+        if self._window is not None:
+            self._window.append((x, y))
+            if len(self._window) > self._window_size:
+                self.__update(*self._window.popleft(), -1)
+        return True
+
+    def __update(self, x, y, sign):
+        self._n += sign
+        self._sx += sign * x
+        self._sy += sign * y
+        self._sxy += sign * x * y
+        self._sxx += sign * x * x
+        self._syy += sign * y * y
+
+    def trend(self):
+        """Returns the tuple (slope, r_squared) or (None, None) if the line is undefined."""
+        if self._n < 2:
+            return None, None
+        ssxm = self._sxx - self._sx * self._sx / self._n
+        ssym = self._syy - self._sy * self._sy / self._n
+        ssxym = self._sxy - self._sx * self._sy / self._n
+        if ssxm <= 0.0:
+            return None, None
+        slope = ssxym / ssxm
+        # Same as scipy.stats.linregress, i.e. r = 0 for constant readings
+        if ssym <= 0.0:
+            return slope, 0.0
+        r_squared = min(1.0, ssxym * ssxym / (ssxm * ssym))
+        return slope, r_squared
+
+
+@functools.lru_cache(maxsize=1024)
+def __local_hour_to_epoch(year, month, day, hour):
+    # The local timezone offset can only change at full hours, so we cache it
+    return ringbuffer.dt2epoch(datetime.datetime(year, month, day, hour))
+
+
+def parse_log_timestamp(line):
+    """Returns the time stamp (seconds since the epoch) of the given log line. We
+    ignore the timezone abbreviation, as the log is written in local time.
+    The log uses a fixed layout (YYYY-mm-dd HH:MM:SS), so we don't need strptime."""
+    if len(line) < 19 or line[4] != '-' or line[7] != '-' or line[10] != ' ' or line[13] != ':' or line[16] != ':':
+        raise ValueError('Invalid log time stamp: "{}"'.format(line[:19]))
+    return __local_hour_to_epoch(int(line[0:4]), int(line[5:7]), int(line[8:10]), int(line[11:13])) + \
+        int(line[14:16])*60 + int(line[17:19])
+
+
+def seek_log_timestamp(f, ts):
+    """Binary search within the (binary) log file f to position the file pointer
+    at the first line logged at or after ts (seconds since the epoch)."""
+    def _line_at(offset):
+        # Returns the start and time stamp of the first line starting at or after offset
+        f.seek(max(0, offset - 1))
+        if offset > 0:
+            f.readline()
+        pos = f.tell()
+        while True:
+            line = f.readline()
+            if not line:
+                return pos, None
+            try:
+                return pos, parse_log_timestamp(line.decode('utf-8'))
+            except ValueError:
+                # Skip corrupt lines
+                pos = f.tell()
+
+    lo = 0
+    hi = f.seek(0, os.SEEK_END)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        _, line_ts = _line_at(mid)
+        if line_ts is None or line_ts >= ts:
+            hi = mid
+        else:
+            lo = mid + 1
+    pos, _ = _line_at(lo)
+    f.seek(pos)
 
 
 class TemperatureLog:
@@ -61,7 +211,6 @@ class TemperatureLog:
         """Virtually private constructor, use TemperatureLog.init_instance() instead."""
         if TemperatureLog.__instance is not None:
             raise RuntimeError("TemperatureLog is a singleton!")
-        TemperatureLog.__instance = self
 
         temp_cfg = cfg['temperature_log']
 
@@ -73,19 +222,11 @@ class TemperatureLog:
                     backupCount=int(temp_cfg['log_rotation_backup_count']))
         file_handler.setLevel(logging.INFO)
         file_handler.setFormatter(formatter)
+        self._log_file_handler = file_handler  # Needed to look up the rotated log files
 
         self._logger.addHandler(file_handler)
         self._logger.setLevel(logging.INFO)
 
-        # Compute size of circular buffer to store readings of the past 'buffer_hours' hours
-        self._polling_interval_min = temp_cfg['update_interval_minutes']
-        polling_job_label = temp_cfg['job_label']
-        buffer_hours = 72
-        self._buffer_capacity = int(math.ceil(buffer_hours*60/self._polling_interval_min))
-        self._temperature_readings = common.circularlist(self._buffer_capacity)
-        self._num_readings_per_hour = int(math.ceil(60/self._polling_interval_min))
-        self._num_readings_per_day = int(math.ceil(24*60/self._polling_interval_min))
-
         # Map internal display names of temperature sensors to their abbreviations
         self._sensor_abbreviations = dict()
         self._sensor_abbreviations2display_names = dict()
@@ -100,6 +241,38 @@ class TemperatureLog:
 
         self._table_ordering = [_sname2display[sn] for sn in cfg['raspbee']['temperature']['preferred_heating_reference']]
 
+        # Compute size of circular buffer to store readings of the past 'buffer_hours' hours
+        self._polling_interval_min = temp_cfg['update_interval_minutes']
+        polling_job_label = temp_cfg['job_label']
+        buffer_hours = common.cfg_val_or_default(temp_cfg, 'buffer_hours', 72)
+        self._buffer_hours = buffer_hours
+        self._buffer_capacity = int(math.ceil(buffer_hours*60/self._polling_interval_min))
+        self._temperature_readings = ringbuffer.TemperatureRingBuffer(
+            self._buffer_capacity, list(self._sensor_abbreviations2display_names.keys()))
+        # Guards the buffer: views of it must be copied while holding this lock, since
+        # appending overwrites the oldest reading in-place
+        self._lock = threading.Lock()
+        self._num_readings_per_hour = int(math.ceil(60/self._polling_interval_min))
+        self._num_readings_per_day = int(math.ceil(24*60/self._polling_interval_min))
+
+        # Hourly/daily rollups for long-term history, stored next to the log file
+        self._rollups = rollups.RollupStore(
+            os.path.splitext(temp_cfg['log_file'])[0] + '-rollups.npz',
+            self._temperature_readings.sensor_names,
+            24 * common.cfg_val_or_default(temp_cfg, 'rollup_hourly_days', 90),
+            common.cfg_val_or_default(temp_cfg, 'rollup_daily_days', 3*365))
+        # Rollups are restored (or rebuilt from all log files, which may take a while)
+        # in the background. Meanwhile, new readings are queued and long-term queries
+        # use the log files.
+        self._rollup_lock = threading.Lock()
+        self._rollups_ready = False
+        self._pending_rollup_readings = list()
+
+        # Rendered plots are cached until new readings arrive (@see data_version)
+        self._data_version = 0
+        self._plot_cache = plot_cache.PlotCache(
+            int(common.cfg_val_or_default(temp_cfg, 'plot_cache_mb', 4) * 1024 * 1024))
+
         # Register periodic task with scheduler
         polling_job = scheduling.NonSerializableNonHeatingJob(
             self._polling_interval_min,
@@ -114,43 +287,293 @@ class TemperatureLog:
                 str(polling_job)))
         # Load existing log file
         self.load_log(temp_cfg['log_file'])
+        self._rollup_thread = threading.Thread(target=self.__load_rollups, daemon=True)
+        self._rollup_thread.start()
+        # Publish the singleton once it's ready to be queried (sub-systems are
+        # initialized concurrently)
+        TemperatureLog.__instance = self
 
     def load_log(self, filename):
-        """Fills the internal buffer by parsing an existing log file."""
+        """Fills the internal buffer from the snapshot (if it is still valid)
+        or by parsing an existing log file."""
+        if self.__restore_snapshot(filename):
+            self._data_version += 1
+            return
+
         lines = common.tail(filename, lines=self._buffer_capacity)
         if lines is None:
             return
 
+        # Parse directly into columns (@see ringbuffer.TemperatureRingBuffer)
+        timestamps = np.zeros(len(lines), dtype=np.int64)
+        temperatures = np.full((len(self.sensor_names), len(lines)), np.nan, dtype=np.float32)
+        flags = np.zeros(len(lines), dtype=np.uint8)
+        sensor_rows = {display_name: self._temperature_readings.sensor_index(abbreviation)
+                       for display_name, abbreviation in self._sensor_abbreviations.items()}
+        num_readings = 0
         for line in lines:
-            tokens = line.split(';')
-            dt = time_utils.dt_fromstr(tokens[0])
-            temps = dict()
+            try:
+                ts = parse_log_timestamp(line)
+            except ValueError:
+                continue
+            tokens = line.rstrip().split(';')
+            # The last token holds the heating state
+            flag = ringbuffer.TemperatureRingBuffer.FLAG_HEATING if tokens[-1] == '1' else 0
+            if len(tokens) < 4:
+                # No sensor tokens, the sensors couldn't be queried
+                flag |= ringbuffer.TemperatureRingBuffer.FLAG_NO_READING
             for i in range(1, len(tokens)-1, 2):
-                display_name = tokens[i]
-                abbreviation = self._sensor_abbreviations[display_name]
+                row = sensor_rows.get(tokens[i], None)
                 t = tokens[i+1].strip()
-                if t.lower() == 'n/a':
-                    temps[abbreviation] = None
-                else:
-                    temps[abbreviation] = float(t)
-                    # t = float(tokens[i+1])
-            # The last token holds the heating state
-            hs = True if tokens[-1] == '1' else False
-            self._temperature_readings.append((dt, temps, hs))
-        logging.getLogger().info('[TemperatureLog] Loaded {:d} past temperature readings.'.format(len(lines)))
+                if row is not None and t.lower() != 'n/a':
+                    temperatures[row, num_readings] = float(t)
+            timestamps[num_readings] = ts
+            flags[num_readings] = flag
+            num_readings += 1
+        self._lock.acquire()
+        self._temperature_readings.extend(
+            timestamps[:num_readings], temperatures[:, :num_readings], flags[:num_readings])
+        self._data_version += 1
+        self._lock.release()
+        logging.getLogger().info('[TemperatureLog] Loaded {:d} past temperature readings.'.format(num_readings))
+
+    def __snapshot_filename(self):
+        return os.path.splitext(self._log_file_handler.baseFilename)[0] + '-snapshot.npz'
+
+    def save_snapshot(self):
+        """Stores the in-memory buffer along with the log file's size/mtime, so the
+        next startup can skip parsing the log (@see load_log())."""
+        filename = self.__snapshot_filename()
+        tmp_filename = filename + '.tmp'
+        try:
+            st = os.stat(self._log_file_handler.baseFilename)
+            timestamps, temperatures, flags = self.__copy_latest(None)
+            with open(tmp_filename, 'wb') as f:
+                np.savez(f, log_size=np.array([st.st_size], dtype=np.int64),
+                         log_mtime_ns=np.array([st.st_mtime_ns], dtype=np.int64),
+                         sensor_names=np.array(self.sensor_names),
+                         timestamps=timestamps, temperatures=temperatures, flags=flags)
+            os.replace(tmp_filename, filename)
+            logging.getLogger().info('[TemperatureLog] Stored snapshot of {:d} readings.'.format(timestamps.shape[0]))
+        except:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error('[TemperatureLog] Cannot store snapshot:\n' + err_msg)
+
+    def __restore_snapshot(self, log_filename):
+        """Restores the in-memory buffer from the snapshot, if it matches the log file."""
+        filename = self.__snapshot_filename()
+        if not os.path.exists(filename) or not os.path.exists(log_filename):
+            return False
+        try:
+            st = os.stat(log_filename)
+            with np.load(filename, allow_pickle=False) as data:
+                if int(data['log_size'][0]) != st.st_size or int(data['log_mtime_ns'][0]) != st.st_mtime_ns \
+                        or [str(sn) for sn in data['sensor_names']] != self.sensor_names:
+                    logging.getLogger().info('[TemperatureLog] Snapshot is outdated, parsing the log file instead.')
+                    return False
+                self._lock.acquire()
+                try:
+                    self._temperature_readings.extend(data['timestamps'], data['temperatures'], data['flags'])
+                finally:
+                    self._lock.release()
+            logging.getLogger().info('[TemperatureLog] Restored {:d} past temperature readings from snapshot.'.format(
+                len(self._temperature_readings)))
+            return True
+        except:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error('[TemperatureLog] Cannot restore snapshot:\n' + err_msg)
+            return False
+
+    def shutdown(self):
+        """Stores the snapshot and rollups, must be called after the scheduler has been shut down."""
+        self.save_snapshot()
+        self._rollup_lock.acquire()
+        try:
+            # Don't overwrite the stored rollups with a partially rebuilt one
+            if self._rollups_ready:
+                self._rollups.save()
+        finally:
+            self._rollup_lock.release()
+
+    def __load_rollups(self):
+        """Restores the rollups and adds readings which have been logged since they
+        were stored. If there are no stored rollups yet, they are computed from
+        all (rotated) log files. Runs in the background, @see log_temperature()."""
+        readings = list()
+        try:
+            if self._rollups.load():
+                last_ts = self._rollups.last_timestamp
+                self._lock.acquire()
+                try:
+                    readings = self._temperature_readings.to_readings(
+                        *self._temperature_readings.time_range(None if last_ts is None else last_ts + 1))
+                finally:
+                    self._lock.release()
+            else:
+                readings = self.query()
+            for dt, temps, hs in readings:
+                self._rollups.add(dt, temps, hs)
+        except:
+            err_msg = traceback.format_exc(limit=3)
+            logging.getLogger().error('[TemperatureLog] Cannot restore the rollups:\n' + err_msg)
+        self._rollup_lock.acquire()
+        try:
+            # Add the readings which have been logged meanwhile (the log files may
+            # already contain some of them)
+            last_ts = self._rollups.last_timestamp
+            pending = [r for r in self._pending_rollup_readings
+                       if last_ts is None or ringbuffer.dt2epoch(r[0]) > last_ts]
+            for dt, temps, hs in pending:
+                self._rollups.add(dt, temps, hs)
+            self._pending_rollup_readings = list()
+            self._rollups_ready = True
+            self._rollups.save()
+        finally:
+            self._rollup_lock.release()
+        logging.getLogger().info('[TemperatureLog] Updated rollups with {:d} readings.'.format(
+            len(readings) + len(pending)))
+
+    def __parse_line(self, line, dt=None):
+        """Returns the reading (dt, dict(abbreviation: temperature or None) or None, is_heating)
+        of the given log line."""
+        tokens = line.strip().split(';')
+        if dt is None:
+            dt = time_utils.dt_fromstr(tokens[0])
+        temps = dict()
+        for i in range(1, len(tokens)-1, 2):
+            display_name = tokens[i]
+            if display_name not in self._sensor_abbreviations:
+                # Sensor has been removed/renamed since this line was logged
+                continue
+            abbreviation = self._sensor_abbreviations[display_name]
+            t = tokens[i+1].strip()
+            if t.lower() == 'n/a':
+                temps[abbreviation] = None
+            else:
+                temps[abbreviation] = float(t)
+        # The last token holds the heating state
+        hs = True if tokens[-1] == '1' else False
+        # Lines without any sensor tokens were logged because the sensors couldn't be queried
+        return dt, temps if len(temps) > 0 else None, hs
+
+    def __log_files(self, ts_start=None):
+        """Returns the rotated log files (in chronological order, based on their
+        suffix dates) followed by the current log file.
+
+        :param ts_start: None or seconds since the epoch, to skip rotated files
+                    which have been closed before this time
+        """
+        handler = self._log_file_handler
+        base_filename = handler.baseFilename
+        dirname, basename = os.path.split(base_filename)
+        prefix = basename + '.'
+        rotated = list()
+        for fn in os.listdir(dirname):
+            if not fn.startswith(prefix):
+                continue
+            suffix = fn[len(prefix):]
+            if handler.extMatch.match(suffix) is None:
+                continue
+            try:
+                # Strip optional extensions (e.g. compressed backups)
+                suffix_dt = datetime.datetime.strptime(suffix.split('.')[0], handler.suffix)
+            except ValueError:
+                continue
+            if handler.utc:
+                suffix_dt = suffix_dt.replace(tzinfo=datetime.timezone.utc)
+            # The suffix denotes the start of the rotation interval, i.e. the file only
+            # holds readings logged before the subsequent rollover (allow an additional
+            # hour, as the rollover time is adjusted upon DST changes)
+            ts_closed = ringbuffer.dt2epoch(suffix_dt) + handler.interval + 3600
+            if ts_start is not None and ts_closed < ts_start:
+                continue
+            rotated.append((suffix_dt, os.path.join(dirname, fn)))
+        files = [fn for _, fn in sorted(rotated)]
+        if os.path.exists(base_filename):
+            files.append(base_filename)
+        return files
+
+    def query(self, start=None, end=None, sensors=None, resolution=None):
+        """Returns the logged readings within [start, end] from the current and the rotated
+        log files (in chronological order, @see recent_readings() for the reading format).
+
+        :param start, end: datetime.datetime (naive ones are assumed to be local time) or
+                    None for an open interval
+        :param sensors: None (all sensors) or list of sensor abbreviations to include
+        :param resolution: None (all readings) or datetime.timedelta, to return
+                    the average temperature per time slot of this duration
+        """
+        ts_start = None if start is None else ringbuffer.dt2epoch(start)
+        ts_end = None if end is None else ringbuffer.dt2epoch(end)
+        resolution_sec = None if resolution is None else max(1, int(resolution.total_seconds()))
+
+        readings = list()
+        slot = None  # Current time slot, if we average the readings
+        passed_end = False
+        for filename in self.__log_files(ts_start):
+            if passed_end:
+                break
+            try:
+                with open(filename, 'rb') as f:
+                    # Jump to the first requested line (i.e. EOF for files
+                    # which end before the requested time range)
+                    if ts_start is not None:
+                        seek_log_timestamp(f, ts_start)
+                    for line in f:
+                        try:
+                            line = line.decode('utf-8')
+                            ts = parse_log_timestamp(line)
+                        except ValueError:
+                            continue
+                        if ts_end is not None and ts > ts_end:
+                            passed_end = True
+                            break
+                        _, temps, hs = self.__parse_line(line, dt=ts)
+                        if temps is not None and sensors is not None:
+                            temps = {sn: t for sn, t in temps.items() if sn in sensors}
+
+                        if resolution_sec is None:
+                            readings.append((ringbuffer.epoch2dt_local(ts), temps, hs))
+                            continue
+
+                        slot_idx = ts // resolution_sec
+                        if slot is None or slot['idx'] != slot_idx:
+                            if slot is not None:
+                                readings.append(self.__average_time_slot(slot))
+                            slot = {'idx': slot_idx, 'ts': ts, 'sums': dict(), 'counts': dict(), 'heating': False}
+                        slot['heating'] = slot['heating'] or hs
+                        if temps is not None:
+                            for sn, t in temps.items():
+                                slot['sums'][sn] = slot['sums'].get(sn, 0.0) + (0.0 if t is None else t)
+                                slot['counts'][sn] = slot['counts'].get(sn, 0) + (0 if t is None else 1)
+            except OSError:
+                err_msg = traceback.format_exc(limit=3)
+                logging.getLogger().error('[TemperatureLog] Cannot read log file {:s}:\n{:s}'.format(filename, err_msg))
+        if slot is not None:
+            readings.append(self.__average_time_slot(slot))
+        return readings
+
+    def __average_time_slot(self, slot):
+        if len(slot['sums']) == 0:
+            temps = None
+        else:
+            temps = {sn: (slot['sums'][sn] / slot['counts'][sn] if slot['counts'][sn] > 0 else None)
+                     for sn in slot['sums']}
+        return (ringbuffer.epoch2dt_local(slot['ts']), temps, slot['heating'])
+
+    @property
+    def data_version(self):
+        """Increases whenever readings are added, i.e. previously rendered
+        plots are outdated."""
+        return self._data_version
 
     @property
     def name_mapping(self):
         """Returns a dictionary mapping sensor abbreviations to more descriptive display names."""
         return self._sensor_abbreviations2display_names
 
-    def recent_readings(self, num_entries=None):
-        """Returns the latest num_entries sensor readings, i.e. a
-        tuple (time_stamp_local_timezone, readings), where the
-        latter is None or a dict(abbreviation:temperature).
-        If num_entries is None, readings from the past day will
-        be returned. If num_entries is negative, all readings will
-        be returned."""
+    def __num_entries(self, num_entries):
+        """Converts the num_entries parameter of recent_readings() to the number of readings."""
         if num_entries is None:
             num_entries = self._num_readings_per_day
 
@@ -169,24 +592,126 @@ class TemperatureLog:
         if len(self._temperature_readings) == 0:
             self.log_temperature()
 
-        num_entries = min(num_entries, len(self._temperature_readings))
+        return min(num_entries, len(self._temperature_readings))
+
+    def recent_readings(self, num_entries=None, max_points=None, max_readings=None):
+        """Returns the latest num_entries sensor readings, i.e. a
+        tuple (time_stamp_local_timezone, readings), where the
+        latter is None or a dict(abbreviation:temperature).
+        If num_entries is None, readings from the past day will
+        be returned. If num_entries is negative, all readings will
+        be returned.
+        Durations (e.g. '30d') exceeding the in-memory buffer are
+        loaded at a reduced resolution: we use the coarsest rollup
+        which still yields max_points readings (e.g. the plot width
+        in pixels; defaults to the buffer capacity), or the log
+        files if the rollups are too coarse. Alternatively, pass
+        max_readings (e.g. the number of table rows) to get at most
+        this many readings covering the whole duration."""
+        if isinstance(num_entries, str):
+            duration_min = parse_duration_string(num_entries)
+            if duration_min is not None and duration_min > self._buffer_hours*60:
+                return self.__long_term_readings(duration_min, max_points, max_readings)[::-1]
+
+        columns = self.__copy_latest(self.__num_entries(num_entries))
+        return self._temperature_readings.to_readings(*columns)[::-1]
+
+    def __long_term_readings(self, duration_min, max_points, max_readings=None):
+        """Returns the readings (in chronological order) of the past duration_min minutes,
+        @see recent_readings()."""
+        if max_points is None:
+            max_points = self._buffer_capacity
+        dt_end = time_utils.dt_now_local()
+        dt_start = dt_end - datetime.timedelta(minutes=duration_min)
+        if not self._rollups_ready:
+            # Still being restored, average the log files instead
+            resolution = duration_min / (max_points if max_readings is None else max(1, max_readings - 1))
+            resolution = datetime.timedelta(minutes=max(self._polling_interval_min, math.ceil(resolution)))
+            return self.query(dt_start, dt_end, resolution=resolution)
+        if max_readings is not None:
+            # Finest rollup which fits (the first slot is usually incomplete, thus
+            # we may get an additional one), otherwise average the log files
+            for series in self._rollups.series[::-1]:
+                if duration_min * 60 / series.resolution + 1 <= max_readings:
+                    return self._rollups.to_readings(
+                        series, ringbuffer.dt2epoch(dt_start), ringbuffer.dt2epoch(dt_end))
+            resolution = datetime.timedelta(minutes=math.ceil(duration_min / max(1, max_readings - 1)))
+            return self.query(dt_start, dt_end, resolution=resolution)
+
+        for series in self._rollups.series:
+            if duration_min * 60 / series.resolution >= max_points:
+                return self._rollups.to_readings(
+                    series, ringbuffer.dt2epoch(dt_start), ringbuffer.dt2epoch(dt_end))
+        resolution = datetime.timedelta(minutes=max(self._polling_interval_min, duration_min/max_points))
+        return self.query(dt_start, dt_end, resolution=resolution)
+
+    def plot_recent_readings(self, num_entries=None, width_px=1024, height_px=768, **plot_kwargs):
+        """Plots the recent readings (@see recent_readings() and
+        drawing.plot_temperature_curves()) and returns the encoded image as
+        BytesIO (or None upon errors). Plots are rendered by the RenderService
+        worker processes and cached, so repeated requests don't re-render until
+        new readings have been logged."""
+        # Tick labels depend on the current date, too
+        key = (self._data_version, time_utils.dt_now_local().date(), num_entries,
+               width_px, height_px, tuple(sorted(plot_kwargs.items())))
+
+        def _render():
+            payload = rendering.temperature_plot_payload(
+                width_px, height_px, self.sensor_names, *self.__plot_columns(num_entries, width_px),
+                name_mapping=self.name_mapping, **plot_kwargs)
+            return rendering.RenderService.instance().render_temperature_plot(payload)
+        return self._plot_cache.get_or_render(key, _render)
+
+    def __plot_columns(self, num_entries, max_points):
+        """Returns the readings to be plotted as columns in chronological
+        order, @see recent_readings()."""
+        if isinstance(num_entries, str):
+            duration_min = parse_duration_string(num_entries)
+            if duration_min is not None and duration_min > self._buffer_hours*60:
+                return ringbuffer.readings_to_columns(
+                    self.__long_term_readings(duration_min, max_points), self.sensor_names)
+        # The payload is pickled later on (by the RenderService), so it must not
+        # refer to the buffer
+        return self.__copy_latest(self.__num_entries(num_entries))
+
+    def __copy_latest(self, num_entries):
+        """Returns copies of the latest num_entries (or all if None) columns
+        (@see recent_columns()), which are safe to use while readings are
+        logged concurrently."""
+        self._lock.acquire()
+        try:
+            return tuple([np.array(v, copy=True) for v in self._temperature_readings.latest(num_entries)])
+        finally:
+            self._lock.release()
+
+    def recent_columns(self, num_entries=None):
+        """Returns the latest num_entries sensor readings (@see recent_readings())
+        as read-only views (timestamps, temperatures, flags) in chronological
+        order, @see ringbuffer.TemperatureRingBuffer. The views may be modified
+        by subsequent appends, so copy them if you keep them around."""
+        return self._temperature_readings.latest(self.__num_entries(num_entries))
 
-        # Our circular list doesn't yet support slicing, so we do it the slow way:
-        # tr[-num_entries:]
-        ls = list()
-        for i in range(num_entries):
-            ls.append(self._temperature_readings[-1-i])
-        return ls
+    @property
+    def sensor_names(self):
+        """Sensor abbreviations in the order of the temperature matrix rows (@see recent_columns())."""
+        return self._temperature_readings.sensor_names
 
-    def format_table(self, num_entries=None):
+    def format_table(self, num_entries=None, max_length=None):
         """Returns an ASCII table showing the last
         num_entries readings (or the last hour if
         num_entries is None).
                Wohn   KZ    SZ
         -----------------------
         23:59  24.1  23.4  24.1
+
+        If max_length (number of characters) is given, long-term
+        durations are loaded at the (coarser) resolution which fits.
         """
-        readings = self.recent_readings(num_entries)
+        max_rows = None
+        if max_length is not None:
+            row_length = 7 + 6*len(self._table_ordering) + 3
+            max_rows = max(1, max_length // row_length - 2)
+        readings = self.recent_readings(num_entries, max_readings=max_rows)
         if len(readings) == 0:
             return 'Noch sind keine Temperaturaufzeichnungen verfügbar'
 
@@ -202,7 +727,8 @@ class TemperatureLog:
         msg.append('       {:s} H '.format('  '.join([_header(h) for h in self._table_ordering])))
         msg.append('-------' + '--'.join(['----' for _ in self._table_ordering]) + '---')
 
-        # Table content
+        # Table content (label daily or coarser rows by their date)
+        show_date = len(readings) > 1 and abs(readings[0][0] - readings[1][0]) >= datetime.timedelta(hours=23)
         for r in readings:
             dt_local, sensors, is_heating = r
             if sensors is None:
@@ -210,9 +736,10 @@ class TemperatureLog:
             else:
                 def _fmttemp(t):
                     return 'n/a!' if t is None else '{:4.1f}'.format(t)
-                temp_str = '  '.join([_fmttemp(sensors[k]) for k in self._table_ordering])
-            msg.append('{:02d}:{:02d}  {:s} {:s} '.format(
-                dt_local.hour, dt_local.minute, temp_str, '!' if is_heating else ' '))
+                temp_str = '  '.join([_fmttemp(sensors.get(k, None)) for k in self._table_ordering])
+            msg.append('{:02d}{:s}{:02d}  {:s} {:s} '.format(
+                dt_local.day if show_date else dt_local.hour, '.' if show_date else ':',
+                dt_local.month if show_date else dt_local.minute, temp_str, '!' if is_heating else ' '))
         return '\n'.join(msg)
 
     def log_temperature(self):
@@ -222,15 +749,27 @@ class TemperatureLog:
         dt_local = time_utils.dt_now_local()
         is_heating, _ = heating.Heating.instance().query_heating_state()
         if sensors is None:
-            self._temperature_readings.append((dt_local, None, is_heating))
+            temps = None
+        else:
+            temps = {self._sensor_abbreviations[s.display_name]: s.temperature if s.reachable else None for s in sensors}
+        self._lock.acquire()
+        self._temperature_readings.append(dt_local, temps, is_heating)
+        self._data_version += 1
+        self._lock.release()
+        # Persist the rollups whenever an hourly slot is complete
+        self._rollup_lock.acquire()
+        try:
+            if not self._rollups_ready:
+                self._pending_rollup_readings.append((dt_local, temps, is_heating))
+            elif self._rollups.add(dt_local, temps, is_heating):
+                self._rollups.save()
+        finally:
+            self._rollup_lock.release()
+
+        if sensors is None:
             self._logger.log(logging.INFO, '{:s};{:d}'.format(time_utils.format(
                 dt_local), is_heating))
         else:
-            self._temperature_readings.append((
-                dt_local,
-                {self._sensor_abbreviations[s.display_name]: s.temperature if s.reachable else None for s in sensors},
-                is_heating))
-
             def _tocsv(s):
                 if s.reachable:
                     return '{:s};{:.1f}'.format(s.display_name, s.temperature)
@@ -5,8 +5,6 @@ import logging
 import math
 import traceback
 
-from pyowm import OWM
-
 from . import common
 from . import time_utils
 
@@ -420,17 +418,23 @@ class WeatherForecastOwm:
             raise RuntimeError("WeatherForecastOwm is a singleton!")
         WeatherForecastOwm.__instance = self
 
-        self._owm = OWM(API_key=config['openweathermap']['api_token'],
-            language='de', version='2.5')
+        self._api_token = config['openweathermap']['api_token']
+        self._owm_client = None  # pyowm is imported/set up upon the first query
         self._city_id = config['openweathermap']['city_id']
         self._city_name = config['openweathermap']['city_name']
         self._latitude = config['openweathermap']['latitude']
         self._longitude = config['openweathermap']['longitude']
 
+    def __owm(self):
+        if self._owm_client is None:
+            from pyowm import OWM
+            self._owm_client = OWM(API_key=self._api_token, language='de', version='2.5')
+        return self._owm_client
+
     def report(self):
         """Return the current weather report."""
         try:
-            obs = self._owm.weather_at_coords(self._latitude, self._longitude)
+            obs = self.__owm().weather_at_coords(self._latitude, self._longitude)
             w = obs.get_weather()
             return WeatherReport(w)
         except:
@@ -441,7 +445,7 @@ class WeatherForecastOwm:
         """Return the current weather forecast."""
         try:
             # Forecast(self._owm.three_hours_forecast(self._city_name)) # city name must be a string: "city,countrycode"!
-            return Forecast(self._owm.three_hours_forecast_at_coords(self._latitude, self._longitude))
+            return Forecast(self.__owm().three_hours_forecast_at_coords(self._latitude, self._longitude))
         except:
             logging.getLogger().error('[WeatherForecastOwm] Error querying OpenWeatherMap forecast:\n' + traceback.format_exc())
             return None